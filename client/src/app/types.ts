@@ -87,6 +87,7 @@ export interface Plan extends BaseModel {
   billing_cycle: SubscriptionsBillingCycle
   billing_duration: number
   price: number
+  limits: Record<string, number>
   associated_policies: Array<LimitPolicy>
 }
 
@@ -128,15 +129,20 @@ export interface Subscription extends BaseModel {
   status: SubscriptionsStatus
   started_at: string
   ended_at: string
+  auto_renew: boolean
+  version: number
   created_by_user_id: string
 }
 
 export interface SubscriptionCreateRequest {
   plan_id: string
+  auto_renew?: boolean
 }
 
 export interface SubscriptionUpdateRequest {
   plan_id?: string
+  auto_renew?: boolean
+  version?: number
 }
 
 // Usage types
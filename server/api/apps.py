@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from .middleware import reset_rls_context_on_checkout
+        from .utils.rls_utils import check_rls_on_connect
+        from .utils.subscription_expiry import get_subscription_expiry_setting, start_expiry_scheduler
+
+        connection_created.connect(check_rls_on_connect, dispatch_uid='api_check_rls_on_connect')
+        request_started.connect(reset_rls_context_on_checkout, dispatch_uid='api_reset_rls_context_on_checkout')
+        if get_subscription_expiry_setting('SCHEDULER'):
+            request_started.connect(start_expiry_scheduler, dispatch_uid='api_start_expiry_scheduler')
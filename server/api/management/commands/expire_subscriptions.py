@@ -0,0 +1,45 @@
+"""
+Management command to expire the active subscriptions whose ended_at has passed.
+
+Meant to run from cron or a sidecar when the in-process scheduler
+(``SUBSCRIPTION_EXPIRY['SCHEDULER']``) is off. See api.utils.subscription_expiry.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils.subscription_expiry import SubscriptionExpirySweeper, get_subscription_expiry_setting
+
+
+class Command(BaseCommand):
+    help = 'Move active subscriptions past their end date to expired, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='Subscriptions expired per statement')
+        parser.add_argument('--max-chunks', type=int, help='Stop a sweep after this many chunks')
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help="Keep sweeping every SUBSCRIPTION_EXPIRY['INTERVAL'] seconds until interrupted"
+        )
+
+    def handle(self, *args, **options):
+        for name in ('chunk_size', 'max_chunks'):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be a positive integer")
+
+        sweeper = SubscriptionExpirySweeper(chunk_size=options['chunk_size'])
+        interval = get_subscription_expiry_setting('INTERVAL')
+
+        while True:
+            start = time.perf_counter()
+            stats = sweeper.sweep(max_chunks=options['max_chunks'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"Expired {stats['expired']} subscriptions in {stats['chunks']} chunks "
+                f"({elapsed:.2f}s, lag {stats['lag_seconds']:.0f}s)"
+            )
+            if not options['loop']:
+                break
+            time.sleep(interval)
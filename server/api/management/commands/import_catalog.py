@@ -0,0 +1,75 @@
+"""
+Management command to import plans and their limits from a JSON lines or CSV file.
+
+The file format and the import semantics are those of ``POST /api/plans/import/``
+(see api.utils.catalog_import): the whole file is validated first, then plans
+are upserted on their name in chunked transactions.
+"""
+
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.enums.role import Role
+from api.models import Users
+from api.utils.catalog_import import FORMATS, CatalogImportError, CatalogImporter, read_records, validate_records
+from api.utils.rls_utils import RLSContextManager
+
+
+class Command(BaseCommand):
+    help = 'Import plans and their limit policies in bulk from a JSON lines or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='File to import')
+        parser.add_argument(
+            '--created-by',
+            type=str,
+            required=True,
+            help='Email of the platform admin recorded as the creator of new rows'
+        )
+        parser.add_argument(
+            '--format',
+            type=str,
+            choices=FORMATS,
+            help='File format, guessed from the file extension when omitted'
+        )
+        parser.add_argument('--chunk-size', type=int, help='Records written per transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or self.guess_format(path)
+
+        # Run as a platform admin to get past the RLS write policies
+        with RLSContextManager(user_role=Role.PLATFORM_ADMIN.value):
+            try:
+                created_by = Users.objects.get(email=options['created_by'], role=Role.PLATFORM_ADMIN)
+            except Users.DoesNotExist:
+                raise CommandError(f"No platform admin with email {options['created_by']}")
+
+            start = time.perf_counter()
+            try:
+                with open(path, newline='', encoding='utf-8') as lines:
+                    rows = validate_records(read_records(lines, file_format))
+            except OSError as e:
+                raise CommandError(f'Cannot read {path}: {e}')
+            except CatalogImportError as e:
+                for error in e.errors:
+                    self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'])}")
+                raise CommandError(str(e))
+
+            stats = CatalogImporter(created_by=created_by, chunk_size=options['chunk_size']).run(rows)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(rows)} plans from {path} in {elapsed:.2f}s'))
+        for name, count in stats.items():
+            self.stdout.write(f'  {name}: {count}')
+
+    def guess_format(self, path):
+        extension = os.path.splitext(path)[1].lower().lstrip('.')
+        if extension in ('jsonl', 'ndjson'):
+            return 'jsonl'
+        if extension == 'csv':
+            return 'csv'
+        raise CommandError(f'Cannot guess the format of {path}, pass --format')
@@ -0,0 +1,54 @@
+"""
+Management command to renew the auto-renewing subscriptions whose billing
+period has ended.
+
+Runs are idempotent for a cutoff and can be resumed by running them again.
+See api.utils.subscription_renewal.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+
+from api.utils.subscription_renewal import SubscriptionRenewalEngine
+
+
+class Command(BaseCommand):
+    help = 'Renew auto-renewing subscriptions due at a cutoff, in chunks, optionally in several processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cutoff',
+            type=str,
+            help='Renew subscriptions that ended at or before this ISO 8601 time (default: now)'
+        )
+        parser.add_argument('--chunk-size', type=int, help='Subscriptions renewed per statement')
+        parser.add_argument('--workers', type=int, help='Processes renewing in parallel')
+        parser.add_argument('--max-chunks', type=int, help='Stop each worker after this many chunks')
+
+    def handle(self, *args, **options):
+        for name in ('chunk_size', 'workers', 'max_chunks'):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be a positive integer")
+
+        cutoff = None
+        if options['cutoff']:
+            cutoff = parse_datetime(options['cutoff'])
+            if cutoff is None:
+                raise CommandError(f"Invalid --cutoff: {options['cutoff']}")
+            if timezone.is_naive(cutoff):
+                cutoff = timezone.make_aware(cutoff)
+
+        engine = SubscriptionRenewalEngine(
+            cutoff=cutoff,
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+        )
+        stats = engine.run(max_chunks=options['max_chunks'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Renewed {stats['renewed']} subscriptions due at {engine.cutoff.isoformat()} "
+            f"in {stats['chunks']} chunks with {engine.workers} worker(s)"
+        ))
+        self.stdout.write(f"  seconds: {stats['seconds']:.2f}")
+        self.stdout.write(f"  renewals_per_second: {stats['renewals_per_second']:.0f}")
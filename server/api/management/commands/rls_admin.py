@@ -2,7 +2,7 @@ from django.core.management.base import BaseCommand
 from django.db import connection
 from api.models import Users, Tenants, UserTenants
 from api.enums.role import Role
-from api.middleware import RLSContextManager
+from api.utils.rls_utils import RLSContextManager
 import uuid
 
 
@@ -53,7 +53,7 @@ class Command(BaseCommand):
             return
         
         # Use RLS context to bypass restrictions during user creation
-        with RLSContextManager():
+        with RLSContextManager(user_role=Role.PLATFORM_ADMIN.value):
             try:
                 user = Users.objects.create(
                     email=email,
@@ -80,7 +80,7 @@ class Command(BaseCommand):
             )
             return
         
-        with RLSContextManager():
+        with RLSContextManager(user_role=Role.PLATFORM_ADMIN.value):
             try:
                 # Create or get tenant
                 tenant, created = Tenants.objects.get_or_create(name=tenant_name)
@@ -119,7 +119,7 @@ class Command(BaseCommand):
             )
             return
         
-        with RLSContextManager():
+        with RLSContextManager(user_role=Role.PLATFORM_ADMIN.value):
             try:
                 # Get tenant
                 tenant = Tenants.objects.get(name=tenant_name)
@@ -0,0 +1,127 @@
+"""
+Management command to benchmark the per-request cost of the RLS middleware.
+
+Every mode is exercised through the full Django request cycle against the
+configured database, and the latency percentiles and the number of queries
+issued per request are reported for each mode.
+"""
+
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Users
+from api.utils.bench_utils import summarize_latencies
+
+
+MODES = {
+    'legacy': {'SINGLE_STATEMENT': False, 'LAZY': False},
+    'single_statement': {'SINGLE_STATEMENT': True, 'LAZY': False},
+    'lazy': {'SINGLE_STATEMENT': True, 'LAZY': True},
+    'transaction': {'SINGLE_STATEMENT': True, 'LAZY': True, 'SCOPE': 'transaction'},
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark RLS middleware modes on an API endpoint (p50/p95/p99 latency)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            type=str,
+            required=True,
+            help='Email of the user the requests are authenticated as',
+        )
+        parser.add_argument(
+            '--path',
+            type=str,
+            default='/api/plans/',
+            help='Endpoint to request (default: /api/plans/)',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Number of timed requests per mode (default: 500)',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=20,
+            help='Number of untimed requests per mode (default: 20)',
+        )
+        parser.add_argument(
+            '--modes',
+            nargs='+',
+            choices=list(MODES),
+            default=list(MODES),
+            help='Modes to compare (default: all)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = Users.objects.get(email=options['email'])
+        except Users.DoesNotExist:
+            raise CommandError(f"User with email {options['email']} does not exist")
+
+        token = str(RefreshToken.for_user(user).access_token)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        path = options['path']
+        modes = options['modes']
+
+        samples = {mode: [] for mode in modes}
+        queries = {}
+
+        for mode in modes:
+            with self.mode(mode):
+                for _ in range(options['warmup']):
+                    self.request(client, path)
+                with CaptureQueriesContext(connection) as captured:
+                    self.request(client, path)
+                queries[mode] = len(captured.captured_queries)
+
+        # Interleave the modes so that drift affects all of them equally
+        for _ in range(options['requests']):
+            for mode in modes:
+                with self.mode(mode):
+                    start = time.perf_counter()
+                    self.request(client, path)
+                    samples[mode].append((time.perf_counter() - start) * 1000)
+
+        results = {
+            mode: {**summarize_latencies(samples[mode]), 'queries_per_request': queries[mode]}
+            for mode in modes
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps({'path': path, 'results': results}, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'RLS middleware benchmark on {path}'))
+        self.stdout.write(f"{'mode':<20}{'queries':>10}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:<20}{result['queries_per_request']:>10}"
+                f"{result['p50']:>12}{result['p95']:>12}{result['p99']:>12}"
+            )
+
+    def mode(self, mode):
+        """Return a settings override that activates the given RLS mode."""
+        return override_settings(RLS={**getattr(settings, 'RLS', {}), **MODES[mode]})
+
+    def request(self, client, path):
+        response = client.get(path)
+        if response.status_code >= 400:
+            raise CommandError(f'{path} returned HTTP {response.status_code}')
+        return response
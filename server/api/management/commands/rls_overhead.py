@@ -0,0 +1,410 @@
+"""
+Management command to measure what the RLS policies cost as the data grows.
+
+A synthetic multi-tenant dataset is seeded with set-based SQL, then the
+queries behind the plan, subscription and usage endpoints and the user
+listings are timed for each application role, once with RLS enforced and
+once with RLS bypassed. The latency percentiles and the EXPLAIN (ANALYZE,
+BUFFERS) plans are reported as JSON so that runs can be compared.
+
+RLS is enforced by running the queries as a non-owner database role, since
+the table owner bypasses the policies. The bypassed runs use the connection's
+own user, which must own the tables or have BYPASSRLS.
+"""
+
+import hashlib
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.enums.role import Role
+from api.models import Plans, Subscriptions, Usages, Users
+from api.utils.bench_utils import summarize_latencies
+from api.utils.rls_utils import build_rls_context_statement
+
+
+BENCH_PREFIX = 'rls_bench'
+BENCH_DB_ROLE = 'eshtarek_rls_bench'
+USAGE_INSERT_CHUNK = 500000
+LIMIT_POLICIES_PER_PLAN = 5
+
+SCENARIOS = ('plans', 'subscriptions', 'subscription_detail', 'usages', 'users', 'team')
+ROLES = (Role.PLATFORM_ADMIN.value, Role.TENANT_ADMIN.value, Role.TENANT_USER.value)
+
+
+def bench_uuid(*parts):
+    """Deterministic UUID of a seeded row, equal to md5('rls_bench:...')::uuid in SQL."""
+    key = ':'.join([BENCH_PREFIX, *(str(part) for part in parts)])
+    return uuid.UUID(hashlib.md5(key.encode()).hexdigest())
+
+
+SEED_STATEMENTS = [
+    # Platform admin owning the plans and limit policies
+    """
+    INSERT INTO users (id, password, is_superuser, first_name, last_name, is_staff, is_active,
+                       date_joined, email, name, role, created_at, updated_at)
+    VALUES (md5('rls_bench:admin')::uuid, '!', false, '', '', false, true,
+            now(), 'rls_bench_admin@bench.invalid', 'RLS Bench Admin', 'platform_admin', now(), now())
+    """,
+    """
+    INSERT INTO tenants (id, name, created_at, updated_at)
+    SELECT md5('rls_bench:tenant:' || t)::uuid, 'rls_bench_tenant_' || t, now(), now()
+    FROM generate_series(1, %(tenants)s) AS t
+    """,
+    # The first user of every tenant is its tenant admin
+    """
+    INSERT INTO users (id, password, is_superuser, first_name, last_name, is_staff, is_active,
+                       date_joined, email, name, role, created_at, updated_at)
+    SELECT md5('rls_bench:user:' || u)::uuid, '!', false, '', '', false, true, now(),
+           'rls_bench_user_' || u || '@bench.invalid', 'RLS Bench User ' || u,
+           CASE WHEN u <= %(tenants)s THEN 'tenant_admin' ELSE 'tenant_user' END, now(), now()
+    FROM generate_series(1, %(users)s) AS u
+    """,
+    """
+    INSERT INTO user_tenants (user_id, tenant_id, created_at, updated_at)
+    SELECT md5('rls_bench:user:' || u)::uuid,
+           md5('rls_bench:tenant:' || ((u - 1) %% %(tenants)s + 1))::uuid, now(), now()
+    FROM generate_series(1, %(users)s) AS u
+    """,
+    """
+    INSERT INTO plans (id, name, description, billing_cycle, billing_duration, price,
+                       created_at, updated_at, created_by_id)
+    SELECT md5('rls_bench:plan:' || p)::uuid, 'rls_bench_plan_' || p, NULL, 'monthly', 1, p * 10,
+           now(), now(), md5('rls_bench:admin')::uuid
+    FROM generate_series(1, %(plans)s) AS p
+    """,
+    """
+    INSERT INTO limit_policies (id, metric, "limit", created_at, updated_at, created_by_id)
+    SELECT md5('rls_bench:limit_policy:' || l)::uuid, 'rls_bench_metric_' || l, l * 100,
+           now(), now(), md5('rls_bench:admin')::uuid
+    FROM generate_series(1, %(plans)s * %(policies_per_plan)s) AS l
+    """,
+    """
+    INSERT INTO plans_limit_policies (plan_id, limit_policy_id, created_at, updated_at)
+    SELECT md5('rls_bench:plan:' || p)::uuid,
+           md5('rls_bench:limit_policy:' || ((p - 1) * %(policies_per_plan)s + l))::uuid, now(), now()
+    FROM generate_series(1, %(plans)s) AS p, generate_series(1, %(policies_per_plan)s) AS l
+    """,
+    # Each tenant subscribes to distinct plans through its tenant admin
+    """
+    INSERT INTO subscriptions (id, status, started_at, ended_at, created_at, updated_at,
+                               created_by_user_id, plan_id, tenant_id)
+    SELECT md5('rls_bench:subscription:' || t || ':' || s)::uuid,
+           CASE WHEN s = 1 THEN 'active' ELSE 'expired' END,
+           now() - s * interval '30 days', now() - (s - 1) * interval '30 days', now(), now(),
+           md5('rls_bench:user:' || t)::uuid,
+           md5('rls_bench:plan:' || ((t + s - 2) %% %(plans)s + 1))::uuid,
+           md5('rls_bench:tenant:' || t)::uuid
+    FROM generate_series(1, %(tenants)s) AS t, generate_series(1, %(subscriptions_per_tenant)s) AS s
+    """,
+]
+
+# Usages are spread round-robin over the subscriptions with one metric per round,
+# which keeps (subscription, metric) unique
+SEED_USAGES = """
+    INSERT INTO usages (id, metric, value, created_at, updated_at, subscription_id)
+    SELECT md5('rls_bench:usage:' || n)::uuid,
+           'rls_bench_metric_' || ((n - 1) / (%(tenants)s * %(subscriptions_per_tenant)s) + 1),
+           n %% 1000, now(), now(),
+           md5('rls_bench:subscription:'
+               || ((n - 1) %% %(tenants)s + 1) || ':'
+               || (((n - 1) / %(tenants)s) %% %(subscriptions_per_tenant)s + 1))::uuid
+    FROM generate_series(%(start)s, %(stop)s) AS n
+"""
+
+CLEAN_STATEMENTS = [
+    """
+    DELETE FROM usages WHERE subscription_id IN (
+        SELECT s.id FROM subscriptions s JOIN tenants t ON t.id = s.tenant_id
+        WHERE t.name LIKE 'rls\\_bench\\_%'
+    )
+    """,
+    "DELETE FROM subscriptions WHERE tenant_id IN (SELECT id FROM tenants WHERE name LIKE 'rls\\_bench\\_%')",
+    "DELETE FROM user_tenants WHERE tenant_id IN (SELECT id FROM tenants WHERE name LIKE 'rls\\_bench\\_%')",
+    "DELETE FROM plans_limit_policies WHERE plan_id IN (SELECT id FROM plans WHERE name LIKE 'rls\\_bench\\_%')",
+    "DELETE FROM plans WHERE name LIKE 'rls\\_bench\\_%'",
+    "DELETE FROM limit_policies WHERE metric LIKE 'rls\\_bench\\_%'",
+    "DELETE FROM tenants WHERE name LIKE 'rls\\_bench\\_%'",
+    "DELETE FROM users WHERE email LIKE 'rls\\_bench\\_%@bench.invalid'",
+]
+
+SEEDED_TABLES = ('users', 'tenants', 'user_tenants', 'plans', 'limit_policies',
+                 'plans_limit_policies', 'subscriptions', 'usages')
+
+
+class Command(BaseCommand):
+    help = 'Measure the overhead of the RLS policies on a seeded multi-tenant dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help='(Re)build the synthetic dataset before measuring')
+        parser.add_argument('--clean', action='store_true',
+                            help='Remove the synthetic dataset and exit')
+        parser.add_argument('--tenants', type=int, default=10000,
+                            help='Number of tenants to seed (default: 10000)')
+        parser.add_argument('--users', type=int, default=1000000,
+                            help='Number of tenant users to seed (default: 1000000)')
+        parser.add_argument('--usages', type=int, default=5000000,
+                            help='Number of usage rows to seed (default: 5000000)')
+        parser.add_argument('--plans', type=int, default=20,
+                            help='Number of plans to seed (default: 20)')
+        parser.add_argument('--subscriptions-per-tenant', type=int, default=5,
+                            help='Subscriptions per tenant, at most --plans (default: 5)')
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Timed runs per scenario, role and mode (default: 50)')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Untimed runs per scenario, role and mode (default: 5)')
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS),
+                            help='Queries to measure (default: all)')
+        parser.add_argument('--roles', nargs='+', choices=ROLES, default=list(ROLES),
+                            help='Application roles to measure (default: all)')
+        parser.add_argument('--db-role', type=str, default=BENCH_DB_ROLE,
+                            help=f'Non-owner database role the RLS runs use (default: {BENCH_DB_ROLE})')
+        parser.add_argument('--no-explain', action='store_true',
+                            help='Skip the EXPLAIN (ANALYZE, BUFFERS) plans')
+        parser.add_argument('--output', type=str,
+                            help='Write the JSON report to this file')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the JSON report instead of the summary table')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The RLS overhead benchmark requires PostgreSQL')
+
+        if options['clean']:
+            self.clean()
+            self.log(options, self.style.SUCCESS('Removed the RLS benchmark dataset'))
+            return
+
+        if options['seed']:
+            self.validate_scale(options)
+            self.seed(options)
+
+        dataset = self.describe_dataset()
+        if not dataset['tenants']:
+            raise CommandError('No RLS benchmark dataset found, run the command with --seed first')
+
+        self.prepare_db_role(options['db_role'])
+        identities = self.identities(dataset)
+
+        results = []
+        for scenario in options['scenarios']:
+            for role in options['roles']:
+                user_id = identities[role]
+                results.append(self.measure(scenario, role, user_id, dataset, options))
+
+        report = {
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'server_version': connection.pg_version,
+            'dataset': dataset,
+            'iterations': options['iterations'],
+            'results': results,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, default=str)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, default=str))
+            return
+
+        self.print_summary(report)
+
+    def log(self, options, message):
+        if not options['json']:
+            self.stdout.write(message)
+
+    def validate_scale(self, options):
+        for name in ('tenants', 'plans', 'subscriptions_per_tenant'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+        if options['users'] < 2 * options['tenants']:
+            raise CommandError('--users must be at least twice --tenants so that every tenant '
+                               'has a tenant admin and a tenant user')
+        if options['subscriptions_per_tenant'] > options['plans']:
+            raise CommandError('--subscriptions-per-tenant cannot exceed --plans')
+        if options['usages'] < 0:
+            raise CommandError('--usages cannot be negative')
+
+    def clean(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            for statement in CLEAN_STATEMENTS:
+                cursor.execute(statement)
+
+    def seed(self, options):
+        params = {
+            'tenants': options['tenants'],
+            'users': options['users'],
+            'plans': options['plans'],
+            'policies_per_plan': LIMIT_POLICIES_PER_PLAN,
+            'subscriptions_per_tenant': options['subscriptions_per_tenant'],
+        }
+
+        self.log(options, 'Removing the previous RLS benchmark dataset...')
+        self.clean()
+
+        start = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for statement in SEED_STATEMENTS:
+                cursor.execute(statement, params)
+
+            for chunk_start in range(1, options['usages'] + 1, USAGE_INSERT_CHUNK):
+                chunk_stop = min(chunk_start + USAGE_INSERT_CHUNK - 1, options['usages'])
+                cursor.execute(SEED_USAGES, {**params, 'start': chunk_start, 'stop': chunk_stop})
+                self.log(options, f'Seeded usages {chunk_stop}/{options["usages"]}')
+
+        # Fresh statistics so that the plans reflect the seeded distribution
+        with connection.cursor() as cursor:
+            for table in SEEDED_TABLES:
+                cursor.execute(f'ANALYZE {table}')
+
+        self.log(options, self.style.SUCCESS(
+            f'Seeded the RLS benchmark dataset in {time.perf_counter() - start:.1f}s'
+        ))
+
+    def describe_dataset(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT
+                    (SELECT count(*) FROM tenants WHERE name LIKE 'rls\\_bench\\_%'),
+                    (SELECT count(*) FROM users WHERE email LIKE 'rls\\_bench\\_user\\_%'),
+                    (SELECT count(*) FROM plans WHERE name LIKE 'rls\\_bench\\_%'),
+                    (SELECT count(*) FROM subscriptions s JOIN tenants t ON t.id = s.tenant_id
+                     WHERE t.name LIKE 'rls\\_bench\\_%'),
+                    (SELECT count(*) FROM usages WHERE metric LIKE 'rls\\_bench\\_%')
+                """
+            )
+            tenants, users, plans, subscriptions, usages = cursor.fetchone()
+
+        return {
+            'tenants': tenants,
+            'users': users,
+            'plans': plans,
+            'subscriptions': subscriptions,
+            'subscriptions_per_tenant': subscriptions // tenants if tenants else 0,
+            'usages': usages,
+        }
+
+    def prepare_db_role(self, db_role):
+        """Create the non-owner role the RLS runs use and grant it read access."""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_roles WHERE rolname = %s", [db_role])
+            if cursor.fetchone() is None:
+                cursor.execute(f'CREATE ROLE "{db_role}" NOLOGIN')
+            cursor.execute(f'GRANT SELECT ON {", ".join(SEEDED_TABLES)} TO "{db_role}"')
+
+            cursor.execute(
+                "SELECT rolsuper OR rolbypassrls FROM pg_roles WHERE rolname = current_user"
+            )
+            bypasses = cursor.fetchone()[0]
+            cursor.execute("SELECT pg_get_userbyid(relowner) = current_user FROM pg_class WHERE relname = 'subscriptions'")
+            owns = cursor.fetchone()[0]
+            if not (bypasses or owns):
+                self.stderr.write(self.style.WARNING(
+                    'The database user neither owns the tables nor bypasses RLS, '
+                    'so the bypassed runs are filtered by the policies too'
+                ))
+
+    def identities(self, dataset):
+        """Application users acting in each role: the admin and the users of tenant 1."""
+        return {
+            Role.PLATFORM_ADMIN.value: str(bench_uuid('admin')),
+            Role.TENANT_ADMIN.value: str(bench_uuid('user', 1)),
+            Role.TENANT_USER.value: str(bench_uuid('user', dataset['tenants'] + 1)),
+        }
+
+    def queryset(self, scenario):
+        """The query each endpoint issues for tenant 1."""
+        subscription_id = bench_uuid('subscription', 1, 1)
+        if scenario == 'plans':
+            return Plans.objects.prefetch_related('plan_limit_policies__limit_policy').all()
+        if scenario == 'subscriptions':
+            return Subscriptions.objects.all()
+        if scenario == 'subscription_detail':
+            return Subscriptions.objects.filter(pk=subscription_id)
+        if scenario == 'users':
+            return Users.objects.all()
+        if scenario == 'team':
+            return Users.objects.filter(user_tenants__tenant_id=bench_uuid('tenant', 1))
+        return Usages.objects.filter(subscription_id=subscription_id)
+
+    def run(self, queryset, user_id, user_role, db_role, explain=False):
+        """
+        Evaluate the queryset under the RLS context of the user.
+
+        With ``db_role`` set, the query runs as that role and the policies apply;
+        otherwise it runs as the connection's own user.
+        """
+        statement, params = build_rls_context_statement(user_id, user_role, is_local=True)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(statement, params)
+                if db_role:
+                    cursor.execute(f'SET LOCAL ROLE "{db_role}"')
+
+            if explain:
+                result = json.loads(queryset.explain(format='json', analyze=True, buffers=True))
+            else:
+                start = time.perf_counter()
+                rows = len(list(queryset.all()))
+                result = ((time.perf_counter() - start) * 1000, rows)
+
+            # SET LOCAL only ends with the outermost transaction
+            with connection.cursor() as cursor:
+                cursor.execute('RESET ROLE')
+
+        return result
+
+    def measure(self, scenario, role, user_id, dataset, options):
+        queryset = self.queryset(scenario)
+        modes = {'rls': options['db_role'], 'bypass': None}
+        samples = {mode: [] for mode in modes}
+        rows = {}
+
+        for _ in range(options['warmup']):
+            for db_role in modes.values():
+                self.run(queryset, user_id, role, db_role)
+
+        # Interleave the modes so that drift affects both equally
+        for _ in range(options['iterations']):
+            for mode, db_role in modes.items():
+                elapsed, rows[mode] = self.run(queryset, user_id, role, db_role)
+                samples[mode].append(elapsed)
+
+        result = {'scenario': scenario, 'role': role}
+        for mode, db_role in modes.items():
+            result[mode] = {'rows': rows.get(mode), 'latency_ms': summarize_latencies(samples[mode])}
+            if not options['no_explain']:
+                result[mode]['plan'] = self.run(queryset, user_id, role, db_role, explain=True)
+
+        rls_p50 = result['rls']['latency_ms']['p50']
+        bypass_p50 = result['bypass']['latency_ms']['p50']
+        result['overhead_p50_ms'] = (
+            round(rls_p50 - bypass_p50, 3) if rls_p50 is not None and bypass_p50 is not None else None
+        )
+        return result
+
+    def print_summary(self, report):
+        dataset = report['dataset']
+        self.stdout.write(self.style.SUCCESS(
+            f"RLS overhead on {dataset['tenants']} tenants, {dataset['users']} users, "
+            f"{dataset['subscriptions']} subscriptions, {dataset['usages']} usages"
+        ))
+        self.stdout.write(
+            f"{'scenario':<22}{'role':<16}{'rows':>8}{'rls p50':>10}{'p95':>10}{'p99':>10}"
+            f"{'bypass p50':>12}{'p95':>10}{'p99':>10}{'overhead':>12}"
+        )
+        for result in report['results']:
+            rls, bypass = result['rls']['latency_ms'], result['bypass']['latency_ms']
+            self.stdout.write(
+                f"{result['scenario']:<22}{result['role']:<16}{str(result['rls']['rows']):>8}"
+                f"{str(rls['p50']):>10}{str(rls['p95']):>10}{str(rls['p99']):>10}"
+                f"{str(bypass['p50']):>12}{str(bypass['p95']):>10}{str(bypass['p99']):>10}"
+                f"{str(result['overhead_p50_ms']):>12}"
+            )
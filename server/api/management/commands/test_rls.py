@@ -8,7 +8,7 @@ checking RLS status, and debugging RLS issues.
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
 from django.db import connection
-from server.api.utils.rls_utils import RLSUtils, debug_rls_policies, check_rls_functions
+from api.utils.rls_utils import RLSUtils, debug_rls_policies, check_rls_functions, is_transaction_scoped
 import json
 
 User = get_user_model()
@@ -205,6 +205,13 @@ class Command(BaseCommand):
         """Set RLS context."""
         self.stdout.write(self.style.SUCCESS(f'Setting RLS context...'))
         
+        if is_transaction_scoped():
+            raise CommandError(
+                "RLS['SCOPE'] is 'transaction', so a context set by this command "
+                "would be discarded as soon as it commits. Use --test-isolation "
+                "or rls_admin --action test_rls instead."
+            )
+        
         try:
             RLSUtils.set_rls_context(user_id, role)
             self.stdout.write(
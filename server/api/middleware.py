@@ -1,13 +1,127 @@
+import json
 import logging
-from django.db import connection
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
 from django.contrib.auth import get_user_model
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .utils import metrics
+from .utils.instrumentation import QueryInstrumentation, get_instrumentation_setting
+from .utils.rls_utils import (
+    RLSUtils,
+    build_rls_context_assignments,
+    build_rls_context_statement,
+    get_rls_setting,
+    is_transaction_scoped,
+)
 
 logger = logging.getLogger(__name__)
+instrumentation_logger = logging.getLogger('api.instrumentation')
+
+request_queries_counter = metrics.counter(
+    'eshtarek_request_db_queries_total',
+    'Database statements executed while serving requests, by view',
+)
+request_db_seconds_counter = metrics.counter(
+    'eshtarek_request_db_seconds_total',
+    'Time spent executing database statements while serving requests, by view',
+)
 
 User = get_user_model()
 
+class LazyRLSContext:
+    """
+    Connection execute wrapper that installs the RLS context in front of the
+    first query executed while it is active.
+    
+    ``set_config`` is transactional, so a context installed inside an atomic
+    block is lost if that block, or any block around it, rolls back. When the
+    context is installed inside a block, a no-op ``on_commit`` callback is
+    registered with it. Django drops the callbacks of a transaction or
+    savepoint when it rolls back, so a missing callback means the context is
+    gone and it is installed again in front of the next query, even when that
+    query runs in a sibling block at the same depth. A session-scoped context
+    survives the commit of its block; a transaction-scoped one does not and is
+    installed again. Errors are not swallowed: a query must never run with a
+    stale context.
+    """
+    
+    def __init__(self, user_id=None, user_role=None):
+        self.sql, self.params = build_rls_context_statement(user_id, user_role)
+        self.is_local = is_transaction_scoped()
+        self.installed = False
+        self.marker = None
+    
+    def __call__(self, execute, sql, params, many, context):
+        connection = context['connection']
+        if not self._is_installed(connection):
+            # Marked first: the statement goes through this wrapper as well
+            self._mark_installed(connection)
+            try:
+                context['cursor'].execute(self.sql, self.params)
+            except Exception:
+                self.installed = False
+                raise
+        return execute(sql, params, many, context)
+    
+    def _is_installed(self, connection):
+        """Tell whether the context installed last is still in effect on the connection."""
+        if not self.installed:
+            return False
+        if self.marker is None:
+            return True
+        return any(func is self.marker for _, func, _ in connection.run_on_commit)
+    
+    def _mark_installed(self, connection):
+        """Record the install, tied to the transaction or savepoint it happened in."""
+        self.installed = True
+        self.marker = None
+        if connection.in_atomic_block:
+            marker = self.marker = lambda: self._committed(marker)
+            connection.on_commit(marker)
+    
+    def _committed(self, marker):
+        """``on_commit`` callback: a session-scoped context outlives its transaction."""
+        if self.marker is marker:
+            if self.is_local:
+                self.installed = False
+            self.marker = None
+
+
+def reset_rls_context_on_checkout(sender, **kwargs):
+    """
+    ``request_started`` receiver that guards a reused persistent connection.
+    
+    With ``CONN_MAX_AGE`` the server connection, and the session-scoped RLS
+    variables set on it, outlive the request. Django's own ``request_started``
+    receiver has already closed the connection if it expired; when it is kept,
+    an anonymous ``LazyRLSContext`` is installed on it so that any query issued
+    before ``PostgreSQLRLSMiddleware`` runs (another middleware, a signal
+    receiver) first resets every RLS variable in one statement. The middleware
+    removes the guard before installing the request's own context, so a
+    request that reaches it pays no extra round trip.
+    """
+    if connection.connection is None or is_transaction_scoped():
+        return
+    
+    if getattr(connection, 'rls_checkout_guard', None) not in connection.execute_wrappers:
+        connection.rls_checkout_guard = LazyRLSContext()
+        connection.execute_wrappers.append(connection.rls_checkout_guard)
+
+
+def discard_checkout_guard():
+    """Remove the guard installed by ``reset_rls_context_on_checkout``, if any."""
+    guard = getattr(connection, 'rls_checkout_guard', None)
+    if guard is not None and guard in connection.execute_wrappers:
+        connection.execute_wrappers.remove(guard)
+    connection.rls_checkout_guard = None
+
+
 class PostgreSQLRLSMiddleware(MiddlewareMixin):
     """
     Middleware to enable PostgreSQL Row Level Security (RLS) by setting
@@ -19,8 +133,74 @@ class PostgreSQLRLSMiddleware(MiddlewareMixin):
     
     These variables are used by the RLS policies defined in the database
     to control access to data based on user permissions and tenant relationships.
+    
+    API requests are authenticated by DRF inside the view, so when the session
+    user is anonymous the identity is read from the JWT access token instead.
+    
+    With ``RLS['SINGLE_STATEMENT']`` enabled (the default) the reset and the
+    assignment of every variable are folded into one ``SELECT set_config(...)``
+    statement, so each request costs a single round trip instead of up to four.
+    
+    With ``RLS['LAZY']`` enabled the statement is not sent up front. A
+    ``LazyRLSContext`` execute wrapper is installed on the connection instead,
+    and it sends the statement in front of the first query of the request.
+    Requests that never query the database skip it, and the connection
+    checkout, entirely.
+    
+    With ``RLS['SCOPE']`` set to 'transaction' the request runs inside
+    ``transaction.atomic()`` and the variables are set with
+    ``set_config(..., true)``. They are discarded at COMMIT or ROLLBACK, so no
+    identity survives on the server connection once the request is done. This
+    is what makes the middleware safe behind a transaction-mode pooler. The
+    transaction scope requires the synchronous request path.
+    
+    Persistent connections (``CONN_MAX_AGE``) are safe because every request
+    resets the whole context before its first query runs, whichever the mode.
+    If the context cannot be installed the request fails closed with a 503
+    and the connection is discarded, instead of running with the identity a
+    previous request left on it.
+    
+    Under ASGI the middleware runs async (see ``__acall__``) and installs the
+    context on the connection of the request's thread-sensitive worker thread,
+    where Django runs the ORM calls of the request.
     """
     
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(self) and is_transaction_scoped():
+            raise ImproperlyConfigured(
+                "RLS['SCOPE'] = 'transaction' requires the synchronous (WSGI) request path"
+            )
+    
+    def __call__(self, request):
+        if is_transaction_scoped() and not iscoroutinefunction(self):
+            with transaction.atomic():
+                return super().__call__(request)
+        return super().__call__(request)
+    
+    async def __acall__(self, request):
+        """
+        Async request path, used when the middleware chain runs under ASGI.
+        
+        Database connections are thread-local, and Django runs every sync ORM
+        call of a request on the same thread-sensitive worker thread. The
+        context is therefore installed from that thread, with one
+        ``sync_to_async(thread_sensitive=True)`` hop; leaving the request only
+        edits the execute wrappers of that connection and stays on the event
+        loop.
+        
+        Args:
+            request: The Django HttpRequest object
+            
+        Returns:
+            The response
+        """
+        response = await sync_to_async(self.process_request, thread_sensitive=True)(request)
+        if response is None:
+            response = await self.get_response(request)
+        self._remove_lazy_context(request)
+        return response
+    
     def process_request(self, request):
         """
         Process incoming request and set PostgreSQL session variables for RLS.
@@ -31,15 +211,30 @@ class PostgreSQLRLSMiddleware(MiddlewareMixin):
         Returns:
             None if processing should continue, or HttpResponse if an error occurs
         """
+        discard_checkout_guard()
+        
         try:
+            user_id, user_role = self._resolve_identity(request)
+            
+            if get_rls_setting('LAZY'):
+                request._rls_lazy_context = LazyRLSContext(user_id, user_role)
+                request._rls_execute_wrappers = connection.execute_wrappers
+                connection.execute_wrappers.append(request._rls_lazy_context)
+                return None
+            
+            if get_rls_setting('SINGLE_STATEMENT'):
+                self._install_session_context(user_id, user_role)
+                return None
+            
             self._reset_session_variables()
             
-            if hasattr(request, 'user') and request.user.is_authenticated:
-                self._set_user_session_variables(request.user)
+            if user_id:
+                self._set_user_session_variables(user_id, user_role)
                 
         except Exception as e:
             logger.error(f"Error in PostgreSQLRLSMiddleware: {str(e)}")
-            return None
+            self._discard_connection()
+            return JsonResponse({'error': 'Service temporarily unavailable'}, status=503)
     
     def process_response(self, request, response):
         """
@@ -52,44 +247,96 @@ class PostgreSQLRLSMiddleware(MiddlewareMixin):
         Returns:
             The response object
         """
+        discard_checkout_guard()
+        self._remove_lazy_context(request)
         return response
     
+    def _remove_lazy_context(self, request):
+        """
+        Remove the request's ``LazyRLSContext`` from the connection it was
+        installed on, which is not the calling thread's under ASGI.
+        """
+        lazy_context = getattr(request, '_rls_lazy_context', None)
+        execute_wrappers = getattr(request, '_rls_execute_wrappers', None)
+        if lazy_context is not None and lazy_context in execute_wrappers:
+            execute_wrappers.remove(lazy_context)
+    
+    def _discard_connection(self):
+        """
+        Close the connection after a failed RLS reset so that it is not reused
+        with a stale context. Inside the request transaction it is discarded
+        by the rollback instead.
+        """
+        try:
+            if not connection.in_atomic_block:
+                connection.close()
+        except Exception as e:
+            logger.error(f"Error discarding connection: {str(e)}")
+    
+    def _resolve_identity(self, request):
+        """
+        Resolve the user ID and role the RLS context should be installed for.
+        
+        Args:
+            request: The Django HttpRequest object
+            
+        Returns:
+            tuple: (user_id, user_role), both None for anonymous requests.
+            The role is None when the access token does not carry it.
+        """
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return str(user.id), user.role
+        
+        header = request.META.get(jwt_settings.AUTH_HEADER_NAME, '').split()
+        if len(header) != 2 or header[0] not in jwt_settings.AUTH_HEADER_TYPES:
+            return None, None
+        
+        try:
+            token = AccessToken(header[1])
+        except TokenError:
+            return None, None
+        
+        return token.get(jwt_settings.USER_ID_CLAIM), token.get('role')
+    
+    def _install_session_context(self, user_id, user_role):
+        """
+        Reset and set every RLS session variable with a single statement.
+        
+        Args:
+            user_id (str): ID of the authenticated user, or None for anonymous requests
+            user_role (str): Role of the authenticated user, if known
+        """
+        sql, params = build_rls_context_statement(user_id, user_role)
+        
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            
+        if user_id:
+            logger.debug(f"Set RLS variables for user {user_id} with role {user_role}")
+    
     def _reset_session_variables(self):
         """
         Reset PostgreSQL session variables to ensure clean state.
         This prevents data leakage between requests.
         """
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT set_config('app.current_user_id', '', false)")
-                cursor.execute("SELECT set_config('app.current_user_role', '', false)")
-                
-        except Exception as e:
-            logger.error(f"Error resetting session variables: {str(e)}")
+        with connection.cursor() as cursor:
+            for expression, params in build_rls_context_assignments():
+                cursor.execute(f"SELECT {expression}", params)
     
-    def _set_user_session_variables(self, user):
+    def _set_user_session_variables(self, user_id, user_role):
         """
         Set PostgreSQL session variables for the authenticated user.
         
         Args:
-            user: The authenticated User instance
+            user_id (str): ID of the authenticated user
+            user_role (str): Role of the authenticated user, if known
         """
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "SELECT set_config('app.current_user_id', %s, false)",
-                    [str(user.id)]
-                )
-                
-                cursor.execute(
-                    "SELECT set_config('app.current_user_role', %s, false)",
-                    [user.role]
-                )
-                
-                logger.debug(f"Set RLS variables for user {user.id} with role {user.role}")
-                
-        except Exception as e:
-            logger.error(f"Error setting session variables for user {user.id}: {str(e)}")
+        with connection.cursor() as cursor:
+            for expression, params in build_rls_context_assignments(user_id, user_role):
+                cursor.execute(f"SELECT {expression}", params)
+            
+            logger.debug(f"Set RLS variables for user {user_id} with role {user_role}")
 
 class RLSDebugMiddleware(MiddlewareMixin):
     """
@@ -97,6 +344,12 @@ class RLSDebugMiddleware(MiddlewareMixin):
     Only use this in development environments.
     """
     
+    async def __acall__(self, request):
+        """Async request path; only hops to the worker thread when debug logging is on."""
+        if logger.isEnabledFor(logging.DEBUG):
+            await sync_to_async(self.process_request, thread_sensitive=True)(request)
+        return await self.get_response(request)
+    
     def process_request(self, request):
         """Log current RLS session variables for debugging."""
         if logger.isEnabledFor(logging.DEBUG):
@@ -119,26 +372,128 @@ class RLSConnectionMiddleware(MiddlewareMixin):
     Middleware to ensure database connection settings are appropriate for RLS.
     This middleware can be used to set additional connection-level settings
     if needed for RLS functionality.
+    
+    The catalog check that RLS is enabled runs once per physical connection
+    from the ``connection_created`` signal (see ``check_rls_on_connect``), not
+    on every request. This middleware only reports the cached result, once
+    per connection, and never queries the database itself.
+    
+    Under ASGI the connection belongs to the request's worker thread, out of
+    reach from the event loop. The async path reports the cached result once
+    per catalog check instead, which also happens once per new connection.
     """
     
+    async def __acall__(self, request):
+        """Async request path; reports the cached status without leaving the event loop."""
+        try:
+            status = RLSUtils.get_rls_status()
+            if status['checked_at'] != getattr(self, 'reported_checked_at', None):
+                self.reported_checked_at = status['checked_at']
+                if status['tables'] is not None and not status['tables'].get('users', False):
+                    logger.warning("RLS is not enabled on users table")
+        except Exception as e:
+            logger.error(f"Error in RLS connection middleware: {str(e)}")
+        
+        return await self.get_response(request)
+    
     def process_request(self, request):
         """
         Ensure database connection is properly configured for RLS.
         """
         try:
-            if connection.connection is not None:
-                with connection.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT relrowsecurity 
-                        FROM pg_class 
-                        WHERE relname = 'users' AND relnamespace = (
-                            SELECT oid FROM pg_namespace WHERE nspname = 'public'
-                        )
-                    """)
-                    result = cursor.fetchone()
-                    if result and not result[0]:
-                        logger.warning("RLS is not enabled on users table")
+            raw_connection = connection.connection
+            if raw_connection is None or getattr(connection, 'rls_status_reported_for', None) is raw_connection:
+                return None
+            
+            connection.rls_status_reported_for = raw_connection
+            status = RLSUtils.get_rls_status()
+            if status['tables'] is not None and not status['tables'].get('users', False):
+                logger.warning("RLS is not enabled on users table")
                         
         except Exception as e:
             logger.error(f"Error in RLS connection middleware: {str(e)}")
             pass
+
+
+class DatabaseInstrumentationMiddleware(MiddlewareMixin):
+    """
+    Middleware that measures the database work of every request.
+    
+    A ``QueryInstrumentation`` execute wrapper counts the statements of the
+    request, their total time and the slowest one. The middleware must come
+    before ``PostgreSQLRLSMiddleware`` so that the ``set_config`` statements
+    installing the RLS context are measured too; their time is reported
+    separately as ``rls``.
+    
+    The results are sent back in a ``Server-Timing`` header
+    (``DB_INSTRUMENTATION['SERVER_TIMING']``), written as one JSON log line on
+    the ``api.instrumentation`` logger (``DB_INSTRUMENTATION['LOG']``) and
+    added to the per-view counters of the metrics endpoint. The wrapper only
+    takes two clock readings per statement, so it can stay on in production.
+    
+    Under ASGI the wrapper is installed from the request's worker thread, on
+    the connection the ORM will use, and the report is built on the event loop.
+    """
+    
+    async def __acall__(self, request):
+        """Async request path: one hop to the worker thread to install the wrapper."""
+        await sync_to_async(self.process_request, thread_sensitive=True)(request)
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+    
+    def process_request(self, request):
+        """Start measuring the statements executed for this request."""
+        request._db_instrumentation = QueryInstrumentation()
+        request._db_execute_wrappers = connection.execute_wrappers
+        connection.execute_wrappers.append(request._db_instrumentation)
+    
+    def process_response(self, request, response):
+        """
+        Stop measuring and report the database work of the request.
+        
+        Args:
+            request: The Django HttpRequest object
+            response: The Django HttpResponse object
+            
+        Returns:
+            The response object, with the Server-Timing header added
+        """
+        instrumentation = getattr(request, '_db_instrumentation', None)
+        if instrumentation is None:
+            return response
+        
+        if instrumentation in request._db_execute_wrappers:
+            request._db_execute_wrappers.remove(instrumentation)
+        
+        try:
+            view = self._view_name(request)
+            request_queries_counter.inc(instrumentation.queries, view=view)
+            request_db_seconds_counter.inc(instrumentation.duration, view=view)
+            
+            if get_instrumentation_setting('SERVER_TIMING'):
+                timing = instrumentation.server_timing()
+                if response.has_header('Server-Timing'):
+                    timing = f"{response['Server-Timing']}, {timing}"
+                response['Server-Timing'] = timing
+            
+            if get_instrumentation_setting('LOG') and instrumentation_logger.isEnabledFor(logging.INFO):
+                instrumentation_logger.info(json.dumps({
+                    'event': 'request_db',
+                    'method': request.method,
+                    'path': request.path,
+                    'view': view,
+                    'status': response.status_code,
+                    **instrumentation.as_dict(),
+                }))
+        except Exception as e:
+            logger.error(f"Error in DatabaseInstrumentationMiddleware: {str(e)}")
+        
+        return response
+    
+    def _view_name(self, request):
+        """Name of the view that served the request, e.g. 'PlanView'."""
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unresolved'
+        view = getattr(match.func, 'view_class', match.func)
+        return getattr(view, '__name__', match.view_name)
@@ -0,0 +1,317 @@
+from django.db import migrations
+
+# Compare tenant scoped rows against the tenant IDs published by the RLS middleware in
+# app.current_tenant_ids instead of calling get_user_tenant_ids() for every row.
+# current_tenant_ids() falls back to get_user_tenant_ids() when nothing is published,
+# and the policies wrap it in a scalar subquery so it is evaluated once per query.
+class Migration(migrations.Migration):
+    dependencies = [
+        ('api', '0007_alter_limitpolicies_metric'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                -- get_user_tenant_ids only reads, so let the planner treat it as stable
+                ALTER FUNCTION get_user_tenant_ids(UUID) STABLE;
+
+                -- Tenant IDs of the current user, published once per request or resolved on demand
+                CREATE OR REPLACE FUNCTION current_tenant_ids()
+                RETURNS UUID[] AS $$
+                    SELECT CASE
+                        WHEN COALESCE(current_setting('app.current_tenant_ids', true), '') <> ''
+                            THEN current_setting('app.current_tenant_ids', true)::UUID[]
+                        ELSE get_user_tenant_ids(NULLIF(current_setting('app.current_user_id', true), '')::UUID)
+                    END
+                $$ LANGUAGE sql STABLE;
+
+                -- TENANTS table policies
+                DROP POLICY IF EXISTS tenants_select_policy ON tenants;
+                CREATE POLICY tenants_select_policy ON tenants
+                FOR SELECT
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    id = ANY((SELECT current_tenant_ids())::UUID[])
+                );
+
+                -- USER_TENANTS table policies
+                DROP POLICY IF EXISTS user_tenants_select_policy ON user_tenants;
+                CREATE POLICY user_tenants_select_policy ON user_tenants
+                FOR SELECT
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    user_id = NULLIF(current_setting('app.current_user_id', true), '')::UUID
+                    OR
+                    tenant_id = ANY((SELECT current_tenant_ids())::UUID[])
+                );
+
+                DROP POLICY IF EXISTS user_tenants_insert_policy ON user_tenants;
+                CREATE POLICY user_tenants_insert_policy ON user_tenants
+                FOR INSERT
+                WITH CHECK (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY((SELECT current_tenant_ids())::UUID[]))
+                );
+
+                DROP POLICY IF EXISTS user_tenants_update_policy ON user_tenants;
+                CREATE POLICY user_tenants_update_policy ON user_tenants
+                FOR UPDATE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY((SELECT current_tenant_ids())::UUID[]))
+                );
+
+                DROP POLICY IF EXISTS user_tenants_delete_policy ON user_tenants;
+                CREATE POLICY user_tenants_delete_policy ON user_tenants
+                FOR DELETE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY((SELECT current_tenant_ids())::UUID[]))
+                );
+
+                -- SUBSCRIPTIONS table policies
+                DROP POLICY IF EXISTS subscriptions_select_policy ON subscriptions;
+                CREATE POLICY subscriptions_select_policy ON subscriptions
+                FOR SELECT
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    tenant_id = ANY((SELECT current_tenant_ids())::UUID[])
+                );
+
+                DROP POLICY IF EXISTS subscriptions_insert_policy ON subscriptions;
+                CREATE POLICY subscriptions_insert_policy ON subscriptions
+                FOR INSERT
+                WITH CHECK (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY((SELECT current_tenant_ids())::UUID[]))
+                );
+
+                DROP POLICY IF EXISTS subscriptions_update_policy ON subscriptions;
+                CREATE POLICY subscriptions_update_policy ON subscriptions
+                FOR UPDATE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY((SELECT current_tenant_ids())::UUID[]))
+                );
+
+                DROP POLICY IF EXISTS subscriptions_delete_policy ON subscriptions;
+                CREATE POLICY subscriptions_delete_policy ON subscriptions
+                FOR DELETE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY((SELECT current_tenant_ids())::UUID[]))
+                );
+
+                -- USAGES table policies
+                -- An uncorrelated IN subquery is hashed once per query instead of running per row
+                DROP POLICY IF EXISTS usages_select_policy ON usages;
+                CREATE POLICY usages_select_policy ON usages
+                FOR SELECT
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    subscription_id IN (
+                        SELECT s.id FROM subscriptions s
+                        WHERE s.tenant_id = ANY((SELECT current_tenant_ids())::UUID[])
+                    )
+                );
+
+                DROP POLICY IF EXISTS usages_insert_policy ON usages;
+                CREATE POLICY usages_insert_policy ON usages
+                FOR INSERT
+                WITH CHECK (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    subscription_id IN (
+                        SELECT s.id FROM subscriptions s
+                        WHERE s.tenant_id = ANY((SELECT current_tenant_ids())::UUID[])
+                    )
+                );
+
+                DROP POLICY IF EXISTS usages_update_policy ON usages;
+                CREATE POLICY usages_update_policy ON usages
+                FOR UPDATE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    subscription_id IN (
+                        SELECT s.id FROM subscriptions s
+                        WHERE s.tenant_id = ANY((SELECT current_tenant_ids())::UUID[])
+                    )
+                );
+
+                DROP POLICY IF EXISTS usages_delete_policy ON usages;
+                CREATE POLICY usages_delete_policy ON usages
+                FOR DELETE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    subscription_id IN (
+                        SELECT s.id FROM subscriptions s
+                        WHERE s.tenant_id = ANY((SELECT current_tenant_ids())::UUID[])
+                    )
+                );
+            """,
+            reverse_sql="""
+                -- Restore the policies from 0002_enable_rls (with the renamed columns)
+                DROP POLICY IF EXISTS tenants_select_policy ON tenants;
+                CREATE POLICY tenants_select_policy ON tenants
+                FOR SELECT
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID))
+                );
+
+                DROP POLICY IF EXISTS user_tenants_select_policy ON user_tenants;
+                CREATE POLICY user_tenants_select_policy ON user_tenants
+                FOR SELECT
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    user_id = current_setting('app.current_user_id', true)::UUID
+                    OR
+                    tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID))
+                );
+
+                DROP POLICY IF EXISTS user_tenants_insert_policy ON user_tenants;
+                CREATE POLICY user_tenants_insert_policy ON user_tenants
+                FOR INSERT
+                WITH CHECK (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID)))
+                );
+
+                DROP POLICY IF EXISTS user_tenants_update_policy ON user_tenants;
+                CREATE POLICY user_tenants_update_policy ON user_tenants
+                FOR UPDATE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID)))
+                );
+
+                DROP POLICY IF EXISTS user_tenants_delete_policy ON user_tenants;
+                CREATE POLICY user_tenants_delete_policy ON user_tenants
+                FOR DELETE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID)))
+                );
+
+                DROP POLICY IF EXISTS subscriptions_select_policy ON subscriptions;
+                CREATE POLICY subscriptions_select_policy ON subscriptions
+                FOR SELECT
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID))
+                );
+
+                DROP POLICY IF EXISTS subscriptions_insert_policy ON subscriptions;
+                CREATE POLICY subscriptions_insert_policy ON subscriptions
+                FOR INSERT
+                WITH CHECK (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID)))
+                );
+
+                DROP POLICY IF EXISTS subscriptions_update_policy ON subscriptions;
+                CREATE POLICY subscriptions_update_policy ON subscriptions
+                FOR UPDATE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID)))
+                );
+
+                DROP POLICY IF EXISTS subscriptions_delete_policy ON subscriptions;
+                CREATE POLICY subscriptions_delete_policy ON subscriptions
+                FOR DELETE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    (current_setting('app.current_user_role', true) = 'tenant_admin'
+                     AND tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID)))
+                );
+
+                DROP POLICY IF EXISTS usages_select_policy ON usages;
+                CREATE POLICY usages_select_policy ON usages
+                FOR SELECT
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    EXISTS (
+                        SELECT 1 FROM subscriptions s
+                        WHERE s.id = subscription_id
+                        AND s.tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID))
+                    )
+                );
+
+                DROP POLICY IF EXISTS usages_insert_policy ON usages;
+                CREATE POLICY usages_insert_policy ON usages
+                FOR INSERT
+                WITH CHECK (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    EXISTS (
+                        SELECT 1 FROM subscriptions s
+                        WHERE s.id = subscription_id
+                        AND s.tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID))
+                    )
+                );
+
+                DROP POLICY IF EXISTS usages_update_policy ON usages;
+                CREATE POLICY usages_update_policy ON usages
+                FOR UPDATE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    EXISTS (
+                        SELECT 1 FROM subscriptions s
+                        WHERE s.id = subscription_id
+                        AND s.tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID))
+                    )
+                );
+
+                DROP POLICY IF EXISTS usages_delete_policy ON usages;
+                CREATE POLICY usages_delete_policy ON usages
+                FOR DELETE
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    EXISTS (
+                        SELECT 1 FROM subscriptions s
+                        WHERE s.id = subscription_id
+                        AND s.tenant_id = ANY(get_user_tenant_ids(current_setting('app.current_user_id', true)::UUID))
+                    )
+                );
+
+                DROP FUNCTION IF EXISTS current_tenant_ids();
+                ALTER FUNCTION get_user_tenant_ids(UUID) VOLATILE;
+            """
+        ),
+    ]
@@ -0,0 +1,69 @@
+from django.db import migrations, models
+
+# Rewrite users_select_policy so that listing users is driven by the users primary key.
+# The original policy ran a user_tenants self-join for every candidate user row. The new
+# policy collects the user IDs of the current user's tenants once per query, reading them
+# from the (tenant_id, user_id) index alone, and compares users.id against that array.
+class Migration(migrations.Migration):
+    dependencies = [
+        ('api', '0008_rls_current_tenant_ids'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usertenants',
+            index=models.Index(fields=['tenant', 'user'], name='tenant_user_index'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                -- IDs of the current user and of every user sharing one of its tenants
+                CREATE OR REPLACE FUNCTION current_team_user_ids()
+                RETURNS UUID[] AS $$
+                    SELECT ARRAY(
+                        SELECT ut.user_id FROM user_tenants ut
+                        WHERE ut.tenant_id = ANY((SELECT current_tenant_ids())::UUID[])
+                        UNION
+                        SELECT NULLIF(current_setting('app.current_user_id', true), '')::UUID
+                    )
+                $$ LANGUAGE sql STABLE;
+
+                -- Both arms compare users.id with a value computed once per query, so Postgres
+                -- can answer each from users_pkey and combine them with a BitmapOr. Platform
+                -- admins match every row through an open range on id, instead of a role check
+                -- that no index can answer and that would force a sequential scan for everyone.
+                DROP POLICY IF EXISTS users_select_policy ON users;
+                CREATE POLICY users_select_policy ON users
+                FOR SELECT
+                USING (
+                    id = ANY((SELECT current_team_user_ids())::UUID[])
+                    OR
+                    id >= (
+                        SELECT CASE
+                            WHEN current_setting('app.current_user_role', true) = 'platform_admin'
+                                THEN '00000000-0000-0000-0000-000000000000'::UUID
+                        END
+                    )
+                );
+            """,
+            reverse_sql="""
+                -- Restore the policy from 0002_enable_rls
+                DROP POLICY IF EXISTS users_select_policy ON users;
+                CREATE POLICY users_select_policy ON users
+                FOR SELECT
+                USING (
+                    current_setting('app.current_user_role', true) = 'platform_admin'
+                    OR
+                    id = current_setting('app.current_user_id', true)::UUID
+                    OR
+                    EXISTS (
+                        SELECT 1 FROM user_tenants ut1, user_tenants ut2
+                        WHERE ut1.user_id = current_setting('app.current_user_id', true)::UUID
+                        AND ut2.user_id = users.id
+                        AND ut1.tenant_id = ut2.tenant_id
+                    )
+                );
+
+                DROP FUNCTION IF EXISTS current_team_user_ids();
+            """
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# Version stamp of the plan catalog (plans, limit policies and their links), read by the
+# in-process catalog cache of every worker to revalidate its copy with one primary key
+# lookup. Statement level triggers bump it on every write, whichever code path issues it.
+# The trigger function runs as its owner so that roles without UPDATE on catalog_version
+# can still write to the catalog tables.
+class Migration(migrations.Migration):
+    dependencies = [
+        ('api', '0009_users_select_policy_team_ids'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE catalog_version (
+                    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                    version BIGINT NOT NULL DEFAULT 0
+                );
+                INSERT INTO catalog_version (id, version) VALUES (1, 0);
+
+                CREATE OR REPLACE FUNCTION bump_catalog_version()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+                CREATE TRIGGER plans_catalog_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON plans
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+                CREATE TRIGGER limit_policies_catalog_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON limit_policies
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+                CREATE TRIGGER plans_limit_policies_catalog_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON plans_limit_policies
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+            """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS plans_catalog_version ON plans;
+                DROP TRIGGER IF EXISTS limit_policies_catalog_version ON limit_policies;
+                DROP TRIGGER IF EXISTS plans_limit_policies_catalog_version ON plans_limit_policies;
+                DROP FUNCTION IF EXISTS bump_catalog_version();
+                DROP TABLE IF EXISTS catalog_version;
+            """
+        ),
+    ]
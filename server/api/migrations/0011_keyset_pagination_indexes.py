@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='limitpolicies',
+            index=models.Index(fields=['created_at', 'id'], name='policy_created_at_id_index'),
+        ),
+        migrations.AddIndex(
+            model_name='plans',
+            index=models.Index(fields=['created_at', 'id'], name='plan_created_at_id_index'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriptions',
+            index=models.Index(fields=['created_at', 'id'], name='sub_created_at_id_index'),
+        ),
+    ]
@@ -0,0 +1,134 @@
+from django.db import migrations, models
+
+# Snapshot of each plan's effective limits ({metric: limit}) on plans.limits, so that
+# reading them is a single-row lookup instead of a join through plans_limit_policies
+# and limit_policies. Statement level triggers with transition tables recompute the
+# snapshot of the plans touched by a write to either table, whichever code path issues
+# it. When a plan links several policies of one metric, the highest limit applies.
+#
+# refresh_plan_limits() locks the plans before recomputing them, so two transactions
+# changing the links of the same plan are serialized and the later one recomputes with
+# the earlier one's links visible. Like bump_catalog_version() it runs as its owner,
+# which lets it update plans under the RLS write policies.
+class Migration(migrations.Migration):
+    dependencies = [
+        ('api', '0011_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plans',
+            name='limits',
+            field=models.JSONField(default=dict, editable=False, help_text='Effective limit per metric of the linked limit policies, maintained by database triggers'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE plans ALTER COLUMN limits SET DEFAULT '{}'::jsonb;
+
+                CREATE OR REPLACE FUNCTION refresh_plan_limits(plan_ids UUID[])
+                RETURNS VOID AS $$
+                BEGIN
+                    PERFORM 1 FROM plans WHERE id = ANY(plan_ids) ORDER BY id FOR UPDATE;
+
+                    UPDATE plans
+                    SET limits = snapshot.limits
+                    FROM (
+                        SELECT p.id, COALESCE(
+                            (
+                                SELECT jsonb_object_agg(effective.metric, effective.max_limit)
+                                FROM (
+                                    SELECT lp.metric, MAX(lp."limit") AS max_limit
+                                    FROM plans_limit_policies plp
+                                    JOIN limit_policies lp ON lp.id = plp.limit_policy_id
+                                    WHERE plp.plan_id = p.id
+                                    GROUP BY lp.metric
+                                ) AS effective
+                            ),
+                            '{}'::jsonb
+                        ) AS limits
+                        FROM plans p
+                        WHERE p.id = ANY(plan_ids)
+                    ) AS snapshot
+                    WHERE plans.id = snapshot.id AND plans.limits IS DISTINCT FROM snapshot.limits;
+                END;
+                $$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+                CREATE OR REPLACE FUNCTION plans_limit_policies_refresh_limits()
+                RETURNS TRIGGER AS $$
+                DECLARE
+                    plan_ids UUID[] := '{}';
+                BEGIN
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        plan_ids := plan_ids || ARRAY(SELECT DISTINCT plan_id FROM new_links);
+                    END IF;
+                    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                        plan_ids := plan_ids || ARRAY(SELECT DISTINCT plan_id FROM old_links);
+                    END IF;
+                    PERFORM refresh_plan_limits(plan_ids);
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE FUNCTION limit_policies_refresh_limits()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    PERFORM refresh_plan_limits(ARRAY(
+                        SELECT DISTINCT plp.plan_id
+                        FROM new_policies
+                        JOIN old_policies ON old_policies.id = new_policies.id
+                        JOIN plans_limit_policies plp ON plp.limit_policy_id = new_policies.id
+                        WHERE (new_policies.metric, new_policies."limit")
+                              IS DISTINCT FROM (old_policies.metric, old_policies."limit")
+                    ));
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE FUNCTION plans_limit_policies_clear_limits()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    UPDATE plans SET limits = '{}'::jsonb WHERE limits <> '{}'::jsonb;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+                CREATE TRIGGER plans_limit_policies_limits_insert
+                AFTER INSERT ON plans_limit_policies
+                REFERENCING NEW TABLE AS new_links
+                FOR EACH STATEMENT EXECUTE FUNCTION plans_limit_policies_refresh_limits();
+
+                CREATE TRIGGER plans_limit_policies_limits_update
+                AFTER UPDATE ON plans_limit_policies
+                REFERENCING OLD TABLE AS old_links NEW TABLE AS new_links
+                FOR EACH STATEMENT EXECUTE FUNCTION plans_limit_policies_refresh_limits();
+
+                CREATE TRIGGER plans_limit_policies_limits_delete
+                AFTER DELETE ON plans_limit_policies
+                REFERENCING OLD TABLE AS old_links
+                FOR EACH STATEMENT EXECUTE FUNCTION plans_limit_policies_refresh_limits();
+
+                CREATE TRIGGER plans_limit_policies_limits_truncate
+                AFTER TRUNCATE ON plans_limit_policies
+                FOR EACH STATEMENT EXECUTE FUNCTION plans_limit_policies_clear_limits();
+
+                CREATE TRIGGER limit_policies_limits_update
+                AFTER UPDATE ON limit_policies
+                REFERENCING OLD TABLE AS old_policies NEW TABLE AS new_policies
+                FOR EACH STATEMENT EXECUTE FUNCTION limit_policies_refresh_limits();
+
+                SELECT refresh_plan_limits(ARRAY(SELECT id FROM plans));
+            """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS plans_limit_policies_limits_insert ON plans_limit_policies;
+                DROP TRIGGER IF EXISTS plans_limit_policies_limits_update ON plans_limit_policies;
+                DROP TRIGGER IF EXISTS plans_limit_policies_limits_delete ON plans_limit_policies;
+                DROP TRIGGER IF EXISTS plans_limit_policies_limits_truncate ON plans_limit_policies;
+                DROP TRIGGER IF EXISTS limit_policies_limits_update ON limit_policies;
+                DROP FUNCTION IF EXISTS plans_limit_policies_refresh_limits();
+                DROP FUNCTION IF EXISTS limit_policies_refresh_limits();
+                DROP FUNCTION IF EXISTS plans_limit_policies_clear_limits();
+                DROP FUNCTION IF EXISTS refresh_plan_limits(UUID[]);
+                ALTER TABLE plans ALTER COLUMN limits DROP DEFAULT;
+            """
+        ),
+    ]
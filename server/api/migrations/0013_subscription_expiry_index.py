@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 09:20
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the index without blocking writes to a large subscriptions table
+    atomic = False
+
+    dependencies = [
+        ('api', '0012_plan_limits_snapshot'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='subscriptions',
+            index=models.Index(
+                condition=models.Q(('status', 'active')),
+                fields=['ended_at'],
+                name='sub_active_ended_at_index',
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 10:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the index without blocking writes to a large subscriptions table
+    atomic = False
+
+    dependencies = [
+        ('api', '0013_subscription_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriptions',
+            name='auto_renew',
+            field=models.BooleanField(default=False),
+        ),
+        # Keep a database default so that set-based inserts (seeding, the
+        # subscribe statement) may omit the column.
+        migrations.RunSQL(
+            sql="ALTER TABLE subscriptions ALTER COLUMN auto_renew SET DEFAULT false;",
+            reverse_sql="ALTER TABLE subscriptions ALTER COLUMN auto_renew DROP DEFAULT;",
+        ),
+        AddIndexConcurrently(
+            model_name='subscriptions',
+            index=models.Index(
+                condition=models.Q(('auto_renew', True), ('status', 'active')),
+                fields=['ended_at'],
+                name='sub_renewable_ended_at_index',
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_subscription_auto_renew'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriptions',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        # Keep a database default so that set-based inserts (seeding, the
+        # subscribe statement) may omit the column.
+        migrations.RunSQL(
+            sql="ALTER TABLE subscriptions ALTER COLUMN version SET DEFAULT 1;",
+            reverse_sql="ALTER TABLE subscriptions ALTER COLUMN version DROP DEFAULT;",
+        ),
+    ]
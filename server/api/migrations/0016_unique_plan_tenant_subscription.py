@@ -0,0 +1,81 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the unique index without blocking writes to a large subscriptions
+    # table, then turn it into the constraint.
+    #
+    # The constraint it replaces was per (created_by_user, plan, tenant), so a
+    # tenant may already hold several subscriptions to one plan. Those rows
+    # have to be resolved by hand: the migration stops and names them rather
+    # than pick which subscription survives. A failed concurrent build leaves
+    # an INVALID index behind, which is dropped before the index is built again.
+    atomic = False
+
+    dependencies = [
+        ('api', '0015_subscription_version'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='subscriptions',
+                    constraint=models.UniqueConstraint(
+                        fields=('plan', 'tenant'),
+                        name='unique_plan_tenant_subscription_constraint',
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql="""
+                        DO $$
+                        DECLARE
+                            duplicates BIGINT;
+                            example TEXT;
+                        BEGIN
+                            SELECT COUNT(*), MIN(plan_id::TEXT || ', ' || tenant_id::TEXT)
+                            INTO duplicates, example
+                            FROM (
+                                SELECT plan_id, tenant_id
+                                FROM subscriptions
+                                GROUP BY plan_id, tenant_id
+                                HAVING COUNT(*) > 1
+                            ) AS duplicated;
+
+                            IF duplicates > 0 THEN
+                                RAISE EXCEPTION '% (plan_id, tenant_id) pairs have more than one subscription, e.g. (%)', duplicates, example
+                                    USING HINT = 'Keep one subscription per plan and tenant, then run the migration again.';
+                            END IF;
+                        END;
+                        $$;
+                    """,
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+                migrations.RunSQL(
+                    sql="DROP INDEX CONCURRENTLY IF EXISTS unique_plan_tenant_subscription_constraint;",
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+                migrations.RunSQL(
+                    sql="""
+                        CREATE UNIQUE INDEX CONCURRENTLY unique_plan_tenant_subscription_constraint
+                        ON subscriptions (plan_id, tenant_id);
+                    """,
+                    reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS unique_plan_tenant_subscription_constraint;",
+                ),
+                migrations.RunSQL(
+                    sql="""
+                        ALTER TABLE subscriptions ADD CONSTRAINT unique_plan_tenant_subscription_constraint
+                        UNIQUE USING INDEX unique_plan_tenant_subscription_constraint;
+                    """,
+                    reverse_sql="ALTER TABLE subscriptions DROP CONSTRAINT unique_plan_tenant_subscription_constraint;",
+                ),
+            ],
+        ),
+        # Implied by the (plan, tenant) constraint
+        migrations.RemoveConstraint(
+            model_name='subscriptions',
+            name='unique_subscription_constraint',
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:52
+
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Swap the indexes without blocking writes to a large subscriptions table;
+    # the new one is built before the old one is dropped.
+    atomic = False
+
+    dependencies = [
+        ('api', '0016_unique_plan_tenant_subscription'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='subscriptions',
+            index=models.Index(
+                condition=models.Q(('auto_renew', False), ('status', 'active')),
+                fields=['ended_at'],
+                name='sub_expirable_ended_at_index',
+            ),
+        ),
+        RemoveIndexConcurrently(
+            model_name='subscriptions',
+            name='sub_active_ended_at_index',
+        ),
+    ]
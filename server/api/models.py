@@ -64,6 +64,9 @@ class UserTenants(models.Model):
         verbose_name = 'User Tenant'
         verbose_name_plural = 'User Tenants'
         unique_together = (('user', 'tenant'),)
+        indexes = [
+            models.Index(fields=['tenant', 'user'], name='tenant_user_index')
+        ]
     
     def __str__(self):
         return 'User: {}, Tenant: {}'.format(self.user.name, self.tenant.name)
@@ -75,6 +78,11 @@ class Plans(models.Model):
     billing_cycle = models.CharField(max_length=20, choices=SubscriptionsBillingCycle.choices)
     billing_duration = models.PositiveIntegerField(help_text='Duration in months for monthly plans or years for yearly plans')
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    limits = models.JSONField(
+        default=dict,
+        editable=False,
+        help_text='Effective limit per metric of the linked limit policies, maintained by database triggers'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(Users, on_delete=models.CASCADE, related_name='created_plans')
@@ -86,6 +94,19 @@ class Plans(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['name'], name='unique_plan_name_constraint')
         ]
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='plan_created_at_id_index')
+        ]
+    
+    def save(self, *args, **kwargs):
+        # limits is only written by the database triggers; never write back a
+        # copy that may have gone stale since this instance was loaded.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'limits'
+            ]
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return 'Plan: {}, Price: {}'.format(self.name, self.price)
@@ -103,7 +124,8 @@ class LimitPolicies(models.Model):
         verbose_name = 'Limit Policy'
         verbose_name_plural = 'Limit Policies'
         indexes = [
-            models.Index(fields=['metric'], name='metric_index')
+            models.Index(fields=['metric'], name='metric_index'),
+            models.Index(fields=['created_at', 'id'], name='policy_created_at_id_index')
         ]
 
     def __str__(self):
@@ -134,6 +156,9 @@ class Subscriptions(models.Model):
     status = models.CharField(max_length=50, choices=SubscriptionsStatus.choices)
     started_at = models.DateTimeField(auto_now_add=True)
     ended_at = models.DateTimeField(blank=True, null=True)
+    auto_renew = models.BooleanField(default=False)
+    # Bumped by every write; updates compare it to the version the client read
+    version = models.PositiveIntegerField(default=1, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     created_by_user = models.ForeignKey(Users, on_delete=models.CASCADE, related_name='created_subscriptions')
@@ -145,13 +170,25 @@ class Subscriptions(models.Model):
         verbose_name = 'Subscription'
         verbose_name_plural = 'Subscriptions'
         constraints = [
-            models.UniqueConstraint(fields=['created_by_user', 'plan', 'tenant'], name='unique_subscription_constraint')
+            # One subscription per plan and tenant, whichever admin subscribed
+            models.UniqueConstraint(fields=['plan', 'tenant'], name='unique_plan_tenant_subscription_constraint')
         ]
         indexes = [
             models.Index(fields=['status'], name='status_index'),
             models.Index(fields=['created_by_user'], name='created_by_user_index'),
             models.Index(fields=['plan'], name='plan_index'),
-            models.Index(fields=['tenant'], name='tenant_index')
+            models.Index(fields=['tenant'], name='tenant_index'),
+            models.Index(fields=['created_at', 'id'], name='sub_created_at_id_index'),
+            models.Index(
+                fields=['ended_at'],
+                name='sub_expirable_ended_at_index',
+                condition=models.Q(status=SubscriptionsStatus.ACTIVE, auto_renew=False),
+            ),
+            models.Index(
+                fields=['ended_at'],
+                name='sub_renewable_ended_at_index',
+                condition=models.Q(status=SubscriptionsStatus.ACTIVE, auto_renew=True),
+            )
         ]
     
     def __str__(self):
@@ -1,4 +1,3 @@
-from datetime import timedelta
 from django.utils import timezone
 from rest_framework import serializers
 from django.core.exceptions import ValidationError
@@ -11,8 +10,11 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import make_password, check_password
-from django.db import transaction
+from django.db import connection, transaction
 from django.db import IntegrityError
+from django.db.models import F, Prefetch, prefetch_related_objects
+from .utils.sparse_fields import parse_sparse_fieldset
+from .utils.subscription_renewal import BILLING_CYCLE_LENGTHS, billing_period_sql
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -61,17 +63,39 @@ class PlanSerializer(serializers.ModelSerializer):
             'created_at', 
             'updated_at', 
             'created_by',
+            'limits',
             'policy_ids',
             'associated_policy_ids',
             'associated_policies',
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'created_by']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'created_by', 'limits']
+
+    def __init__(self, *args, **kwargs):
+        # expand_policies=False leaves out the embedded limit policies, keeping
+        # only their ids, when a subscription read does not expand plan.policies.
+        expand_policies = kwargs.pop('expand_policies', True)
+        super().__init__(*args, **kwargs)
+        if not expand_policies:
+            self.fields.pop('associated_policies')
+
+    @staticmethod
+    def get_queryset():
+        """
+        Plans with their plan-policy links and limit policies loaded in a single
+        extra query, so serializing any number of plans costs two queries.
+        """
+        return Plans.objects.prefetch_related(
+            Prefetch(
+                'plan_limit_policies',
+                queryset=PlansLimitPolicies.objects.select_related('limit_policy'),
+            )
+        )
 
     def get_associated_policy_ids(self, obj):
-        return [str(plp.limit_policy.id) for plp in obj.plan_limit_policies.all()]
+        return [str(plp.limit_policy_id) for plp in obj.plan_limit_policies.all()]
     
     def get_associated_policies(self, obj):
-        policies = [plp.limit_policy for plp in obj.plan_limit_policies.select_related('limit_policy').all()]
+        policies = [plp.limit_policy for plp in obj.plan_limit_policies.all()]
         return LimitPoliciesSerializer(policies, many=True).data
 
     def validate_billing_cycle(self, value):
@@ -99,16 +123,7 @@ class PlanSerializer(serializers.ModelSerializer):
         user_id = self.context['request'].user.id
 
         plan = Plans.objects.create(**validated_data, created_by_id=user_id)
-      
-        for policy_id in policy_ids:
-            try:
-                limit_policy = LimitPolicies.objects.get(id=policy_id)
-                try:
-                    PlansLimitPolicies.objects.create(plan=plan, limit_policy=limit_policy)
-                except IntegrityError:
-                    raise ValidationError(f"Plan limit policy association already exists for plan {plan.id} and policy {policy_id}.")
-            except LimitPolicies.DoesNotExist:
-                raise ValidationError(f"Limit policy with ID {policy_id} does not exist.")
+        self._set_policies(plan, policy_ids, current_ids=set())
         return plan
 
     @transaction.atomic  
@@ -120,20 +135,43 @@ class PlanSerializer(serializers.ModelSerializer):
         instance.save()
         
         if policy_ids is not None:
-            instance.plan_limit_policies.all().delete()
-            
-            for policy_id in policy_ids:
-                try:
-                    limit_policy = LimitPolicies.objects.get(id=policy_id)
-                    try:
-                        PlansLimitPolicies.objects.create(plan=instance, limit_policy=limit_policy)
-                    except IntegrityError:
-                        raise ValidationError(f"Plan limit policy association already exists for plan {instance.id} and policy {policy_id}.")
-                except LimitPolicies.DoesNotExist:
-                    raise ValidationError(f"Limit policy with ID {policy_id} does not exist.")
+            current_ids = {plp.limit_policy_id for plp in instance.plan_limit_policies.all()}
+            self._set_policies(instance, policy_ids, current_ids)
         
         return instance
 
+    def _set_policies(self, plan, policy_ids, current_ids):
+        """
+        Make the plan's limit policies exactly ``policy_ids``, touching only the
+        links that change: one lookup validates every id, the new links are
+        inserted with one statement and the removed ones deleted with another.
+        
+        Args:
+            plan: The plan being created or updated
+            policy_ids (list): Requested limit policy IDs, duplicates ignored
+            current_ids (set): IDs of the policies the plan is linked to now
+            
+        Raises:
+            ValidationError: Listing every ID that is not a limit policy
+        """
+        requested_ids = list(dict.fromkeys(policy_ids))
+        existing_ids = set(
+            LimitPolicies.objects.filter(id__in=requested_ids).values_list('id', flat=True)
+        )
+        missing_ids = [str(policy_id) for policy_id in requested_ids if policy_id not in existing_ids]
+        if missing_ids:
+            raise ValidationError(f"Limit policies with IDs {', '.join(missing_ids)} do not exist.")
+        
+        removed_ids = current_ids - existing_ids
+        if removed_ids:
+            plan.plan_limit_policies.filter(limit_policy_id__in=removed_ids).delete()
+        
+        PlansLimitPolicies.objects.bulk_create([
+            PlansLimitPolicies(plan=plan, limit_policy_id=policy_id)
+            for policy_id in requested_ids
+            if policy_id not in current_ids
+        ])
+
 class LimitPoliciesSerializer(serializers.ModelSerializer):
     class Meta:
         model = LimitPolicies
@@ -159,6 +197,22 @@ class LimitPoliciesSerializer(serializers.ModelSerializer):
         
         return limit_policy
 
+class CatalogImportRowSerializer(serializers.Serializer):
+    """One plan record of a catalog import file (see api.utils.catalog_import)."""
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    billing_cycle = serializers.ChoiceField(choices=SubscriptionsBillingCycle.choices)
+    billing_duration = serializers.IntegerField(min_value=1)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    limits = serializers.DictField(child=serializers.IntegerField(min_value=1), required=False)
+
+    def validate_limits(self, value):
+        max_length = LimitPolicies._meta.get_field('metric').max_length
+        for metric in value:
+            if not metric or len(metric) > max_length:
+                raise serializers.ValidationError(f"Invalid metric: '{metric}'.")
+        return value
+
 class PlanLimitPolicySerializer(serializers.ModelSerializer):
     plan = PlanSerializer(read_only=True)
     limit_policy = LimitPoliciesSerializer(read_only=True)
@@ -194,12 +248,149 @@ class PlanLimitPolicySerializer(serializers.ModelSerializer):
         except IntegrityError:
             raise serializers.ValidationError(f"Plan limit policy association already exists for plan {plan_id} and policy {policy_id}.")
         
+        # Pick up the limits snapshot the insert trigger recomputed
+        plan.refresh_from_db(fields=['limits'])
+        
         return plan_limit_policy
 
+class PlanLimitPolicyBatchSerializer(serializers.ListSerializer):
+    """
+    Attach or detach many (plan_id, policy_id) pairs at once.
+
+    Whatever the number of pairs, an attach costs two lookups and one insert,
+    and a detach one lookup and one delete, all in one transaction. Each pair
+    gets its own outcome instead of failing the batch. The pairs are matched
+    exactly, as a row value against the unnested pair arrays, and the insert
+    reports back the links it actually wrote.
+    """
+
+    LINKS_SQL = """
+        SELECT id, plan_id, limit_policy_id
+        FROM plans_limit_policies
+        WHERE (plan_id, limit_policy_id) IN (SELECT * FROM unnest(%s::UUID[], %s::UUID[]))
+    """
+
+    ATTACH_SQL = """
+        INSERT INTO plans_limit_policies (plan_id, limit_policy_id, created_at, updated_at)
+        SELECT pairs.plan_id, pairs.limit_policy_id, %s, %s
+        FROM unnest(%s::UUID[], %s::UUID[]) AS pairs (plan_id, limit_policy_id)
+        ON CONFLICT DO NOTHING
+        RETURNING plan_id, limit_policy_id
+    """
+
+    def _pairs(self):
+        """Return the requested pairs and the set of positions repeating an earlier pair."""
+        pairs = [(item['plan_id'], item['policy_id']) for item in self.validated_data]
+        seen, repeated = set(), set()
+        for index, pair in enumerate(pairs):
+            if pair in seen:
+                repeated.add(index)
+            seen.add(pair)
+        return pairs, repeated
+
+    @staticmethod
+    def _columns(pairs):
+        """Split pairs into the plan id and policy id arrays the statements unnest."""
+        return [plan_id for plan_id, _ in pairs], [policy_id for _, policy_id in pairs]
+
+    def _links(self, pairs):
+        """Existing links among the pairs, as {(plan_id, policy_id): link id}."""
+        with connection.cursor() as cursor:
+            cursor.execute(self.LINKS_SQL, self._columns(pairs))
+            return {(plan_id, policy_id): link_id for link_id, plan_id, policy_id in cursor.fetchall()}
+
+    @staticmethod
+    def _result(pair, outcome):
+        return {'plan_id': str(pair[0]), 'policy_id': str(pair[1]), 'status': outcome}
+
+    @transaction.atomic
+    def attach(self):
+        """
+        Link every pair that is not linked yet.
+
+        A pair is reported 'created' only if this request inserted its link;
+        a link that already existed, or that a concurrent request inserted
+        first, is reported 'exists'.
+        
+        Returns:
+            list: Per pair, 'created', 'exists', 'duplicate', 'plan_not_found'
+                or 'policy_not_found'
+        """
+        pairs, repeated = self._pairs()
+        plan_ids = set(Plans.objects.filter(id__in={plan_id for plan_id, _ in pairs}).values_list('id', flat=True))
+        policy_ids = set(
+            LimitPolicies.objects.filter(id__in={policy_id for _, policy_id in pairs}).values_list('id', flat=True)
+        )
+
+        wanted = [
+            pair for index, pair in enumerate(pairs)
+            if index not in repeated and pair[0] in plan_ids and pair[1] in policy_ids
+        ]
+        inserted = set()
+        if wanted:
+            now = timezone.now()
+            with connection.cursor() as cursor:
+                cursor.execute(self.ATTACH_SQL, [now, now, *self._columns(wanted)])
+                inserted = set(cursor.fetchall())
+
+        results = []
+        for index, pair in enumerate(pairs):
+            if index in repeated:
+                outcome = 'duplicate'
+            elif pair[0] not in plan_ids:
+                outcome = 'plan_not_found'
+            elif pair[1] not in policy_ids:
+                outcome = 'policy_not_found'
+            else:
+                outcome = 'created' if pair in inserted else 'exists'
+            results.append(self._result(pair, outcome))
+        return results
+
+    @transaction.atomic
+    def detach(self):
+        """
+        Unlink every pair that is linked.
+        
+        Returns:
+            list: Per pair, 'deleted', 'not_found' or 'duplicate'
+        """
+        pairs, repeated = self._pairs()
+        existing = self._links(pairs)
+
+        results = []
+        for index, pair in enumerate(pairs):
+            if index in repeated:
+                outcome = 'duplicate'
+            else:
+                outcome = 'deleted' if pair in existing else 'not_found'
+            results.append(self._result(pair, outcome))
+
+        if existing:
+            PlansLimitPolicies.objects.filter(id__in=existing.values()).delete()
+        return results
+
+
+class PlanLimitPolicyPairSerializer(serializers.Serializer):
+    """One (plan_id, policy_id) pair of a batch attach or detach."""
+    plan_id = serializers.UUIDField()
+    policy_id = serializers.UUIDField()
+
+    class Meta:
+        list_serializer_class = PlanLimitPolicyBatchSerializer
+
+class SubscriptionVersionConflict(Exception):
+    """Raised when a subscription changed since the version the client read."""
+
+    def __init__(self, pk):
+        super().__init__(f"Subscription {pk} was changed by another request; reload it and retry.")
+
+
 class SubscriptionSerializer(serializers.ModelSerializer):
     plan = PlanSerializer(read_only=True)
     tenant = TenantSerializer(read_only=True)
     plan_id = serializers.UUIDField(write_only=True)
+    # Output: the current version. Input to an update: the version it applies to.
+    version = serializers.IntegerField(required=False, min_value=1)
 
     class Meta:
         model = Subscriptions
@@ -213,6 +404,8 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             'created_at', 
             'updated_at', 
             'created_by_user_id',
+            'auto_renew',
+            'version',
             'plan_id'
         ]
         read_only_fields = [
@@ -226,50 +419,229 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             'tenant',
         ]
 
+    expandable_fields = ['plan', 'tenant', 'plan.policies']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        # Reads and the response to an update are shaped by the parameters
+        if request is not None and (request.method == 'GET' or self.instance is not None):
+            self._apply_sparse_fieldset(request)
+
+    @classmethod
+    def get_sparse_fieldset(cls, request):
+        """
+        Read the ``?fields=`` and ``?expand=`` parameters of a request.
+        
+        Returns:
+            tuple: The selected fields, or None for all, and the expanded relations
+        
+        Raises:
+            ValidationError: If a parameter names an unknown field or relation
+        """
+        readable = [name for name, field in cls().fields.items() if not field.write_only]
+        return parse_sparse_fieldset(request, readable, cls.expandable_fields)
+
+    @classmethod
+    def get_queryset(cls, request=None):
+        """
+        Subscriptions with the relations the response embeds loaded up front,
+        so that serializing any number of subscriptions costs a fixed number of
+        queries: the plan and tenant are joined, and the plans' policy links
+        (with their policies when ``plan.policies`` is expanded) prefetched in
+        one extra query.
+        
+        Args:
+            request (optional): Request whose ``?fields=`` and ``?expand=`` shape
+                the response; every relation is loaded without it
+        """
+        selected, expand = cls.get_sparse_fieldset(request) if request is not None else (None, set(cls.expandable_fields))
+        if selected is not None:
+            expand = {path for path in expand if path.split('.')[0] in selected}
+
+        queryset = Subscriptions.objects.all()
+        if 'tenant' in expand:
+            queryset = queryset.select_related('tenant')
+        if 'plan' in expand:
+            links = PlansLimitPolicies.objects.all()
+            if 'plan.policies' in expand:
+                links = links.select_related('limit_policy')
+            queryset = queryset.select_related('plan').prefetch_related(
+                Prefetch('plan__plan_limit_policies', queryset=links)
+            )
+        return queryset
+
+    def _apply_sparse_fieldset(self, request):
+        """
+        Shape the output after ``?fields=`` and ``?expand=``: drop the fields
+        that were not selected and render unexpanded relations as their ids,
+        so that neither is serialized nor fetched.
+        
+        Raises:
+            ValidationError: If a parameter names an unknown field or relation
+        """
+        readable = [name for name, field in self.fields.items() if not field.write_only]
+        selected, expand = self.get_sparse_fieldset(request)
+
+        if selected is not None:
+            for name in readable:
+                if name not in selected:
+                    self.fields.pop(name)
+
+        if 'plan' in self.fields and 'plan' not in expand:
+            self.fields['plan'] = serializers.PrimaryKeyRelatedField(read_only=True)
+        elif 'plan' in self.fields and 'plan.policies' not in expand:
+            self.fields['plan'] = PlanSerializer(read_only=True, expand_policies=False)
+        if 'tenant' in self.fields and 'tenant' not in expand:
+            self.fields['tenant'] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    @staticmethod
+    def compare_and_swap(pk, expected_version=None, **changes):
+        """
+        Write the given fields of a subscription and bump its version, in one
+        UPDATE that only matches while the version is still the one the client
+        read. No row lock is taken and the other columns are left as they are.
+        
+        Args:
+            pk: ID of the subscription
+            expected_version (int, optional): Version the change was made
+                against; without it the change applies to any version
+            **changes: Field values to write
+        
+        Raises:
+            Subscriptions.DoesNotExist: If the subscription is not visible
+            SubscriptionVersionConflict: If its version is no longer expected_version
+        """
+        subscriptions = Subscriptions.objects.filter(pk=pk)
+        if expected_version is not None:
+            subscriptions = subscriptions.filter(version=expected_version)
+
+        if not subscriptions.update(**changes, version=F('version') + 1, updated_at=timezone.now()):
+            if expected_version is not None and Subscriptions.objects.filter(pk=pk).exists():
+                raise SubscriptionVersionConflict(pk)
+            raise Subscriptions.DoesNotExist(f"Subscription {pk} does not exist.")
+
+    @classmethod
+    def apply_update(cls, pk, validated_data, request=None):
+        """
+        Apply a validated partial update to a subscription without reading it
+        first: the fields are written with ``compare_and_swap`` and the row is
+        then read once, with the relations the response needs.
+        
+        Args:
+            pk: ID of the subscription
+            validated_data (dict): Validated fields, with the optional version
+                the update was made against
+            request (optional): PUT whose ``?fields=`` and ``?expand=`` shape the response
+        
+        Returns:
+            Subscriptions: The updated subscription
+        
+        Raises:
+            Subscriptions.DoesNotExist: If the subscription is not visible
+            SubscriptionVersionConflict: If its version is no longer the one sent
+        """
+        changes = dict(validated_data)
+        expected_version = changes.pop('version', None)
+        if changes:
+            cls.compare_and_swap(pk, expected_version, **changes)
+
+        subscription = cls.get_queryset(request).get(pk=pk)
+        if not changes and expected_version is not None and expected_version != subscription.version:
+            raise SubscriptionVersionConflict(pk)
+        return subscription
+
     def validate_status(self, value):
         valid_choices = [choice[0] for choice in SubscriptionsStatus.choices]
         if value not in valid_choices:
             raise ValidationError(f"Invalid status: {value}. Must be one of {valid_choices}.")
         return value
     
-    @transaction.atomic
+    # Reads the plan and inserts the subscription in one statement. The plan
+    # row comes back with the new subscription's id, which is NULL when the
+    # tenant already has a subscription to the plan (or the plan's billing
+    # cycle is unknown); no row comes back when the plan does not exist.
+    SUBSCRIBE_SQL = """
+        WITH plan AS (
+            SELECT * FROM plans WHERE id = %(plan_id)s::UUID
+        ), inserted AS (
+            INSERT INTO subscriptions
+                (id, status, started_at, ended_at, auto_renew, created_at, updated_at, created_by_user_id, plan_id, tenant_id)
+            SELECT %(id)s::UUID, %(status)s, %(now)s, %(now)s + {period}, %(auto_renew)s, %(now)s, %(now)s,
+                %(user_id)s::UUID, plan.id, %(tenant_id)s::UUID
+            FROM plan
+            WHERE plan.billing_cycle IN %(billing_cycles)s
+            ON CONFLICT ON CONSTRAINT unique_plan_tenant_subscription_constraint DO NOTHING
+            RETURNING id, ended_at
+        )
+        SELECT plan.*, inserted.id AS subscription_id, inserted.ended_at AS subscription_ended_at
+        FROM plan LEFT JOIN inserted ON true
+    """.format(period=billing_period_sql('plan.billing_cycle', 'plan.billing_duration'))
+
+    def get_tenant_id(self):
+        """
+        Tenant the requesting user subscribes, read from the ``tenant_ids``
+        claim of the access token. Tokens issued without the claim fall back to
+        the user's memberships.
+        
+        Raises:
+            ValidationError: If the user does not belong to exactly one tenant
+        """
+        request = self.context['request']
+        tenant_ids = request.auth.get('tenant_ids') if request.auth is not None else None
+        if tenant_ids is None:
+            tenant_ids = [
+                str(tenant_id) for tenant_id in
+                UserTenants.objects.filter(user_id=request.user.id).values_list('tenant_id', flat=True)
+            ]
+        if len(tenant_ids) != 1:
+            raise serializers.ValidationError("Subscriptions can only be created by a member of a single tenant.")
+        return tenant_ids[0]
+
     def create(self, validated_data):
         if not self.context['request'].user.is_authenticated:
             raise serializers.ValidationError("Authentication required")
         
         plan_id = validated_data.pop('plan_id')
         user_id = self.context['request'].user.id
-        tenant_id = UserTenants.objects.get(user_id=user_id).tenant.id
+        tenant_id = self.get_tenant_id()
 
-        try:
-            plan = Plans.objects.get(id=plan_id)
-            tenant = Tenants.objects.get(id=tenant_id)
-        except Plans.DoesNotExist:
-            raise serializers.ValidationError(f"Plan with ID {plan_id} does not exist.")
-        except Tenants.DoesNotExist:
-            raise serializers.ValidationError(f"Tenant with ID {tenant_id} does not exist.")
-        
-        if Subscriptions.objects.filter(plan=plan, tenant=tenant).exists():
-            raise serializers.ValidationError(f"Subscription already exists for plan {plan_id} and tenant {tenant_id}.")
-        
-    
         started_at = timezone.now()
-        if plan.billing_cycle == SubscriptionsBillingCycle.ANNUALLY:
-            ended_at = started_at + timedelta(days=365 * plan.billing_duration)
-        elif plan.billing_cycle == SubscriptionsBillingCycle.MONTHLY:
-            ended_at = started_at + timedelta(weeks=4 * plan.billing_duration)
-        else:
-            raise serializers.ValidationError(f"Invalid billing cycle: {plan.billing_cycle}")
-
-        subscription = Subscriptions.objects.create(
-            plan=plan,
-            tenant=tenant,
+        subscription = Subscriptions(
+            tenant_id=tenant_id,
             status=SubscriptionsStatus.ACTIVE,
-            created_by_user_id=tenant_id,
+            created_by_user_id=user_id,
             started_at=started_at,
-            ended_at=ended_at,
-            **validated_data
+            auto_renew=validated_data.get('auto_renew', False),
+            created_at=started_at,
+            updated_at=started_at,
         )
+        plan = next(iter(Plans.objects.raw(self.SUBSCRIBE_SQL, {
+            'plan_id': str(plan_id),
+            'id': str(subscription.id),
+            'status': subscription.status,
+            'now': started_at,
+            'auto_renew': subscription.auto_renew,
+            'user_id': str(user_id),
+            'tenant_id': str(tenant_id),
+            'billing_cycles': tuple(BILLING_CYCLE_LENGTHS),
+        })), None)
+        if plan is None:
+            raise serializers.ValidationError(f"Plan with ID {plan_id} does not exist.")
+        if plan.subscription_id is None:
+            if plan.billing_cycle not in BILLING_CYCLE_LENGTHS:
+                raise serializers.ValidationError(f"Invalid billing cycle: {plan.billing_cycle}")
+            raise serializers.ValidationError(f"Subscription already exists for plan {plan_id} and tenant {tenant_id}.")
+
+        # The response embeds the plan with its policies
+        prefetch_related_objects([plan], Prefetch(
+            'plan_limit_policies',
+            queryset=PlansLimitPolicies.objects.select_related('limit_policy'),
+        ))
+        subscription.plan = plan
+        subscription.ended_at = plan.subscription_ended_at
+        subscription._state.adding = False
+        subscription._state.db = connection.alias
         return subscription
     
 class UsagesSerializer(serializers.ModelSerializer):
@@ -296,8 +668,23 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         token['name'] = user.name
         token['created_at'] = user.created_at.isoformat() if user.created_at else None
         token['updated_at'] = user.updated_at.isoformat() if user.updated_at else None
+        token['tenant_ids'] = cls.get_tenant_ids(user)
         return token
 
+    @staticmethod
+    def get_tenant_ids(user):
+        """
+        IDs of the user's tenants, as published in the ``tenant_ids`` claim.
+        
+        They are read with the SECURITY DEFINER ``get_user_tenant_ids`` function
+        of the RLS policies, so tokens issued before the RLS context is set
+        (login, registration) see the memberships as well. This costs one query
+        per issued token; a refresh copies the claims and does not query.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT get_user_tenant_ids(%s::UUID)::TEXT[]", [str(user.id)])
+            return cursor.fetchone()[0] or []
+
     def validate(self, attrs):
         email = attrs.get('email')
         password = attrs.get('password')
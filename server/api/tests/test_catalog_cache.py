@@ -0,0 +1,273 @@
+"""
+Tests for the in-process plan catalog cache.
+"""
+
+import gzip
+from unittest.mock import patch
+
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.enums.limit_policies_metrics import LimitPoliciesMetrics
+from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from api.models import LimitPolicies, Plans, PlansLimitPolicies
+from api.serializers import PlanSerializer
+from api.tests.base import AuthAPITests
+from api.utils.catalog_cache import CatalogCache, catalog_cache, get_catalog_version
+
+
+class CatalogCacheViewTests(AuthAPITests):
+    """Test cases for the cached catalog list endpoints"""
+
+    def setUp(self):
+        super().setUp()
+        catalog_cache.clear()
+        self.limit_policy = LimitPolicies.objects.create(
+            metric=LimitPoliciesMetrics.MAX_USERS,
+            limit=10,
+            created_by=self.test_admin
+        )
+        self.plan = self.create_plan("Basic Plan")
+        refresh = RefreshToken.for_user(self.test_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def create_plan(self, name):
+        return Plans.objects.create(
+            name=name,
+            billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+            billing_duration=1,
+            price=9.99,
+            created_by=self.test_admin
+        )
+
+    def plan_names(self):
+        response = self.client.get(reverse('plans_view'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(plan['name'] for plan in response.data)
+
+    def test_cached_list_only_revalidates(self):
+        """Test that a cached list costs the version lookup instead of the catalog queries"""
+        with CaptureQueriesContext(connection) as miss:
+            first = self.client.get(reverse('plans_view'))
+        with CaptureQueriesContext(connection) as hit:
+            second = self.client.get(reverse('plans_view'))
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(len(hit.captured_queries), len(miss.captured_queries) - 2)
+        self.assertEqual(sum('catalog_version' in query['sql'] for query in hit.captured_queries), 1)
+
+    def test_plan_write_invalidates(self):
+        """Test that plans written through PlanView are listed on the next read"""
+        self.assertEqual(self.plan_names(), ["Basic Plan"])
+
+        response = self.client.post(reverse('plans_view'), {
+            'name': 'Premium Plan',
+            'billing_cycle': SubscriptionsBillingCycle.MONTHLY.value,
+            'billing_duration': 1,
+            'price': 19.99,
+            'policy_ids': [str(self.limit_policy.id)],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.plan_names(), ["Basic Plan", "Premium Plan"])
+
+        self.client.delete(reverse('plan_detail', kwargs={'pk': self.plan.id}))
+        self.assertEqual(self.plan_names(), ["Premium Plan"])
+
+    def test_plan_limit_policy_write_invalidates(self):
+        """Test that links written through PlanLimitPolicyView are listed on the next read"""
+        self.client.get(reverse('plans_view'))
+
+        response = self.client.post(reverse('plans_limit_policies_view'), {
+            'plan_id': str(self.plan.id),
+            'policy_id': str(self.limit_policy.id),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        plans = self.client.get(reverse('plans_view')).data
+        self.assertEqual(plans[0]['associated_policy_ids'], [str(self.limit_policy.id)])
+
+    def test_limit_policy_write_invalidates(self):
+        """Test that limit policies updated through LimitPoliciesView are listed on the next read"""
+        self.client.get(reverse('limit_policies_view'))
+
+        response = self.client.put(
+            reverse('limit_policy_detail', kwargs={'pk': self.limit_policy.id}),
+            {'limit': 99},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        policies = self.client.get(reverse('limit_policies_view')).data
+        self.assertEqual([policy['limit'] for policy in policies], [99])
+
+    def test_other_worker_revalidates(self):
+        """Test that a write made elsewhere is picked up by a worker holding an entry"""
+        self.plan_names()
+
+        # Bypass the API, as another worker or a management command would
+        self.create_plan("Direct Plan")
+
+        self.assertEqual(self.plan_names(), ["Basic Plan", "Direct Plan"])
+
+    @override_settings(CATALOG_CACHE={'ENABLED': False})
+    def test_disabled_cache_builds_every_time(self):
+        """Test that the cache can be switched off"""
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(reverse('plans_view'))
+        with CaptureQueriesContext(connection) as second:
+            self.client.get(reverse('plans_view'))
+
+        self.assertEqual(len(first.captured_queries), len(second.captured_queries))
+        self.assertTrue(any('FROM "plans"' in query['sql'] for query in second.captured_queries))
+
+
+class CatalogCacheTests(AuthAPITests):
+    """Test cases for the CatalogCache collector"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache = CatalogCache()
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return self.builds
+
+    def test_version_moves_on_every_catalog_write(self):
+        """Test that the triggers bump the version for each catalog table"""
+        versions = [get_catalog_version()[0]]
+
+        policy = LimitPolicies.objects.create(metric=LimitPoliciesMetrics.MAX_USERS, limit=1, created_by=self.test_admin)
+        versions.append(get_catalog_version()[0])
+        plan = Plans.objects.create(
+            name="Trigger Plan",
+            billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+            billing_duration=1,
+            price=1,
+            created_by=self.test_admin
+        )
+        versions.append(get_catalog_version()[0])
+        # The link insert bumps it a second time through the plans.limits refresh
+        PlansLimitPolicies.objects.create(plan=plan, limit_policy=policy)
+        versions.append(get_catalog_version()[0])
+
+        self.assertEqual(versions, sorted(set(versions)))
+
+    def test_rolled_back_write_does_not_reuse_stamp(self):
+        """Test that the stamp reached after a rollback differs from the rolled back one"""
+        try:
+            with transaction.atomic():
+                LimitPolicies.objects.create(metric=LimitPoliciesMetrics.MAX_USERS, limit=1, created_by=self.test_admin)
+                self.assertEqual(self.cache.get('entry', self.build), 1)
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            pass
+
+        LimitPolicies.objects.create(metric=LimitPoliciesMetrics.MAX_USERS, limit=2, created_by=self.test_admin)
+
+        self.assertEqual(self.cache.get('entry', self.build), 2)
+
+    @override_settings(CATALOG_CACHE={'REVALIDATE_AFTER': 60})
+    def test_revalidate_after_skips_version_lookup(self):
+        """Test that a recently checked entry is served without querying"""
+        self.cache.get('entry', self.build)
+
+        with CaptureQueriesContext(connection) as captured:
+            value = self.cache.get('entry', self.build)
+
+        self.assertEqual(value, 1)
+        self.assertEqual(len(captured.captured_queries), 0)
+
+
+@override_settings(CATALOG_CACHE={'PRERENDER': True})
+class PrerenderedCatalogTests(AuthAPITests):
+    """Test cases for serving catalog lists from pre-encoded bytes"""
+
+    def setUp(self):
+        super().setUp()
+        catalog_cache.clear()
+        self.limit_policy = LimitPolicies.objects.create(
+            metric=LimitPoliciesMetrics.MAX_USERS,
+            limit=10,
+            created_by=self.test_admin
+        )
+        for i in range(5):
+            plan = Plans.objects.create(
+                name=f"Plan {i}",
+                billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+                billing_duration=1,
+                price=9.99,
+                created_by=self.test_admin
+            )
+            PlansLimitPolicies.objects.create(plan=plan, limit_policy=self.limit_policy)
+        refresh = RefreshToken.for_user(self.test_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def test_bytes_match_rendered_response(self):
+        """Test that the pre-encoded body is the one DRF renders"""
+        for url in (reverse('plans_view'), reverse('limit_policies_view')):
+            with self.subTest(url=url):
+                prerendered = self.client.get(url)
+                with override_settings(CATALOG_CACHE={'PRERENDER': False}):
+                    rendered = self.client.get(url)
+
+                self.assertEqual(prerendered.status_code, status.HTTP_200_OK)
+                self.assertEqual(prerendered.content, rendered.content)
+                self.assertEqual(prerendered['Content-Type'], rendered['Content-Type'])
+                self.assertEqual(prerendered['ETag'], rendered['ETag'])
+
+    def test_cached_read_does_not_render(self):
+        """Test that a cached read neither serializes nor renders"""
+        first = self.client.get(reverse('plans_view'))
+
+        with patch.object(JSONRenderer, 'render') as render, \
+             patch.object(PlanSerializer, 'to_representation') as to_representation:
+            second = self.client.get(reverse('plans_view'))
+
+        self.assertEqual(second.content, first.content)
+        self.assertFalse(render.called)
+        self.assertFalse(to_representation.called)
+
+    def test_gzip_encoding(self):
+        """Test that clients accepting gzip get the compressed bytes with a weak ETag"""
+        plain = self.client.get(reverse('plans_view'))
+        response = self.client.get(reverse('plans_view'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], f"W/{plain['ETag']}")
+
+        not_modified = self.client.get(
+            reverse('plans_view'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_catalog_write_rebuilds_bytes(self):
+        """Test that a catalog write is served on the next read"""
+        self.client.get(reverse('plans_view'))
+
+        self.limit_policy.limit = 20
+        self.limit_policy.save()
+
+        plans = self.client.get(reverse('plans_view')).json()
+        self.assertEqual({plan['limits']['max_users'] for plan in plans}, {20})
+
+    def test_pages_keep_link_header(self):
+        """Test that a pre-rendered first page still points to the next page"""
+        response = self.client.get(reverse('plans_view'), {'page_size': 2})
+
+        self.assertEqual(len(response.json()), 2)
+        self.assertIn('cursor=', response['Link'])
+
+    def test_browsable_api_is_rendered(self):
+        """Test that clients negotiating HTML still get the browsable API"""
+        response = self.client.get(reverse('plans_view'), HTTP_ACCEPT='text/html')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
@@ -0,0 +1,224 @@
+"""
+Tests for the bulk catalog import endpoint and management command.
+"""
+
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import LimitPolicies, Plans, PlansLimitPolicies
+from api.tests.base import AuthAPITests
+
+
+def plan_record(i, **overrides):
+    record = {
+        'name': f"Imported Plan {i}",
+        'billing_cycle': 'monthly',
+        'billing_duration': 1,
+        'price': '19.99',
+        'limits': {'max_users': 10 + i % 3, 'max_projects': 5},
+    }
+    record.update(overrides)
+    return record
+
+
+def jsonl(records):
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+
+class CatalogImportViewTests(AuthAPITests):
+    """Test cases for POST /api/plans/import/"""
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.test_admin)
+
+    def authenticate(self, user):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def post(self, body, content_type='application/x-ndjson'):
+        return self.client.generic('POST', reverse('plans_import'), body, content_type=content_type)
+
+    def plan_limits(self, name):
+        return dict(
+            PlansLimitPolicies.objects
+            .filter(plan__name=name)
+            .values_list('limit_policy__metric', 'limit_policy__limit')
+        )
+
+    def test_jsonl_import_creates_plans_policies_and_links(self):
+        """Test that a JSON lines import writes the plans with their limits"""
+        response = self.post(jsonl(plan_record(i) for i in range(6)))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['plans_created'], 6)
+        self.assertEqual(response.data['limit_policies_created'], 4)
+        self.assertEqual(response.data['links_created'], 12)
+        self.assertEqual(Plans.objects.count(), 6)
+        self.assertEqual(self.plan_limits("Imported Plan 4"), {'max_users': 11, 'max_projects': 5})
+        self.assertEqual(set(Plans.objects.values_list('created_by', flat=True)), {self.test_admin.id})
+
+    def test_reimport_updates_in_place(self):
+        """Test that importing a plan again updates it and replaces its limits"""
+        self.post(jsonl([plan_record(1)]))
+        plan_id = Plans.objects.get().id
+
+        response = self.post(jsonl([plan_record(1, price='29.99', limits={'max_users': 11, 'max_storage': 3})]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['plans_created'], 0)
+        self.assertEqual(response.data['plans_updated'], 1)
+        self.assertEqual(response.data['links_removed'], 1)
+        self.assertEqual(response.data['links_created'], 1)
+        plan = Plans.objects.get()
+        self.assertEqual(plan.id, plan_id)
+        self.assertEqual(str(plan.price), '29.99')
+        self.assertEqual(self.plan_limits("Imported Plan 1"), {'max_users': 11, 'max_storage': 3})
+        self.assertEqual(plan.limits, {'max_users': 11, 'max_storage': 3})
+
+    def test_record_without_limits_keeps_links(self):
+        """Test that a record without limits updates the plan and leaves its links alone"""
+        self.post(jsonl([plan_record(1)]))
+        record = plan_record(1, price='29.99')
+        del record['limits']
+
+        response = self.post(jsonl([record]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['links_removed'], 0)
+        self.assertEqual(str(Plans.objects.get().price), '29.99')
+        self.assertEqual(self.plan_limits("Imported Plan 1"), {'max_users': 11, 'max_projects': 5})
+
+        response = self.post(jsonl([plan_record(1, limits={})]))
+
+        self.assertEqual(response.data['links_removed'], 2)
+        self.assertEqual(self.plan_limits("Imported Plan 1"), {})
+
+    def test_write_error_answers_400(self):
+        """Test that a database error while writing is reported like other view errors"""
+        with patch('api.views.CatalogImporter.run', side_effect=IntegrityError("duplicate key value")):
+            response = self.post(jsonl([plan_record(0)]))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], "duplicate key value")
+
+    def test_existing_policies_are_reused(self):
+        """Test that limits matching an existing limit policy link to it"""
+        policy = LimitPolicies.objects.create(metric='max_projects', limit=5, created_by=self.test_admin)
+
+        response = self.post(jsonl([plan_record(0)]))
+
+        self.assertEqual(response.data['limit_policies_created'], 1)
+        self.assertTrue(PlansLimitPolicies.objects.filter(limit_policy=policy).exists())
+
+    def test_csv_import(self):
+        """Test that a CSV file with a metric=limit;... column is imported"""
+        body = (
+            'name,description,billing_cycle,billing_duration,price,limits\n'
+            'CSV Plan,,annually,1,99.00,max_users=50;max_projects=5\n'
+            'Free Plan,No limits,monthly,1,0,\n'
+        )
+
+        response = self.post(body, content_type='text/csv; charset=utf-8')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['plans_created'], 2)
+        self.assertEqual(self.plan_limits("CSV Plan"), {'max_users': 50, 'max_projects': 5})
+        self.assertIsNone(Plans.objects.get(name="CSV Plan").description)
+        self.assertEqual(self.plan_limits("Free Plan"), {})
+
+    def test_invalid_file_writes_nothing(self):
+        """Test that one invalid record rejects the whole file, reporting its line"""
+        records = [plan_record(i) for i in range(5)]
+        records[3]['billing_duration'] = 0
+        body = jsonl(records) + 'not json\n' + jsonl([plan_record(0)])
+
+        response = self.post(body)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 6, 7])
+        self.assertIn('billing_duration', response.data['errors'][0]['errors'])
+        self.assertIn('Duplicate', response.data['errors'][2]['errors']['name'][0])
+        self.assertFalse(Plans.objects.exists())
+        self.assertFalse(LimitPolicies.objects.exists())
+
+    @override_settings(CATALOG_IMPORT={'MAX_ERRORS': 2})
+    def test_error_report_is_capped(self):
+        """Test that validation stops after CATALOG_IMPORT['MAX_ERRORS'] errors"""
+        response = self.post('[]\n' * 10)
+
+        self.assertEqual(len(response.data['errors']), 2)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        """Test that a chunk costs the same number of queries for few or many plans"""
+        with CaptureQueriesContext(connection) as few:
+            self.post(jsonl(plan_record(i) for i in range(5)))
+        with CaptureQueriesContext(connection) as many:
+            self.post(jsonl(plan_record(i, limits={'max_storage': i % 7 + 1}) for i in range(5, 505)))
+
+        self.assertEqual(Plans.objects.count(), 505)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+    @override_settings(CATALOG_IMPORT={'CHUNK_SIZE': 2})
+    def test_chunks_share_policies(self):
+        """Test that a policy created by one chunk is reused by the next ones"""
+        response = self.post(jsonl(plan_record(i, limits={'max_users': 1}) for i in range(5)))
+
+        self.assertEqual(response.data['limit_policies_created'], 1)
+        self.assertEqual(response.data['links_created'], 5)
+
+    def test_rejects_other_content_types_and_users(self):
+        """Test that only platform admins can import, and only supported formats"""
+        response = self.post(jsonl([plan_record(0)]), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        self.authenticate(self.test_tenant_admin)
+        response = self.post(jsonl([plan_record(0)]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Plans.objects.exists())
+
+
+class ImportCatalogCommandTests(AuthAPITests):
+    """Test cases for the import_catalog management command"""
+
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_imports_file(self):
+        """Test that the command imports a JSON lines file as the given admin"""
+        path = self.write_file('.jsonl', jsonl(plan_record(i) for i in range(3)))
+
+        call_command('import_catalog', path, created_by=self.test_admin.email, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(Plans.objects.filter(created_by=self.test_admin).count(), 3)
+        self.assertEqual(PlansLimitPolicies.objects.count(), 6)
+
+    def test_invalid_file_fails(self):
+        """Test that the command fails without writing when a record is invalid"""
+        path = self.write_file('.jsonl', jsonl([plan_record(0, billing_cycle='weekly')]))
+
+        with self.assertRaises(CommandError):
+            call_command('import_catalog', path, created_by=self.test_admin.email, stderr=open(os.devnull, 'w'))
+        self.assertFalse(Plans.objects.exists())
+
+    def test_requires_platform_admin(self):
+        """Test that the creator must be a platform admin"""
+        path = self.write_file('.csv', 'name,description,billing_cycle,billing_duration,price,limits\n')
+
+        with self.assertRaises(CommandError):
+            call_command('import_catalog', path, created_by=self.test_tenant_admin.email)
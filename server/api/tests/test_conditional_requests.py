@@ -0,0 +1,153 @@
+"""
+Tests for conditional GETs (ETag / If-None-Match) on catalog and subscription reads.
+"""
+
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.enums.limit_policies_metrics import LimitPoliciesMetrics
+from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from api.enums.subscriptions_status import SubscriptionsStatus
+from api.models import LimitPolicies, Plans, PlansLimitPolicies, Subscriptions
+from api.serializers import PlanSerializer, SubscriptionSerializer
+from api.tests.base import AuthAPITests
+
+
+class ConditionalRequestTests(AuthAPITests):
+    """Test cases for ETag / If-None-Match support"""
+
+    def setUp(self):
+        super().setUp()
+        self.limit_policy = LimitPolicies.objects.create(
+            metric=LimitPoliciesMetrics.MAX_USERS.value,
+            limit=10,
+            created_by=self.test_admin
+        )
+        self.test_plan = Plans.objects.create(
+            name="Basic Plan",
+            billing_cycle=SubscriptionsBillingCycle.MONTHLY.value,
+            billing_duration=1,
+            price=29.99,
+            created_by=self.test_admin
+        )
+        PlansLimitPolicies.objects.create(plan=self.test_plan, limit_policy=self.limit_policy)
+        self.test_subscription = Subscriptions.objects.create(
+            plan=self.test_plan,
+            tenant=self.test_tenant,
+            created_by_user=self.test_tenant_admin,
+            status=SubscriptionsStatus.ACTIVE
+        )
+        self.admin_auth_header = self.auth_header(self.test_admin)
+        self.tenant_admin_auth_header = self.auth_header(self.test_tenant_admin)
+
+    def auth_header(self, user):
+        refresh = RefreshToken.for_user(user)
+        return f'Bearer {str(refresh.access_token)}'
+
+    def get(self, url, auth_header, etag=None):
+        headers = {'HTTP_AUTHORIZATION': auth_header}
+        if etag is not None:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return self.client.get(url, **headers)
+
+    def test_catalog_reads_return_etag(self):
+        """Test that plan and limit policy reads carry a strong ETag and must be revalidated"""
+        for url in (
+            reverse('plans_view'),
+            reverse('plan_detail', kwargs={'pk': self.test_plan.id}),
+            reverse('limit_policies_view'),
+            reverse('limit_policy_detail', kwargs={'pk': self.limit_policy.id}),
+        ):
+            with self.subTest(url=url):
+                response = self.get(url, self.admin_auth_header)
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertTrue(response['ETag'].startswith('"'))
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertIn('private', response['Cache-Control'])
+
+    def test_plan_list_not_modified_skips_serialization(self):
+        """Test that a matching If-None-Match answers 304 without serializing or reading the catalog"""
+        url = reverse('plans_view')
+        etag = self.get(url, self.admin_auth_header)['ETag']
+
+        with patch.object(PlanSerializer, 'to_representation') as to_representation, \
+             CaptureQueriesContext(connection) as captured:
+            response = self.get(url, self.admin_auth_header, etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertFalse(to_representation.called)
+        self.assertFalse(any('FROM "plans"' in query['sql'] for query in captured.captured_queries))
+
+    def test_catalog_write_changes_etag(self):
+        """Test that a catalog write turns a stored ETag into a full response"""
+        url = reverse('plans_view')
+        etag = self.get(url, self.admin_auth_header)['ETag']
+
+        self.limit_policy.limit = 20
+        self.limit_policy.save()
+
+        response = self.get(url, self.admin_auth_header, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[0]['associated_policies'][0]['limit'], 20)
+
+    def test_subscription_not_modified_skips_serialization(self):
+        """Test that subscription reads answer 304 without serializing"""
+        for url in (
+            reverse('subscription_view'),
+            reverse('subscription_detail', kwargs={'pk': self.test_subscription.id}),
+        ):
+            with self.subTest(url=url):
+                etag = self.get(url, self.tenant_admin_auth_header)['ETag']
+
+                with patch.object(SubscriptionSerializer, 'to_representation') as to_representation:
+                    response = self.get(url, self.tenant_admin_auth_header, etag)
+
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertFalse(to_representation.called)
+
+    def test_subscription_etag_follows_updates(self):
+        """Test that updating, adding or cancelling a subscription changes the ETag"""
+        url = reverse('subscription_view')
+        etags = [self.get(url, self.tenant_admin_auth_header)['ETag']]
+
+        self.test_subscription.status = SubscriptionsStatus.INACTIVE
+        self.test_subscription.save()
+        etags.append(self.get(url, self.tenant_admin_auth_header)['ETag'])
+
+        self.test_plan.name = "Renamed Plan"
+        self.test_plan.save()
+        etags.append(self.get(url, self.tenant_admin_auth_header)['ETag'])
+
+        self.test_tenant.name = "renamed_tenant"
+        self.test_tenant.save()
+        etags.append(self.get(url, self.tenant_admin_auth_header)['ETag'])
+
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_subscription_etag_differs_per_user(self):
+        """Test that two users never share a subscription ETag"""
+        url = reverse('subscription_view')
+
+        admin_etag = self.get(url, self.admin_auth_header)['ETag']
+        tenant_admin_etag = self.get(url, self.tenant_admin_auth_header)['ETag']
+
+        self.assertNotEqual(admin_etag, tenant_admin_etag)
+        response = self.get(url, self.tenant_admin_auth_header, admin_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_missing_subscription_is_not_found(self):
+        """Test that a detail read of a missing subscription still answers 404"""
+        url = reverse('subscription_detail', kwargs={'pk': '00000000-0000-0000-0000-000000000000'})
+
+        response = self.get(url, self.tenant_admin_auth_header, '*')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(response.has_header('ETag'))
@@ -0,0 +1,136 @@
+"""
+Tests for the per-request database instrumentation middleware.
+"""
+
+import json
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.middleware import request_queries_counter
+from api.tests.base import AuthAPITests
+from api.utils.instrumentation import QueryInstrumentation
+from api.utils.rls_utils import build_rls_context_statement
+
+
+def parse_server_timing(header):
+    """Parse a Server-Timing header into {name: {'dur': float, 'desc': str}}."""
+    metrics = {}
+    for entry in header.split(','):
+        name, *params = [part.strip() for part in entry.split(';')]
+        metrics[name] = {}
+        for param in params:
+            key, value = param.split('=', 1)
+            metrics[name][key] = float(value) if key == 'dur' else value.strip('"')
+    return metrics
+
+
+class DatabaseInstrumentationMiddlewareTests(AuthAPITests):
+    """Test cases for DatabaseInstrumentationMiddleware"""
+
+    def setUp(self):
+        super().setUp()
+        refresh = RefreshToken.for_user(self.test_admin)
+        self.admin_auth_header = f'Bearer {str(refresh.access_token)}'
+
+    def get_plans(self):
+        return self.client.get(reverse('plans_view'), HTTP_AUTHORIZATION=self.admin_auth_header)
+
+    def test_server_timing_reports_query_count_and_db_time(self):
+        """Test that the header counts every statement of the request, RLS included."""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.get_plans()
+
+        timing = parse_server_timing(response['Server-Timing'])
+        self.assertEqual(timing['db']['desc'], f'{len(captured.captured_queries)} queries')
+        self.assertGreater(timing['db']['dur'], 0)
+        self.assertGreater(timing['rls']['dur'], 0)
+        self.assertLessEqual(timing['rls']['dur'], timing['db']['dur'])
+        self.assertLessEqual(timing['db-slowest']['dur'], timing['db']['dur'])
+
+    @override_settings(RLS={'LAZY': True})
+    def test_lazy_rls_statement_is_measured(self):
+        """Test that the RLS statement sent by the lazy context is measured on its own."""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.get_plans()
+
+        timing = parse_server_timing(response['Server-Timing'])
+        self.assertEqual(timing['db']['desc'], f'{len(captured.captured_queries)} queries')
+        self.assertGreater(timing['rls']['dur'], 0)
+
+    def test_log_line_is_structured(self):
+        """Test that one JSON log line is written per request."""
+        with self.assertLogs('api.instrumentation', level='INFO') as logs:
+            response = self.get_plans()
+
+        self.assertEqual(len(logs.records), 1)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['event'], 'request_db')
+        self.assertEqual(record['view'], 'PlanView')
+        self.assertEqual(record['method'], 'GET')
+        self.assertEqual(record['status'], response.status_code)
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['rls_ms'], 0)
+        self.assertIsNotNone(record['slowest_sql'])
+
+    def test_per_view_counter(self):
+        """Test that the queries of a request are added to the per-view counter."""
+        before = request_queries_counter.get(view='PlanView') or 0
+
+        response = self.get_plans()
+
+        queries = int(parse_server_timing(response['Server-Timing'])['db']['desc'].split()[0])
+        self.assertEqual(request_queries_counter.get(view='PlanView'), before + queries)
+
+    @override_settings(DB_INSTRUMENTATION={'SERVER_TIMING': False, 'LOG': False})
+    def test_reporting_can_be_disabled(self):
+        """Test that the header and the log line can be switched off."""
+        with self.assertNoLogs('api.instrumentation', level='INFO'):
+            response = self.get_plans()
+
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_wrapper_is_removed_after_request(self):
+        """Test that the execute wrapper does not outlive the request."""
+        self.get_plans()
+
+        self.assertFalse(any(isinstance(wrapper, QueryInstrumentation) for wrapper in connection.execute_wrappers))
+
+
+class QueryInstrumentationTests(AuthAPITests):
+    """Test cases for the QueryInstrumentation collector"""
+
+    def test_nested_statement_is_not_counted_twice(self):
+        """Test that a statement issued from inside another one is measured separately."""
+        instrumentation = QueryInstrumentation()
+        sql, params = build_rls_context_statement()
+
+        def install_rls_first(execute, query, query_params, many, context):
+            if query != sql:
+                context['cursor'].execute(sql, params)
+            return execute(query, query_params, many, context)
+
+        with connection.execute_wrapper(instrumentation), connection.execute_wrapper(install_rls_first):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_sleep(0.01)")
+
+        self.assertEqual(instrumentation.queries, 2)
+        self.assertGreater(instrumentation.rls_duration, 0)
+        self.assertGreaterEqual(instrumentation.slowest_duration, 0.01)
+        self.assertEqual(instrumentation.slowest_sql, "SELECT pg_sleep(0.01)")
+        self.assertAlmostEqual(
+            instrumentation.duration,
+            instrumentation.slowest_duration + instrumentation.rls_duration,
+        )
+
+    @override_settings(DB_INSTRUMENTATION={'SLOWEST_STATEMENT_LENGTH': 10})
+    def test_slowest_statement_is_truncated(self):
+        """Test that the logged statement is truncated."""
+        instrumentation = QueryInstrumentation()
+        instrumentation.record("SELECT * FROM plans WHERE id = %s", 0.002)
+
+        self.assertEqual(instrumentation.as_dict()['slowest_sql'], "SELECT * F...")
+        self.assertEqual(instrumentation.as_dict()['slowest_ms'], 2.0)
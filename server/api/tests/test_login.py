@@ -1,5 +1,8 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
 from api.tests.base import AuthAPITests
 
 
@@ -77,3 +80,42 @@ class LoginTests(AuthAPITests):
         response = self.client.post(url, data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_login_token_carries_tenant_ids(self):
+        """Test that the access token lists the user's tenants"""
+        url = reverse('login')
+        data = {
+            'email': 'tenantadmin@example.com',
+            'password': 'tenantpass123'
+        }
+        
+        response = self.client.post(url, data, format='json')
+        
+        token = AccessToken(response.data['access'])
+        self.assertEqual(token['tenant_ids'], [str(self.test_tenant.id)])
+
+    def test_refresh_keeps_tenant_ids_without_querying(self):
+        """Test that refreshing a token copies the tenant_ids claim instead of reading it again"""
+        response = self.client.post(reverse('login'), {
+            'email': 'tenantadmin@example.com',
+            'password': 'tenantpass123'
+        }, format='json')
+        
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse('token_refresh'), {'refresh': response.data['refresh']}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AccessToken(response.data['access'])['tenant_ids'], [str(self.test_tenant.id)])
+        self.assertFalse(any('get_user_tenant_ids' in query['sql'] for query in captured.captured_queries))
+
+    def test_login_token_of_platform_admin_has_no_tenants(self):
+        """Test that a user without tenants gets an empty tenant_ids claim"""
+        url = reverse('login')
+        data = {
+            'email': 'admin@example.com',
+            'password': 'adminpass123'
+        }
+        
+        response = self.client.post(url, data, format='json')
+        
+        self.assertEqual(AccessToken(response.data['access'])['tenant_ids'], [])
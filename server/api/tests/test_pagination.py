@@ -0,0 +1,175 @@
+"""
+Tests for keyset (cursor) pagination of the list endpoints.
+"""
+
+import re
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.enums.limit_policies_metrics import LimitPoliciesMetrics
+from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from api.enums.subscriptions_status import SubscriptionsStatus
+from api.models import LimitPolicies, Plans, Subscriptions
+from api.tests.base import AuthAPITests
+from api.utils.catalog_cache import catalog_cache
+from api.utils.pagination import encode_cursor
+
+
+class KeysetPaginationTests(AuthAPITests):
+    """Test cases for the ?page_size= / ?cursor= list parameters"""
+
+    def setUp(self):
+        super().setUp()
+        catalog_cache.clear()
+        self.plans = [
+            Plans.objects.create(
+                name=f"Plan {i}",
+                billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+                billing_duration=1,
+                price=9.99,
+                created_by=self.test_admin
+            )
+            for i in range(7)
+        ]
+        self.subscriptions = [
+            Subscriptions.objects.create(
+                plan=plan,
+                tenant=self.test_tenant,
+                created_by_user=self.test_tenant_admin,
+                status=SubscriptionsStatus.ACTIVE
+            )
+            for plan in self.plans
+        ]
+        refresh = RefreshToken.for_user(self.test_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def next_url(self, response):
+        if not response.has_header('Link'):
+            return None
+        return re.match(r'<(.+)>; rel="next"', response['Link']).group(1)
+
+    def collect(self, url, page_size):
+        """Follow the Link headers from the first page, returning the ids of each page."""
+        pages = []
+        response = self.client.get(url, {'page_size': page_size})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([row['id'] for row in response.data])
+            url = self.next_url(response)
+            if url is None:
+                return pages
+            response = self.client.get(url)
+
+    def expected_ids(self, model):
+        return [str(pk) for pk in model.objects.order_by('created_at', 'id').values_list('id', flat=True)]
+
+    def test_pages_cover_every_row_once_in_order(self):
+        """Test that following the cursors returns each row once, ordered by (created_at, id)"""
+        for url, model in (
+            (reverse('subscription_view'), Subscriptions),
+            (reverse('plans_view'), Plans),
+        ):
+            with self.subTest(url=url):
+                pages = self.collect(url, 3)
+
+                self.assertEqual([len(page) for page in pages], [3, 3, 1])
+                self.assertEqual(sum(pages, []), self.expected_ids(model))
+
+    def test_rows_sharing_created_at_are_not_skipped(self):
+        """Test that the id breaks ties between rows created at the same instant"""
+        Subscriptions.objects.update(created_at=timezone.now())
+
+        pages = self.collect(reverse('subscription_view'), 2)
+
+        self.assertEqual(sum(pages, []), self.expected_ids(Subscriptions))
+
+    def test_exact_last_page_has_no_link(self):
+        """Test that a page ending on the last row does not point to an empty page"""
+        response = self.client.get(reverse('subscription_view'), {'page_size': 7})
+
+        self.assertEqual(len(response.data), 7)
+        self.assertFalse(response.has_header('Link'))
+
+    def test_lists_are_complete_without_parameters(self):
+        """Test that a list requested without ?page_size= or ?cursor= returns every row"""
+        for url, model in (
+            (reverse('subscription_view'), Subscriptions),
+            (reverse('plans_view'), Plans),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+
+                self.assertEqual([row['id'] for row in response.data], self.expected_ids(model))
+                self.assertFalse(response.has_header('Link'))
+
+    def test_default_page_size(self):
+        """Test that a configured PAGINATION['PAGE_SIZE'] applies without ?page_size="""
+        with override_settings(PAGINATION={'PAGE_SIZE': 4}):
+            response = self.client.get(reverse('subscription_view'))
+
+        self.assertEqual(len(response.data), 4)
+        self.assertIn('page_size=4', response['Link'])
+
+    @override_settings(PAGINATION={'MAX_PAGE_SIZE': 5})
+    def test_page_size_is_capped(self):
+        """Test that a page size above PAGINATION['MAX_PAGE_SIZE'] is capped"""
+        response = self.client.get(reverse('limit_policies_view'), {'page_size': 1000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse('subscription_view'), {'page_size': 1000})
+        self.assertEqual(len(response.data), 5)
+        self.assertIn('page_size=5', response['Link'])
+
+    def test_invalid_parameters_are_rejected(self):
+        """Test that malformed cursors and page sizes answer 400"""
+        for params in (
+            {'cursor': 'not-a-cursor'},
+            {'cursor': 'WyJ4Il0'},
+            {'page_size': 0},
+            {'page_size': 'ten'},
+        ):
+            for url in (reverse('subscription_view'), reverse('plans_view'), reverse('limit_policies_view')):
+                with self.subTest(url=url, params=params):
+                    response = self.client.get(url, params)
+
+                    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                    self.assertIn('error', response.data)
+
+    def test_deep_page_seeks_instead_of_offset(self):
+        """Test that a page after a cursor is fetched with a range condition and no OFFSET"""
+        last = Subscriptions.objects.order_by('created_at', 'id')[4]
+        cursor = encode_cursor(last.created_at, last.id)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('subscription_view'), {'page_size': 2, 'cursor': cursor})
+
+        self.assertEqual([row['id'] for row in response.data], self.expected_ids(Subscriptions)[5:7])
+        page_query = next(query['sql'] for query in captured.captured_queries
+                          if query['sql'].startswith('SELECT') and 'ORDER BY "subscriptions"."created_at"' in query['sql'])
+        self.assertNotIn('OFFSET', page_query)
+        self.assertIn('LIMIT 3', page_query)
+
+    def test_limit_policy_pages(self):
+        """Test that limit policies are paginated like the other lists"""
+        for metric in LimitPoliciesMetrics.values:
+            LimitPolicies.objects.create(metric=metric, limit=1, created_by=self.test_admin)
+
+        pages = self.collect(reverse('limit_policies_view'), 1)
+
+        self.assertEqual(len(pages), len(LimitPoliciesMetrics.values))
+        self.assertEqual(sum(pages, []), self.expected_ids(LimitPolicies))
+
+    def test_pages_have_distinct_etags(self):
+        """Test that two pages of the same list never share an ETag"""
+        first = self.client.get(reverse('plans_view'), {'page_size': 3})
+        second = self.client.get(self.next_url(first))
+
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        response = self.client.get(self.next_url(first), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
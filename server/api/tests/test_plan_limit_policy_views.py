@@ -1,4 +1,6 @@
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from api.tests.base import AuthAPITests
@@ -215,3 +217,144 @@ class PlanLimitPolicyViewTests(AuthAPITests):
         response = self.client.delete(url, data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PlanLimitPolicyBatchTests(AuthAPITests):
+    """Test cases for attaching and detaching arrays of pairs"""
+
+    MISSING_ID = '00000000-0000-0000-0000-000000000000'
+
+    def setUp(self):
+        super().setUp()
+        self.policies = LimitPolicies.objects.bulk_create([
+            LimitPolicies(metric=LimitPoliciesMetrics.MAX_USERS, limit=limit, created_by=self.test_admin)
+            for limit in (10, 50, 100)
+        ])
+        self.plans = Plans.objects.bulk_create([
+            Plans(
+                name=f"Plan {i}",
+                billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+                billing_duration=1,
+                price=9.99,
+                created_by=self.test_admin
+            )
+            for i in range(20)
+        ])
+        PlansLimitPolicies.objects.create(plan=self.plans[0], limit_policy=self.policies[0])
+        refresh = RefreshToken.for_user(self.test_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def pair(self, plan_id, policy_id):
+        return {'plan_id': str(plan_id), 'policy_id': str(policy_id)}
+
+    def statuses(self, response):
+        return [result['status'] for result in response.data]
+
+    def test_attach_reports_each_pair(self):
+        """Test that a batch attach creates the new links and reports the others"""
+        pairs = [
+            self.pair(self.plans[0].id, self.policies[0].id),
+            self.pair(self.plans[0].id, self.policies[1].id),
+            self.pair(self.MISSING_ID, self.policies[1].id),
+            self.pair(self.plans[1].id, self.MISSING_ID),
+            self.pair(self.plans[0].id, self.policies[1].id),
+        ]
+
+        response = self.client.post(reverse('plans_limit_policies_view'), pairs, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.statuses(response),
+            ['exists', 'created', 'plan_not_found', 'policy_not_found', 'duplicate']
+        )
+        self.assertEqual(response.data[1], {**pairs[1], 'status': 'created'})
+        self.assertEqual(
+            set(PlansLimitPolicies.objects.filter(plan=self.plans[0]).values_list('limit_policy_id', flat=True)),
+            {self.policies[0].id, self.policies[1].id}
+        )
+
+    def test_detach_reports_each_pair(self):
+        """Test that a batch detach removes the existing links and reports the others"""
+        pairs = [
+            self.pair(self.plans[0].id, self.policies[0].id),
+            self.pair(self.plans[1].id, self.policies[0].id),
+            self.pair(self.plans[0].id, self.policies[0].id),
+        ]
+
+        response = self.client.delete(reverse('plans_limit_policies_view'), pairs, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.statuses(response), ['deleted', 'not_found', 'duplicate'])
+        self.assertFalse(PlansLimitPolicies.objects.exists())
+
+    def test_detach_keeps_unrequested_links(self):
+        """Test that detaching (plan A, policy 2) and (plan B, policy 1) keeps (plan A, policy 1)"""
+        PlansLimitPolicies.objects.create(plan=self.plans[1], limit_policy=self.policies[1])
+
+        response = self.client.delete(reverse('plans_limit_policies_view'), [
+            self.pair(self.plans[0].id, self.policies[1].id),
+            self.pair(self.plans[1].id, self.policies[0].id),
+        ], format='json')
+
+        self.assertEqual(self.statuses(response), ['not_found', 'not_found'])
+        self.assertEqual(PlansLimitPolicies.objects.count(), 2)
+
+    def test_attach_reports_concurrent_insert_as_exists(self):
+        """Test that a link inserted by another request after the lookups is not reported as created"""
+        pair = (self.plans[1].id, self.policies[1].id)
+
+        def insert_first(execute, sql, params, many, context):
+            # The ORM quotes the table name, so only the batch insert matches
+            if sql.lstrip().startswith('INSERT INTO plans_limit_policies'):
+                PlansLimitPolicies.objects.create(plan_id=pair[0], limit_policy_id=pair[1])
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(insert_first):
+            response = self.client.post(reverse('plans_limit_policies_view'), [
+                self.pair(*pair),
+                self.pair(self.plans[2].id, self.policies[1].id),
+            ], format='json')
+
+        self.assertEqual(self.statuses(response), ['exists', 'created'])
+        self.assertEqual(PlansLimitPolicies.objects.filter(plan_id=pair[0], limit_policy_id=pair[1]).count(), 1)
+
+    def test_links_are_looked_up_by_exact_pair(self):
+        """Test that the link lookup matches the requested pairs, not every plan and policy combination"""
+        with CaptureQueriesContext(connection) as captured:
+            self.client.delete(reverse('plans_limit_policies_view'), [
+                self.pair(self.plans[0].id, self.policies[1].id),
+                self.pair(self.plans[1].id, self.policies[0].id),
+            ], format='json')
+
+        lookup, = [query['sql'] for query in captured.captured_queries if 'FROM plans_limit_policies' in query['sql']]
+        self.assertIn('(plan_id, limit_policy_id) IN', lookup)
+
+    def test_batch_query_count_does_not_grow(self):
+        """Test that attaching or detaching 60 pairs costs the same queries as 2"""
+        def run(method, pairs):
+            with CaptureQueriesContext(connection) as captured:
+                response = getattr(self.client, method)(reverse('plans_limit_policies_view'), pairs, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(captured.captured_queries)
+
+        few = [self.pair(self.plans[1].id, policy.id) for policy in self.policies[:2]]
+        many = [self.pair(plan.id, policy.id) for plan in self.plans for policy in self.policies]
+
+        self.assertEqual(run('post', few), run('post', many))
+        self.assertEqual(PlansLimitPolicies.objects.count(), len(many))
+        self.assertEqual(run('delete', few), run('delete', many[2:]))
+        self.assertEqual(
+            set(PlansLimitPolicies.objects.values_list('plan_id', 'limit_policy_id')),
+            {(self.plans[0].id, self.policies[0].id), (self.plans[0].id, self.policies[1].id)}
+        )
+
+    def test_invalid_batches_are_rejected(self):
+        """Test that malformed, empty or oversized batches answer 400 and change nothing"""
+        oversized = [self.pair(self.plans[1].id, self.policies[1].id)] * 1001
+        for pairs in ([], [{'plan_id': 'not-a-uuid', 'policy_id': str(self.policies[1].id)}], oversized):
+            for method in ('post', 'delete'):
+                with self.subTest(method=method, size=len(pairs)):
+                    response = getattr(self.client, method)(reverse('plans_limit_policies_view'), pairs, format='json')
+
+                    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(PlansLimitPolicies.objects.count(), 1)
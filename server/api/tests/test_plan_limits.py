@@ -0,0 +1,132 @@
+"""
+Tests for the plans.limits snapshot maintained by database triggers.
+"""
+
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from api.models import LimitPolicies, Plans, PlansLimitPolicies
+from api.tests.base import AuthAPITests
+
+
+class PlanLimitsSnapshotTests(AuthAPITests):
+    """Test cases for keeping Plans.limits consistent with the plan's limit policies"""
+
+    def setUp(self):
+        super().setUp()
+        self.users_policy = self.create_policy('max_users', 10)
+        self.projects_policy = self.create_policy('max_projects', 3)
+        self.plan = Plans.objects.create(
+            name="Basic Plan",
+            billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+            billing_duration=1,
+            price=9.99,
+            created_by=self.test_admin
+        )
+        refresh = RefreshToken.for_user(self.test_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def create_policy(self, metric, limit):
+        return LimitPolicies.objects.create(metric=metric, limit=limit, created_by=self.test_admin)
+
+    def limits(self, plan=None):
+        return Plans.objects.values_list('limits', flat=True).get(pk=(plan or self.plan).pk)
+
+    def link(self, *policies):
+        PlansLimitPolicies.objects.bulk_create([
+            PlansLimitPolicies(plan=self.plan, limit_policy=policy) for policy in policies
+        ])
+
+    def test_new_plan_has_no_limits(self):
+        """Test that a plan without policies has an empty snapshot"""
+        self.assertEqual(self.limits(), {})
+
+    def test_plan_create_and_update_through_api(self):
+        """Test that PlanSerializer.create and .update leave the snapshot in the response"""
+        response = self.client.post(reverse('plans_view'), {
+            'name': 'Premium Plan',
+            'billing_cycle': SubscriptionsBillingCycle.MONTHLY.value,
+            'billing_duration': 1,
+            'price': 19.99,
+            'policy_ids': [str(self.users_policy.id), str(self.projects_policy.id)],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['limits'], {'max_users': 10, 'max_projects': 3})
+
+        response = self.client.put(
+            reverse('plan_detail', kwargs={'pk': response.data['id']}),
+            {'policy_ids': [str(self.projects_policy.id)]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['limits'], {'max_projects': 3})
+
+    def test_limit_policy_update_and_delete(self):
+        """Test that LimitPoliciesView.put and .delete refresh the plans using the policy"""
+        self.link(self.users_policy, self.projects_policy)
+
+        self.client.put(
+            reverse('limit_policy_detail', kwargs={'pk': self.users_policy.id}),
+            {'limit': 25},
+            format='json'
+        )
+        self.assertEqual(self.limits(), {'max_users': 25, 'max_projects': 3})
+
+        self.client.delete(reverse('limit_policy_detail', kwargs={'pk': self.projects_policy.id}))
+        self.assertEqual(self.limits(), {'max_users': 25})
+
+    def test_plan_limit_policy_view(self):
+        """Test that single and batch link changes through PlanLimitPolicyView refresh the plan"""
+        url = reverse('plans_limit_policies_view')
+
+        response = self.client.post(url, {
+            'plan_id': str(self.plan.id),
+            'policy_id': str(self.users_policy.id),
+        }, format='json')
+        self.assertEqual(response.data['plan']['limits'], {'max_users': 10})
+
+        self.client.post(url, [{'plan_id': str(self.plan.id), 'policy_id': str(self.projects_policy.id)}], format='json')
+        self.assertEqual(self.limits(), {'max_users': 10, 'max_projects': 3})
+
+        self.client.delete(url, {'plan_id': str(self.plan.id), 'policy_id': str(self.users_policy.id)}, format='json')
+        self.assertEqual(self.limits(), {'max_projects': 3})
+
+        self.client.delete(url, [{'plan_id': str(self.plan.id), 'policy_id': str(self.projects_policy.id)}], format='json')
+        self.assertEqual(self.limits(), {})
+
+    def test_highest_limit_of_a_metric_applies(self):
+        """Test that a plan linked to two policies of one metric gets the higher limit"""
+        self.link(self.users_policy, self.create_policy('max_users', 50))
+
+        self.assertEqual(self.limits(), {'max_users': 50})
+
+    def test_only_touched_plans_are_refreshed(self):
+        """Test that changing a policy leaves plans that do not use it alone"""
+        other = Plans.objects.create(
+            name="Other Plan",
+            billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+            billing_duration=1,
+            price=1,
+            created_by=self.test_admin
+        )
+        PlansLimitPolicies.objects.create(plan=other, limit_policy=self.projects_policy)
+        self.link(self.users_policy)
+        updated_at = Plans.objects.values_list('updated_at', flat=True).get(pk=other.pk)
+
+        LimitPolicies.objects.filter(pk=self.users_policy.pk).update(limit=11)
+
+        self.assertEqual(self.limits(), {'max_users': 11})
+        self.assertEqual(self.limits(other), {'max_projects': 3})
+        self.assertEqual(Plans.objects.values_list('updated_at', flat=True).get(pk=other.pk), updated_at)
+
+    def test_saving_a_stale_instance_keeps_the_snapshot(self):
+        """Test that Plans.save() never writes back the limits it was loaded with"""
+        stale = Plans.objects.get(pk=self.plan.pk)
+        self.link(self.users_policy)
+
+        stale.price = 12
+        stale.save()
+
+        self.assertEqual(self.limits(), {'max_users': 10})
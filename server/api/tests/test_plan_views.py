@@ -1,3 +1,6 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -262,3 +265,158 @@ class PlanViewTests(AuthAPITests):
         response = self.client.delete(url)
         
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(CATALOG_CACHE={'ENABLED': False})
+class PlanListQueryBudgetTests(AuthAPITests):
+    """Test that serializing the plan list costs a fixed number of queries"""
+
+    # Authenticated user, RLS context, catalog version for the ETag, plans,
+    # plan-policy links with their policies
+    QUERY_BUDGET = 5
+
+    def setUp(self):
+        super().setUp()
+        self.policies = LimitPolicies.objects.bulk_create([
+            LimitPolicies(metric=metric, limit=10, created_by=self.test_admin)
+            for metric in LimitPoliciesMetrics.values
+        ])
+        refresh = RefreshToken.for_user(self.test_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def create_plans(self, count):
+        plans = Plans.objects.bulk_create([
+            Plans(
+                name=f"Plan {i}",
+                billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+                billing_duration=1,
+                price=9.99,
+                created_by=self.test_admin
+            )
+            for i in range(count)
+        ])
+        PlansLimitPolicies.objects.bulk_create([
+            PlansLimitPolicies(plan=plan, limit_policy=policy)
+            for plan in plans
+            for policy in self.policies
+        ])
+
+    def test_plan_list_query_count_is_fixed(self):
+        """Test that GET /api/plans/ with 1,000 plans stays within the query budget"""
+        self.create_plans(1000)
+
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(reverse('plans_view'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1000)
+        for plan in response.data:
+            self.assertEqual(len(plan['associated_policies']), len(self.policies))
+            self.assertEqual(
+                sorted(plan['associated_policy_ids']),
+                sorted(str(policy['id']) for policy in plan['associated_policies'])
+            )
+
+    def test_plan_detail_query_count(self):
+        """Test that a single plan is served with the same budget"""
+        self.create_plans(1)
+        plan = Plans.objects.get()
+
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(reverse('plan_detail', kwargs={'pk': plan.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['associated_policies']), len(self.policies))
+
+
+class PlanPolicyAssociationTests(AuthAPITests):
+    """Test that plan policies are validated and written as sets"""
+
+    def setUp(self):
+        super().setUp()
+        self.policies = LimitPolicies.objects.bulk_create([
+            LimitPolicies(metric=LimitPoliciesMetrics.MAX_USERS, limit=limit, created_by=self.test_admin)
+            for limit in range(60)
+        ])
+        self.plan = Plans.objects.create(
+            name="Bulk Plan",
+            billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+            billing_duration=1,
+            price=9.99,
+            created_by=self.test_admin
+        )
+        PlansLimitPolicies.objects.bulk_create([
+            PlansLimitPolicies(plan=self.plan, limit_policy=policy) for policy in self.policies[:50]
+        ])
+        refresh = RefreshToken.for_user(self.test_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def link_ids(self):
+        return dict(self.plan.plan_limit_policies.values_list('limit_policy_id', 'id'))
+
+    def test_update_only_touches_changed_links(self):
+        """Test that kept links survive an update and the query count does not grow with the policies"""
+        before = self.link_ids()
+        wanted = [str(policy.id) for policy in self.policies[25:60]]
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.put(
+                reverse('plan_detail', kwargs={'pk': self.plan.id}),
+                {'policy_ids': wanted},
+                format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.data['associated_policy_ids']), sorted(wanted))
+        self.assertLess(len(captured.captured_queries), 20)
+
+        after = self.link_ids()
+        for policy in self.policies[25:50]:
+            self.assertEqual(after[policy.id], before[policy.id])
+        self.assertFalse(any(policy.id in after for policy in self.policies[:25]))
+
+    def test_create_links_policies_with_one_insert(self):
+        """Test that creating a plan with 50 policies costs a fixed number of queries"""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse('plans_view'), {
+                'name': 'Fifty Policies',
+                'billing_cycle': SubscriptionsBillingCycle.MONTHLY.value,
+                'billing_duration': 1,
+                'price': 19.99,
+                'policy_ids': [str(policy.id) for policy in self.policies[:50]],
+            }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['associated_policy_ids']), 50)
+        inserts = [query for query in captured.captured_queries if query['sql'].startswith('INSERT INTO "plans_limit_policies"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertLess(len(captured.captured_queries), 20)
+
+    def test_invalid_ids_are_reported_together(self):
+        """Test that every unknown policy ID is reported and nothing is written"""
+        missing = ['00000000-0000-0000-0000-000000000001', '00000000-0000-0000-0000-000000000002']
+        before = self.link_ids()
+
+        response = self.client.put(
+            reverse('plan_detail', kwargs={'pk': self.plan.id}),
+            {'policy_ids': [str(self.policies[0].id), *missing]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for policy_id in missing:
+            self.assertIn(policy_id, response.data['error'])
+        self.assertEqual(self.link_ids(), before)
+
+    def test_duplicate_ids_are_linked_once(self):
+        """Test that a policy listed twice is linked once"""
+        policy_id = str(self.policies[55].id)
+
+        response = self.client.put(
+            reverse('plan_detail', kwargs={'pk': self.plan.id}),
+            {'policy_ids': [policy_id, policy_id]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['associated_policy_ids'], [policy_id])
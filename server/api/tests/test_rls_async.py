@@ -0,0 +1,151 @@
+"""
+Tests for the async (ASGI) request path of the RLS middlewares.
+"""
+
+import asyncio
+
+from asgiref.sync import ThreadSensitiveContext, iscoroutinefunction, sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.enums.role import Role
+from api.middleware import (
+    DatabaseInstrumentationMiddleware,
+    LazyRLSContext,
+    PostgreSQLRLSMiddleware,
+    RLSConnectionMiddleware,
+)
+from api.serializers import UserSerializer
+from api.tests.base import AuthAPITests
+from api.utils.rls_utils import RLSUtils
+from api.utils.instrumentation import QueryInstrumentation
+
+
+def create_user(email, role):
+    return UserSerializer().create({'email': email, 'name': email.split('@')[0], 'role': role})
+
+
+class TestAsyncRLSMiddleware(TestCase):
+    """Test cases for PostgreSQLRLSMiddleware.__acall__"""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.factory = AsyncRequestFactory()
+        self.test_user = create_user('async@example.com', Role.TENANT_USER)
+        self.observed = []
+        RLSUtils.clear_rls_context()
+
+    async def view(self, request):
+        """Async stand-in view recording the RLS context its ORM calls run with."""
+        context = await sync_to_async(RLSUtils.get_current_rls_context)()
+        self.observed.append(context['current_user_id'])
+        return HttpResponse()
+
+    def request_for(self, user):
+        request = self.factory.get('/')
+        request.user = user
+        return request
+
+    def test_middleware_is_async_with_async_view(self):
+        """Test that the middleware runs async, without adapting an async view."""
+        self.assertTrue(iscoroutinefunction(PostgreSQLRLSMiddleware(self.view)))
+        self.assertTrue(iscoroutinefunction(RLSConnectionMiddleware(self.view)))
+        self.assertTrue(iscoroutinefunction(DatabaseInstrumentationMiddleware(self.view)))
+
+    async def test_context_is_installed_on_worker_thread_connection(self):
+        """Test that the ORM calls of the view see the request's identity."""
+        response = await PostgreSQLRLSMiddleware(self.view)(self.request_for(self.test_user))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.observed, [str(self.test_user.id)])
+
+    @override_settings(RLS={'SINGLE_STATEMENT': True, 'LAZY': True})
+    async def test_lazy_context_is_removed_after_request(self):
+        """Test that the lazy wrapper is removed from the worker thread's connection."""
+        await PostgreSQLRLSMiddleware(self.view)(self.request_for(self.test_user))
+
+        wrappers = await sync_to_async(lambda: list(connection.execute_wrappers))()
+        self.assertEqual(self.observed, [str(self.test_user.id)])
+        self.assertFalse(any(isinstance(wrapper, LazyRLSContext) for wrapper in wrappers))
+
+    async def test_instrumentation_wrapper_is_removed_after_request(self):
+        """Test that the instrumentation wrapper is removed and the request measured."""
+        middleware = DatabaseInstrumentationMiddleware(PostgreSQLRLSMiddleware(self.view))
+        response = await middleware(self.request_for(self.test_user))
+
+        wrappers = await sync_to_async(lambda: list(connection.execute_wrappers))()
+        self.assertIn('rls;dur=', response['Server-Timing'])
+        self.assertFalse(any(isinstance(wrapper, QueryInstrumentation) for wrapper in wrappers))
+
+    @override_settings(RLS={'SCOPE': 'transaction'})
+    def test_transaction_scope_is_rejected(self):
+        """Test that the transaction scope cannot be combined with the async path."""
+        with self.assertRaises(ImproperlyConfigured):
+            PostgreSQLRLSMiddleware(self.view)
+
+
+class TestConcurrentAsyncRequests(TransactionTestCase):
+    """
+    Test cases for interleaved requests, each in its own thread-sensitive
+    context as the ASGI handler runs them.
+    """
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.user_a = create_user('async_a@example.com', Role.TENANT_ADMIN)
+        self.user_b = create_user('async_b@example.com', Role.TENANT_USER)
+
+    async def serve(self, user, started, installed):
+        """Serve one request whose view yields to the other request between two queries."""
+        observed = []
+
+        async def view(request):
+            observed.append((await sync_to_async(RLSUtils.get_current_rls_context)())['current_user_id'])
+            installed.set()
+            await started.wait()
+            observed.append((await sync_to_async(RLSUtils.get_current_rls_context)())['current_user_id'])
+            # Resolve the connection on the worker thread, not the event loop.
+            await sync_to_async(lambda: connection.close())()
+            return HttpResponse()
+
+        request = AsyncRequestFactory().get('/')
+        request.user = user
+        async with ThreadSensitiveContext():
+            await PostgreSQLRLSMiddleware(view)(request)
+        return observed
+
+    async def serve_interleaved(self):
+        a_installed, b_installed = asyncio.Event(), asyncio.Event()
+        return await asyncio.gather(
+            self.serve(self.user_a, b_installed, a_installed),
+            self.serve(self.user_b, a_installed, b_installed),
+        )
+
+    def test_interleaved_requests_keep_their_own_identity(self):
+        """Test that a request never observes the identity of a request running concurrently."""
+        # Run on a plain event loop, as the ASGI server does; under async_to_sync
+        # every thread-sensitive call would go back to the test's own thread.
+        observed_a, observed_b = asyncio.run(self.serve_interleaved())
+
+        self.assertEqual(observed_a, [str(self.user_a.id)] * 2)
+        self.assertEqual(observed_b, [str(self.user_b.id)] * 2)
+
+
+class TestAsyncClientRequests(AuthAPITests):
+    """Test cases for API requests through the async handler."""
+
+    async def test_plans_listing_through_async_handler(self):
+        """Test that an authenticated API request is served by the async middleware chain."""
+        token = await sync_to_async(RefreshToken.for_user)(self.test_admin)
+
+        response = await self.async_client.get(
+            reverse('plans_view'),
+            headers={'authorization': f'Bearer {token.access_token}'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('rls;dur=', response['Server-Timing'])
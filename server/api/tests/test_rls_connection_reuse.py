@@ -0,0 +1,157 @@
+"""
+Tests for RLS isolation on persistent (CONN_MAX_AGE) connections.
+"""
+
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.enums.role import Role
+from api.middleware import LazyRLSContext, PostgreSQLRLSMiddleware
+from api.serializers import UserSerializer
+from api.utils.rls_utils import RLSUtils, is_rls_context_statement
+
+
+MODES = {
+    'single_statement': {'SINGLE_STATEMENT': True, 'LAZY': False},
+    'legacy': {'SINGLE_STATEMENT': False, 'LAZY': False},
+    'lazy': {'SINGLE_STATEMENT': True, 'LAZY': True},
+}
+
+
+class TestRLSConnectionReuse(TransactionTestCase):
+    """
+    Test cases for requests served one after another on the same server
+    connection, as they are with ``CONN_MAX_AGE`` > 0.
+
+    TransactionTestCase keeps the connection in autocommit, so session
+    variables set by one request are still on the connection for the next.
+    """
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.factory = RequestFactory()
+        serializer = UserSerializer()
+        self.user_a = serializer.create({
+            'email': 'reuse_a@example.com',
+            'name': 'User A',
+            'role': Role.TENANT_ADMIN
+        })
+        self.user_b = serializer.create({
+            'email': 'reuse_b@example.com',
+            'name': 'User B',
+            'role': Role.TENANT_USER
+        })
+        self.observed = []
+
+    def tearDown(self):
+        """Clean up after tests."""
+        RLSUtils.clear_rls_context()
+
+    def view(self, request):
+        """Stand-in view recording the RLS context it runs with."""
+        self.observed.append(RLSUtils.get_current_rls_context()['current_user_id'])
+        return HttpResponse()
+
+    def serve(self, user=None):
+        """Serve a request the way the handler does: request_started, then the middleware."""
+        request = self.factory.get('/')
+        request.user = user
+        request_started.send(sender=self.__class__)
+        return PostgreSQLRLSMiddleware(self.view)(request)
+
+    def backend_pid(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            return cursor.fetchone()[0]
+
+    def test_persistent_connections_are_configured(self):
+        """Test that connections are kept between requests and checked before reuse."""
+        database = settings.DATABASES['default']
+        self.assertGreater(database['CONN_MAX_AGE'], 0)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+
+    def test_request_never_observes_previous_user(self):
+        """Test that user B, then an anonymous request, never see user A's id on a reused connection."""
+        for mode, rls in MODES.items():
+            with self.subTest(mode=mode), override_settings(RLS=rls):
+                self.observed.clear()
+                pid = self.backend_pid()
+
+                self.serve(self.user_a)
+                self.serve(self.user_b)
+                self.serve(None)
+
+                self.assertEqual(self.backend_pid(), pid)
+                self.assertEqual(self.observed, [str(self.user_a.id), str(self.user_b.id), None])
+
+    def test_query_before_middleware_runs_without_previous_identity(self):
+        """Test that a query issued before the RLS middleware on a reused connection sees no identity."""
+        self.serve(self.user_a)
+
+        request_started.send(sender=self.__class__)
+        context = RLSUtils.get_current_rls_context()
+
+        self.assertIsNone(context['current_user_id'])
+        self.assertIsNone(context['current_user_role'])
+
+    def test_checkout_guard_costs_nothing_when_middleware_runs(self):
+        """Test that a request reaching the middleware only sends its own RLS statement."""
+        self.serve(self.user_a)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.serve(self.user_b)
+
+        rls_statements = [query for query in captured.captured_queries if is_rls_context_statement(query['sql'])]
+        self.assertEqual(len(rls_statements), 1)
+        self.assertEqual(self.observed[-1], str(self.user_b.id))
+
+    def test_guard_is_removed_after_request(self):
+        """Test that the checkout guard does not outlive the request."""
+        self.serve(self.user_a)
+        self.serve(self.user_b)
+
+        self.assertIsNone(connection.rls_checkout_guard)
+        self.assertFalse(any(isinstance(wrapper, LazyRLSContext) for wrapper in connection.execute_wrappers))
+
+    @override_settings(RLS={'SINGLE_STATEMENT': True, 'LAZY': False})
+    def test_failed_reset_fails_closed(self):
+        """Test that a request whose context cannot be installed is rejected and its connection discarded."""
+        self.serve(self.user_a)
+
+        with patch.object(PostgreSQLRLSMiddleware, '_install_session_context', side_effect=Exception("Database error")), \
+             patch('api.middleware.logger'):
+            response = self.serve(self.user_b)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.observed, [str(self.user_a.id)])
+        self.assertIsNone(connection.connection)
+        self.assertIsNone(RLSUtils.get_current_rls_context()['current_user_id'])
+
+    @override_settings(RLS={'SINGLE_STATEMENT': True, 'LAZY': True})
+    def test_lazy_context_is_reinstalled_after_its_transaction_rolls_back(self):
+        """Test that a transaction after a rolled back one at the same depth does not see user A's id."""
+        self.serve(self.user_a)
+
+        def view(request):
+            try:
+                with transaction.atomic():
+                    RLSUtils.get_current_rls_context()
+                    raise RuntimeError("rollback")
+            except RuntimeError:
+                pass
+            with transaction.atomic():
+                self.observed.append(RLSUtils.get_current_rls_context()['current_user_id'])
+            return HttpResponse()
+
+        request = self.factory.get('/')
+        request.user = self.user_b
+        request_started.send(sender=self.__class__)
+        PostgreSQLRLSMiddleware(view)(request)
+
+        self.assertEqual(self.observed, [str(self.user_a.id), str(self.user_b.id)])
@@ -2,15 +2,25 @@
 Tests for PostgreSQL RLS middleware functionality.
 """
 
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from django.db import connection
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from rest_framework_simplejwt.tokens import RefreshToken
 from unittest.mock import patch, MagicMock
 import uuid
 
-from api.serializers import UserSerializer
-from api.middleware import PostgreSQLRLSMiddleware, RLSDebugMiddleware
-from api.utils.rls_utils import RLSUtils
+from api.serializers import UserSerializer, CustomTokenObtainPairSerializer
+from api.middleware import (
+    PostgreSQLRLSMiddleware,
+    RLSDebugMiddleware,
+    RLSConnectionMiddleware,
+    LazyRLSContext,
+)
+from api.models import Users
+from api.utils.rls_utils import RLSUtils, check_rls_on_connect
+from api.utils.metrics import render_metrics
 from api.enums.role import Role
 
 
@@ -89,8 +99,8 @@ class TestPostgreSQLRLSMiddleware(TestCase):
         self.assertNotEqual(context['current_user_id'], 'old-user-id')
         self.assertNotEqual(context['current_user_role'], 'old-role')
     
-    def test_middleware_handles_database_errors_gracefully(self):
-        """Test that middleware handles database errors gracefully."""
+    def test_middleware_fails_closed_on_database_errors(self):
+        """Test that a request is rejected when its RLS context cannot be installed."""
         request = self.factory.get('/')
         request.user = self.test_user
         
@@ -101,13 +111,94 @@ class TestPostgreSQLRLSMiddleware(TestCase):
             mock_cursor.execute.side_effect = Exception("Database error")
             mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
             
-            # Should not raise exception
+            # Should not raise exception, nor run with a stale context
             result = self.middleware.process_request(request)
-            self.assertIsNone(result)  # Request should continue processing
+            self.assertEqual(result.status_code, 503)
             
             # Verify that errors were logged (but suppressed from output)
             self.assertTrue(mock_logger.error.called)
     
+    def test_single_statement_mode_uses_one_query(self):
+        """Test that the whole RLS context is installed with a single statement."""
+        request = self.factory.get('/')
+        request.user = self.test_user
+        
+        with override_settings(RLS={'SINGLE_STATEMENT': True}):
+            with CaptureQueriesContext(connection) as captured:
+                self.middleware.process_request(request)
+        
+        self.assertEqual(len(captured.captured_queries), 1)
+        context = RLSUtils.get_current_rls_context()
+        self.assertEqual(context['current_user_id'], str(self.test_user.id))
+        self.assertEqual(context['current_user_role'], self.test_user.role)
+    
+    def test_single_statement_mode_resets_anonymous_context(self):
+        """Test that the single statement also resets the context for anonymous users."""
+        RLSUtils.set_rls_context(str(uuid.uuid4()), Role.PLATFORM_ADMIN)
+        request = self.factory.get('/')
+        request.user = MagicMock()
+        request.user.is_authenticated = False
+        
+        with override_settings(RLS={'SINGLE_STATEMENT': True}):
+            with CaptureQueriesContext(connection) as captured:
+                self.middleware.process_request(request)
+        
+        self.assertEqual(len(captured.captured_queries), 1)
+        context = RLSUtils.get_current_rls_context()
+        self.assertIn(context['current_user_id'], [None, ''])
+        self.assertIn(context['current_user_role'], [None, ''])
+    
+    def test_middleware_reads_identity_from_access_token(self):
+        """Test that JWT-authenticated requests get their RLS context installed."""
+        token = CustomTokenObtainPairSerializer.get_token(self.test_user).access_token
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        request.user = AnonymousUser()
+        
+        with CaptureQueriesContext(connection) as captured:
+            self.middleware.process_request(request)
+        
+        self.assertEqual(len(captured.captured_queries), 1)
+        context = RLSUtils.get_current_rls_context()
+        self.assertEqual(context['current_user_id'], str(self.test_user.id))
+        self.assertEqual(context['current_user_role'], self.test_user.role)
+    
+    def test_middleware_resolves_role_missing_from_access_token(self):
+        """Test that the role is looked up in the database when the token lacks it."""
+        token = RefreshToken.for_user(self.test_user).access_token
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        request.user = AnonymousUser()
+        
+        self.middleware.process_request(request)
+        
+        context = RLSUtils.get_current_rls_context()
+        self.assertEqual(context['current_user_id'], str(self.test_user.id))
+        self.assertEqual(context['current_user_role'], self.test_user.role)
+    
+    def test_middleware_ignores_invalid_access_token(self):
+        """Test that an invalid token leaves the request anonymous."""
+        RLSUtils.set_rls_context(str(uuid.uuid4()), Role.PLATFORM_ADMIN)
+        request = self.factory.get('/', HTTP_AUTHORIZATION='Bearer not-a-token')
+        request.user = AnonymousUser()
+        
+        self.middleware.process_request(request)
+        
+        context = RLSUtils.get_current_rls_context()
+        self.assertIn(context['current_user_id'], [None, ''])
+        self.assertIn(context['current_user_role'], [None, ''])
+    
+    def test_legacy_mode_uses_separate_statements(self):
+        """Test that disabling the single statement mode keeps the per-variable statements."""
+        request = self.factory.get('/')
+        request.user = self.test_user
+        
+        with override_settings(RLS={'SINGLE_STATEMENT': False}):
+            with CaptureQueriesContext(connection) as captured:
+                self.middleware.process_request(request)
+        
+        self.assertEqual(len(captured.captured_queries), 6)
+        context = RLSUtils.get_current_rls_context()
+        self.assertEqual(context['current_user_id'], str(self.test_user.id))
+    
     def test_process_response_returns_response(self):
         """Test that process_response returns the response unchanged."""
         request = self.factory.get('/')
@@ -117,6 +208,102 @@ class TestPostgreSQLRLSMiddleware(TestCase):
         self.assertEqual(result, response)
 
 
+@override_settings(RLS={'SINGLE_STATEMENT': True, 'LAZY': True})
+class TestLazyRLSContext(TestCase):
+    """Test cases for the lazy RLS middleware mode."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.factory = RequestFactory()
+        self.middleware = PostgreSQLRLSMiddleware(get_response=lambda r: None)
+        
+        serializer = UserSerializer()
+        self.test_user = serializer.create({
+            'email': 'lazy@example.com',
+            'name': 'Lazy User',
+            'role': Role.TENANT_USER
+        })
+        RLSUtils.clear_rls_context()
+        
+        self.request = self.factory.get('/')
+        self.request.user = self.test_user
+    
+    def tearDown(self):
+        """Remove any wrapper left behind by a failing test."""
+        connection.execute_wrappers[:] = [
+            wrapper for wrapper in connection.execute_wrappers
+            if not isinstance(wrapper, LazyRLSContext)
+        ]
+    
+    def test_process_request_does_not_query(self):
+        """Test that the lazy mode does not talk to the database up front."""
+        with CaptureQueriesContext(connection) as captured:
+            self.middleware.process_request(self.request)
+        
+        self.assertEqual(len(captured.captured_queries), 0)
+    
+    def test_context_is_installed_before_first_query_only(self):
+        """Test that the context is sent in front of the first query and only once."""
+        self.middleware.process_request(self.request)
+        
+        with CaptureQueriesContext(connection) as captured:
+            Users.objects.count()
+            Users.objects.count()
+        
+        self.assertEqual(len(captured.captured_queries), 3)
+        self.assertIn('set_config', captured.captured_queries[0]['sql'])
+        
+        context = RLSUtils.get_current_rls_context()
+        self.assertEqual(context['current_user_id'], str(self.test_user.id))
+        self.assertEqual(context['current_user_role'], self.test_user.role)
+    
+    def test_context_is_reinstalled_after_rollback(self):
+        """Test that a context lost to a rolled back block is installed again."""
+        self.middleware.process_request(self.request)
+        
+        try:
+            with transaction.atomic():
+                Users.objects.count()
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            pass
+        
+        context = RLSUtils.get_current_rls_context()
+        self.assertEqual(context['current_user_id'], str(self.test_user.id))
+
+    def test_context_survives_released_block(self):
+        """Test that a context installed in a block that was released is not sent again."""
+        with transaction.atomic():
+            self.middleware.process_request(self.request)
+            Users.objects.count()
+
+        with CaptureQueriesContext(connection) as captured:
+            with transaction.atomic():
+                context = RLSUtils.get_current_rls_context()
+
+        self.assertFalse(any('set_config' in query['sql'] for query in captured.captured_queries))
+        self.assertEqual(context['current_user_id'], str(self.test_user.id))
+
+    def test_rejected_request_does_not_query(self):
+        """Test that a request rejected before reaching the ORM never talks to the database."""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/plans/')
+        
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(len(captured.captured_queries), 0)
+    
+    def test_process_response_removes_wrapper(self):
+        """Test that the wrapper does not outlive the request."""
+        self.middleware.process_request(self.request)
+        self.middleware.process_response(self.request, MagicMock())
+        
+        with CaptureQueriesContext(connection) as captured:
+            Users.objects.count()
+        
+        self.assertEqual(len(captured.captured_queries), 1)
+        self.assertNotIn('set_config', captured.captured_queries[0]['sql'])
+
+
 class TestRLSUtils(TestCase):
     """Test cases for RLS utility functions."""
     
@@ -219,6 +406,103 @@ class TestRLSDebugMiddleware(TestCase):
         mock_logger.debug.assert_called()
 
 
+class TestRLSConnectionCheck(TestCase):
+    """Test cases for the per-connection RLS catalog check."""
+    
+    def setUp(self):
+        """Set up test fixtures."""
+        self.factory = RequestFactory()
+        self.middleware = RLSConnectionMiddleware(get_response=lambda r: None)
+        connection.ensure_connection()
+        
+        serializer = UserSerializer()
+        self.admin = serializer.create({
+            'email': 'health_admin@example.com',
+            'name': 'Health Admin',
+            'role': Role.PLATFORM_ADMIN
+        })
+        self.tenant_user = serializer.create({
+            'email': 'health_user@example.com',
+            'name': 'Health User',
+            'role': Role.TENANT_USER
+        })
+        RLSUtils.clear_rls_context()
+    
+    def auth_header(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {str(RefreshToken.for_user(user).access_token)}'}
+    
+    def test_check_rls_enabled_uses_one_query(self):
+        """Test that all tables are checked with a single catalog query."""
+        with CaptureQueriesContext(connection) as captured:
+            status = RLSUtils.check_rls_enabled()
+        
+        self.assertEqual(len(captured.captured_queries), 1)
+        self.assertTrue(all(status.values()))
+    
+    def test_cached_check_does_not_query(self):
+        """Test that the cached status is served without touching the database."""
+        RLSUtils.check_rls_enabled()
+        
+        with CaptureQueriesContext(connection) as captured:
+            status = RLSUtils.check_rls_enabled(cached=True)
+        
+        self.assertEqual(len(captured.captured_queries), 0)
+        self.assertIn('users', status)
+    
+    def test_connection_created_records_status(self):
+        """Test that the connection_created receiver records the status and metrics."""
+        check_rls_on_connect(sender=connection.__class__, connection=connection)
+        
+        status = RLSUtils.get_rls_status()
+        self.assertTrue(status['healthy'])
+        self.assertIsNotNone(status['checked_at'])
+        self.assertIn('eshtarek_rls_enabled{table="users"} 1', render_metrics())
+    
+    def test_middleware_does_not_query_per_request(self):
+        """Test that the connection middleware no longer queries the catalog."""
+        with CaptureQueriesContext(connection) as captured:
+            for _ in range(3):
+                self.middleware.process_request(self.factory.get('/'))
+        
+        self.assertEqual(len(captured.captured_queries), 0)
+    
+    def test_health_endpoint_reports_status(self):
+        """Test that the health endpoint reports the RLS status of every table."""
+        RLSUtils.check_rls_enabled()
+        
+        response = self.client.get('/api/health/rls/', **self.auth_header(self.admin))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'ok')
+        self.assertTrue(response.json()['rls']['users'])
+    
+    @patch('api.utils.rls_utils.RLSUtils.get_rls_status')
+    def test_health_endpoint_degraded_when_rls_disabled(self, mock_status):
+        """Test that a table without RLS makes the health endpoint fail."""
+        mock_status.return_value = {'tables': {'users': False}, 'healthy': False, 'checked_at': 0}
+        
+        response = self.client.get('/api/health/rls/', **self.auth_header(self.admin))
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'degraded')
+    
+    def test_metrics_endpoint(self):
+        """Test that the metrics endpoint exposes the RLS gauges."""
+        RLSUtils.check_rls_enabled()
+        
+        response = self.client.get('/api/metrics/', **self.auth_header(self.admin))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('eshtarek_rls_enabled', response.content.decode())
+    
+    def test_monitoring_endpoints_require_admin(self):
+        """Test that anonymous and non-admin callers cannot read the health and metrics endpoints."""
+        for url in ('/api/health/rls/', '/api/metrics/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 401)
+                self.assertEqual(self.client.get(url, **self.auth_header(self.tenant_user)).status_code, 403)
+
+
 class TestMiddlewareIntegration(TestCase):
     """Integration tests for middleware with Django request processing."""
     
@@ -0,0 +1,90 @@
+"""
+Tests for the RLS overhead benchmark command.
+"""
+
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from api.enums.role import Role
+from api.models import Subscriptions, Tenants, Usages, Users
+
+
+class TestRLSOverheadCommand(TestCase):
+    """Test the RLS overhead benchmark on a tiny dataset."""
+
+    scale = {
+        'tenants': 3,
+        'users': 9,
+        'usages': 60,
+        'plans': 4,
+        'subscriptions_per_tenant': 2,
+    }
+
+    def run_command(self, **options):
+        out = StringIO()
+        call_command('rls_overhead', stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def run_benchmark(self, **options):
+        output = self.run_command(seed=True, iterations=2, warmup=0, json=True, **self.scale, **options)
+        return json.loads(output)
+
+    def test_seed_builds_dataset_at_requested_scale(self):
+        """Test that the seeded dataset has the requested shape."""
+        report = self.run_benchmark(scenarios=['subscription_detail'], roles=[Role.TENANT_USER], no_explain=True)
+
+        self.assertEqual(report['dataset']['tenants'], 3)
+        self.assertEqual(report['dataset']['users'], 9)
+        self.assertEqual(report['dataset']['subscriptions'], 6)
+        self.assertEqual(report['dataset']['usages'], 60)
+        self.assertEqual(Users.objects.filter(role=Role.TENANT_ADMIN, email__startswith='rls_bench_').count(), 3)
+
+    def test_rls_runs_only_see_the_users_tenant(self):
+        """Test that the RLS runs are filtered by the policies and the bypassed runs are not."""
+        report = self.run_benchmark(scenarios=['subscriptions', 'usages', 'users', 'team'], no_explain=True)
+        results = {(result['scenario'], result['role']): result for result in report['results']}
+
+        for role in (Role.TENANT_ADMIN, Role.TENANT_USER):
+            self.assertEqual(results[('subscriptions', role)]['rls']['rows'], 2)
+            self.assertEqual(results[('subscriptions', role)]['bypass']['rows'], 6)
+            self.assertEqual(results[('usages', role)]['rls']['rows'], 10)
+            self.assertEqual(results[('users', role)]['rls']['rows'], 3)
+            self.assertEqual(results[('team', role)]['rls']['rows'], 3)
+        self.assertEqual(results[('subscriptions', Role.PLATFORM_ADMIN)]['rls']['rows'], 6)
+
+    def test_report_contains_percentiles_and_plans(self):
+        """Test that every result carries latency percentiles and an EXPLAIN plan."""
+        report = self.run_benchmark(scenarios=['plans'], roles=[Role.TENANT_ADMIN])
+        result = report['results'][0]
+
+        for mode in ('rls', 'bypass'):
+            self.assertEqual(result[mode]['latency_ms']['count'], 2)
+            self.assertIn('p99', result[mode]['latency_ms'])
+            self.assertIn('Plan', result[mode]['plan'][0])
+            self.assertIn('Shared Hit Blocks', result[mode]['plan'][0]['Plan'])
+        self.assertIsNotNone(result['overhead_p50_ms'])
+
+    def test_clean_removes_dataset(self):
+        """Test that --clean removes every seeded row."""
+        self.run_benchmark(scenarios=['subscription_detail'], roles=[Role.TENANT_USER], no_explain=True)
+
+        self.run_command(clean=True)
+
+        self.assertFalse(Tenants.objects.filter(name__startswith='rls_bench_').exists())
+        self.assertFalse(Subscriptions.objects.exists())
+        self.assertFalse(Usages.objects.exists())
+        self.assertFalse(Users.objects.filter(email__startswith='rls_bench_').exists())
+
+    def test_requires_dataset(self):
+        """Test that measuring without a seeded dataset fails clearly."""
+        with self.assertRaises(CommandError):
+            self.run_command(iterations=1, warmup=0)
+
+    def test_rejects_more_subscriptions_than_plans(self):
+        """Test that the scale is validated before seeding."""
+        with self.assertRaises(CommandError):
+            self.run_command(seed=True, **{**self.scale, 'subscriptions_per_tenant': 5})
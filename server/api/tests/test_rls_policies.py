@@ -0,0 +1,153 @@
+"""
+Tests for the tenant isolation enforced by the RLS policies.
+
+The test database user owns the tables and bypasses RLS, so the queries run
+under a non-owner role created inside the test transaction.
+"""
+
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from api.enums.role import Role
+from api.enums.limit_policies_metrics import LimitPoliciesMetrics
+from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from api.enums.subscriptions_status import SubscriptionsStatus
+from api.models import Users, Tenants, UserTenants, Plans, Subscriptions, Usages
+from api.utils.rls_utils import RLSContextManager, RLSUtils
+
+
+RLS_TEST_ROLE = 'eshtarek_rls_test'
+
+
+class TestTenantIsolationPolicies(TestCase):
+    """Test that tenant scoped tables only expose the rows of the user's tenants."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Users.objects.create(email='policy_admin@example.com', name='Admin', role=Role.PLATFORM_ADMIN)
+        cls.user_a = Users.objects.create(email='policy_a@example.com', name='User A', role=Role.TENANT_ADMIN)
+        cls.user_b = Users.objects.create(email='policy_b@example.com', name='User B', role=Role.TENANT_USER)
+        cls.teammate = Users.objects.create(email='policy_a2@example.com', name='Teammate', role=Role.TENANT_USER)
+        cls.loner = Users.objects.create(email='policy_loner@example.com', name='Loner', role=Role.TENANT_USER)
+
+        cls.tenant_a = Tenants.objects.create(name='policy_tenant_a')
+        cls.tenant_b = Tenants.objects.create(name='policy_tenant_b')
+        UserTenants.objects.create(user=cls.user_a, tenant=cls.tenant_a)
+        UserTenants.objects.create(user=cls.user_b, tenant=cls.tenant_b)
+        UserTenants.objects.create(user=cls.teammate, tenant=cls.tenant_a)
+
+        plan = Plans.objects.create(
+            name='policy_plan',
+            billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+            billing_duration=1,
+            price=10,
+            created_by=cls.admin,
+        )
+        for user, tenant in ((cls.user_a, cls.tenant_a), (cls.user_b, cls.tenant_b)):
+            subscription = Subscriptions.objects.create(
+                status=SubscriptionsStatus.ACTIVE,
+                created_by_user=user,
+                plan=plan,
+                tenant=tenant,
+            )
+            Usages.objects.create(subscription=subscription, metric=LimitPoliciesMetrics.MAX_USERS, value=1)
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE ROLE {RLS_TEST_ROLE} NOLOGIN")
+            cursor.execute(f"GRANT SELECT ON ALL TABLES IN SCHEMA public TO {RLS_TEST_ROLE}")
+
+    @contextmanager
+    def as_user(self, user=None):
+        """Run a block under the RLS context of ``user`` as the non-owner role."""
+        user_id = str(user.id) if user else None
+        user_role = user.role if user else None
+        with RLSContextManager(user_id, user_role):
+            with connection.cursor() as cursor:
+                cursor.execute(f"SET ROLE {RLS_TEST_ROLE}")
+            try:
+                yield
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute("RESET ROLE")
+
+    def visible_tenants(self, user=None):
+        with self.as_user(user):
+            return {
+                'subscriptions': set(Subscriptions.objects.values_list('tenant_id', flat=True)),
+                'usages': set(Usages.objects.values_list('subscription__tenant_id', flat=True)),
+                'tenants': set(Tenants.objects.values_list('id', flat=True)),
+            }
+
+    def visible_users(self, user):
+        with self.as_user(user):
+            return set(Users.objects.values_list('id', flat=True))
+
+    def test_context_publishes_tenant_ids(self):
+        """Test that the user's tenant IDs are published with the RLS context."""
+        with RLSContextManager(str(self.user_a.id), self.user_a.role):
+            context = RLSUtils.get_current_rls_context()
+
+        self.assertEqual(context['current_tenant_ids'], [self.tenant_a.id])
+
+    def test_tenant_user_sees_only_own_tenant(self):
+        """Test that a tenant user only sees the rows of its own tenant."""
+        visible = self.visible_tenants(self.user_a)
+
+        self.assertEqual(visible['subscriptions'], {self.tenant_a.id})
+        self.assertEqual(visible['usages'], {self.tenant_a.id})
+        self.assertEqual(visible['tenants'], {self.tenant_a.id})
+
+    @override_settings(RLS={'PUBLISH_TENANT_IDS': False})
+    def test_policies_fall_back_without_published_tenant_ids(self):
+        """Test that the policies resolve the tenant IDs themselves when none are published."""
+        with RLSContextManager(str(self.user_b.id), self.user_b.role):
+            self.assertIsNone(RLSUtils.get_current_rls_context()['current_tenant_ids'])
+
+        visible = self.visible_tenants(self.user_b)
+
+        self.assertEqual(visible['subscriptions'], {self.tenant_b.id})
+        self.assertEqual(visible['usages'], {self.tenant_b.id})
+
+    def test_platform_admin_sees_all_tenants(self):
+        """Test that the platform admin role bypasses the tenant filter."""
+        visible = self.visible_tenants(self.admin)
+
+        self.assertEqual(visible['subscriptions'], {self.tenant_a.id, self.tenant_b.id})
+        self.assertEqual(visible['usages'], {self.tenant_a.id, self.tenant_b.id})
+
+    def test_tenant_user_sees_only_own_team(self):
+        """Test that users only see themselves and the users sharing one of their tenants."""
+        team = {self.user_a.id, self.teammate.id}
+
+        self.assertEqual(self.visible_users(self.user_a), team)
+        self.assertEqual(self.visible_users(self.teammate), team)
+        self.assertEqual(self.visible_users(self.user_b), {self.user_b.id})
+
+    def test_user_without_tenant_sees_only_itself(self):
+        """Test that a user outside every tenant only sees its own row."""
+        self.assertEqual(self.visible_users(self.loner), {self.loner.id})
+
+    @override_settings(RLS={'PUBLISH_TENANT_IDS': False})
+    def test_team_falls_back_without_published_tenant_ids(self):
+        """Test that the users policy resolves the team without published tenant IDs."""
+        self.assertEqual(self.visible_users(self.user_a), {self.user_a.id, self.teammate.id})
+
+    def test_platform_admin_sees_all_users(self):
+        """Test that the platform admin role sees every user."""
+        self.assertEqual(self.visible_users(self.admin), set(Users.objects.values_list('id', flat=True)))
+
+    def test_missing_context_sees_no_tenant_rows(self):
+        """Test that a session without an RLS identity sees no tenant rows."""
+        with connection.cursor() as cursor:
+            cursor.execute(f"SET ROLE {RLS_TEST_ROLE}")
+        try:
+            RLSUtils.clear_rls_context()
+            self.assertFalse(Subscriptions.objects.exists())
+            self.assertFalse(Usages.objects.exists())
+            self.assertFalse(Users.objects.exists())
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET ROLE")
@@ -0,0 +1,217 @@
+"""
+Tests for the transaction-scoped RLS context behind a transaction-mode pooler.
+"""
+
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.transaction import TransactionManagementError
+from django.test import RequestFactory, TransactionTestCase, override_settings
+
+from api.enums.role import Role
+from api.middleware import PostgreSQLRLSMiddleware
+from api.serializers import UserSerializer
+from api.utils.rls_utils import RLSContextManager, RLSUtils
+
+
+class TransactionPoolerStandIn:
+    """
+    Local stand-in for a transaction-mode pooler such as PgBouncer.
+
+    A transaction pooler hands a server connection to a client for the
+    duration of one transaction only, and the next transaction of any client
+    may land on the same server session. The stand-in reproduces the worst
+    case: a single server session shared by every client, one transaction
+    at a time. Whatever outlives a transaction is visible to the next client.
+    """
+
+    def __init__(self):
+        self.server_pids = set()
+
+    @contextmanager
+    def client_transaction(self):
+        """Run a block as one client transaction on the shared server session."""
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                self.server_pids.add(cursor.fetchone()[0])
+            yield
+
+    def run_request(self, request, get_response):
+        """
+        Run a request through the RLS middleware on the shared server session.
+
+        In transaction scope the middleware opens the transaction itself, as it
+        would behind the pooler; in session scope every statement autocommits.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            self.server_pids.add(cursor.fetchone()[0])
+        return PostgreSQLRLSMiddleware(get_response)(request)
+
+
+class TestTransactionScopedRLS(TransactionTestCase):
+    """Test cases for RLS['SCOPE'] = 'transaction' behind the pooler stand-in."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.factory = RequestFactory()
+        self.pooler = TransactionPoolerStandIn()
+
+        serializer = UserSerializer()
+        self.user_a = serializer.create({
+            'email': 'pooled_a@example.com',
+            'name': 'Pooled User A',
+            'role': Role.TENANT_ADMIN
+        })
+        self.user_b = serializer.create({
+            'email': 'pooled_b@example.com',
+            'name': 'Pooled User B',
+            'role': Role.TENANT_USER
+        })
+
+        with override_settings(RLS={'SCOPE': 'session'}):
+            RLSUtils.clear_rls_context()
+
+    def request_for(self, user):
+        request = self.factory.get('/')
+        request.user = user
+        return request
+
+    def observe_context(self, request):
+        """View stand-in that records the RLS context it runs under."""
+        request.observed_context = RLSUtils.get_current_rls_context()
+        return request
+
+    def next_client_context(self):
+        """Context seen by an unrelated client in the next pooled transaction."""
+        with self.pooler.client_transaction():
+            return RLSUtils.get_current_rls_context()
+
+    @override_settings(RLS={'SINGLE_STATEMENT': True, 'SCOPE': 'session'})
+    def test_session_scope_leaks_into_next_pooled_transaction(self):
+        """Control: the stand-in exposes the leak a session-scoped context causes."""
+        self.pooler.run_request(self.request_for(self.user_a), self.observe_context)
+
+        leaked = self.next_client_context()
+
+        self.assertEqual(leaked['current_user_id'], str(self.user_a.id))
+        self.assertEqual(len(self.pooler.server_pids), 1)
+
+    @override_settings(RLS={'SINGLE_STATEMENT': True, 'SCOPE': 'transaction'})
+    def test_transaction_scope_is_visible_to_the_request(self):
+        """Test that the view runs under the identity of its request."""
+        request = self.pooler.run_request(self.request_for(self.user_a), self.observe_context)
+
+        self.assertEqual(request.observed_context['current_user_id'], str(self.user_a.id))
+        self.assertEqual(request.observed_context['current_user_role'], self.user_a.role)
+
+    @override_settings(RLS={'SINGLE_STATEMENT': True, 'SCOPE': 'transaction'})
+    def test_transaction_scope_does_not_leak_into_next_pooled_transaction(self):
+        """Test that no identity survives the request's transaction."""
+        self.pooler.run_request(self.request_for(self.user_a), self.observe_context)
+
+        context = self.next_client_context()
+
+        self.assertIsNone(context['current_user_id'])
+        self.assertIsNone(context['current_user_role'])
+        self.assertEqual(len(self.pooler.server_pids), 1)
+
+    @override_settings(RLS={'SINGLE_STATEMENT': True, 'LAZY': True, 'SCOPE': 'transaction'})
+    def test_lazy_transaction_scope_does_not_leak_between_users(self):
+        """Test that interleaved users on one server session only see themselves."""
+        first = self.pooler.run_request(self.request_for(self.user_a), self.observe_context)
+        second = self.pooler.run_request(self.request_for(self.user_b), self.observe_context)
+
+        self.assertEqual(first.observed_context['current_user_id'], str(self.user_a.id))
+        self.assertEqual(second.observed_context['current_user_id'], str(self.user_b.id))
+        self.assertEqual(second.observed_context['current_user_role'], self.user_b.role)
+        self.assertIsNone(self.next_client_context()['current_user_id'])
+
+    @override_settings(RLS={'SINGLE_STATEMENT': False, 'SCOPE': 'transaction'})
+    def test_legacy_statements_follow_transaction_scope(self):
+        """Test that the per-variable statements are transaction scoped too."""
+        request = self.pooler.run_request(self.request_for(self.user_a), self.observe_context)
+
+        self.assertEqual(request.observed_context['current_user_id'], str(self.user_a.id))
+        self.assertIsNone(self.next_client_context()['current_user_id'])
+
+    @override_settings(RLS={'SCOPE': 'transaction'})
+    def test_rollback_discards_context(self):
+        """Test that a rolled back request leaves no identity behind."""
+        def failing_view(request):
+            self.observe_context(request)
+            raise RuntimeError("view failed")
+
+        with self.assertRaises(RuntimeError):
+            self.pooler.run_request(self.request_for(self.user_a), failing_view)
+
+        self.assertIsNone(self.next_client_context()['current_user_id'])
+
+    @override_settings(RLS={'SCOPE': 'transaction'})
+    def test_set_rls_context_requires_a_transaction(self):
+        """Test that a context which would be discarded immediately is refused."""
+        with self.assertRaises(TransactionManagementError):
+            RLSUtils.set_rls_context(str(self.user_a.id), self.user_a.role)
+
+        with self.pooler.client_transaction():
+            RLSUtils.set_rls_context(str(self.user_a.id), self.user_a.role)
+            context = RLSUtils.get_current_rls_context()
+
+        self.assertEqual(context['current_user_id'], str(self.user_a.id))
+        self.assertIsNone(self.next_client_context()['current_user_id'])
+
+    @override_settings(RLS={'SCOPE': 'transaction'})
+    def test_context_manager_scopes_context_to_block(self):
+        """Test that RLSContextManager opens and ends its own transaction."""
+        with RLSContextManager(self.user_b.id, self.user_b.role):
+            inside = RLSUtils.get_current_rls_context()
+
+        self.assertEqual(inside['current_user_id'], str(self.user_b.id))
+        self.assertEqual(inside['current_user_role'], self.user_b.role)
+        self.assertIsNone(self.next_client_context()['current_user_id'])
+
+    @override_settings(RLS={'SCOPE': 'transaction'})
+    def test_context_manager_requires_a_user_or_role(self):
+        """Test that an unconfigured block fails instead of running as a platform admin."""
+        with self.assertRaises(ValueError):
+            RLSContextManager()
+
+        with RLSContextManager(user_role=Role.PLATFORM_ADMIN):
+            inside = RLSUtils.get_current_rls_context()
+
+        self.assertIsNone(inside['current_user_id'])
+        self.assertEqual(inside['current_user_role'], Role.PLATFORM_ADMIN)
+
+    @override_settings(RLS={'SCOPE': 'session'})
+    def test_context_manager_restores_session_context(self):
+        """Test that a nested block puts back the identity of the request it runs in."""
+        RLSUtils.set_rls_context(str(self.user_a.id), self.user_a.role)
+        before = RLSUtils.get_current_rls_context()
+
+        with RLSContextManager(self.user_b.id, self.user_b.role):
+            inside = RLSUtils.get_current_rls_context()
+
+        self.assertEqual(inside['current_user_id'], str(self.user_b.id))
+        self.assertEqual(RLSUtils.get_current_rls_context(), before)
+
+    @override_settings(RLS={'SCOPE': 'transaction'})
+    def test_context_manager_restores_transaction_context(self):
+        """Test that a block nested in a request's transaction puts its identity back."""
+        with self.pooler.client_transaction():
+            RLSUtils.set_rls_context(str(self.user_a.id), self.user_a.role)
+            before = RLSUtils.get_current_rls_context()
+
+            with RLSContextManager(user_role=Role.PLATFORM_ADMIN):
+                inside = RLSUtils.get_current_rls_context()
+            after = RLSUtils.get_current_rls_context()
+
+            with self.assertRaises(RuntimeError):
+                with RLSContextManager(self.user_b.id, self.user_b.role):
+                    raise RuntimeError("block failed")
+            after_error = RLSUtils.get_current_rls_context()
+
+        self.assertEqual(inside['current_user_role'], Role.PLATFORM_ADMIN)
+        self.assertEqual(after, before)
+        self.assertEqual(after_error, before)
+        self.assertIsNone(self.next_client_context()['current_user_id'])
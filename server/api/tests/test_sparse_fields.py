@@ -0,0 +1,125 @@
+"""
+Tests for the ?fields= and ?expand= parameters of subscription reads.
+"""
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.enums.limit_policies_metrics import LimitPoliciesMetrics
+from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from api.enums.subscriptions_status import SubscriptionsStatus
+from api.models import LimitPolicies, Plans, PlansLimitPolicies, Subscriptions
+from api.tests.base import AuthAPITests
+
+
+class SparseFieldsetTests(AuthAPITests):
+    """Test cases for shaping subscription responses"""
+
+    def setUp(self):
+        super().setUp()
+        self.limit_policy = LimitPolicies.objects.create(
+            metric=LimitPoliciesMetrics.MAX_USERS,
+            limit=10,
+            created_by=self.test_admin
+        )
+        self.plans = []
+        for i in range(3):
+            plan = Plans.objects.create(
+                name=f"Plan {i}",
+                billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+                billing_duration=1,
+                price=9.99,
+                created_by=self.test_admin
+            )
+            PlansLimitPolicies.objects.create(plan=plan, limit_policy=self.limit_policy)
+            self.plans.append(plan)
+        self.subscription = self.subscribe(self.plans[0])
+        refresh = RefreshToken.for_user(self.test_tenant_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def subscribe(self, plan):
+        return Subscriptions.objects.create(
+            plan=plan,
+            tenant=self.test_tenant,
+            created_by_user=self.test_tenant_admin,
+            status=SubscriptionsStatus.ACTIVE
+        )
+
+    def get(self, params, pk=None):
+        if pk is None:
+            url = reverse('subscription_view')
+        else:
+            url = reverse('subscription_detail', kwargs={'pk': pk})
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, [query['sql'] for query in captured.captured_queries]
+
+    def assertNotFetched(self, queries, *tables):
+        for table in tables:
+            self.assertFalse(any(f'FROM "{table}"' in sql for sql in queries), table)
+
+    def test_default_response_embeds_every_relation(self):
+        """Test that a read without either parameter is unchanged"""
+        data, _ = self.get({}, pk=self.subscription.id)
+
+        self.assertEqual(data['plan']['id'], str(self.plans[0].id))
+        self.assertEqual(data['plan']['associated_policies'][0]['id'], str(self.limit_policy.id))
+        self.assertEqual(data['tenant']['id'], str(self.test_tenant.id))
+
+    def test_fields_keeps_only_selected_fields(self):
+        """Test that ?fields= drops the other fields and their relations"""
+        data, queries = self.get({'fields': 'id,status'})
+
+        self.assertEqual([set(row) for row in data], [{'id', 'status'}])
+        self.assertNotFetched(queries, 'plans', 'tenants', 'limit_policies')
+
+    def test_unexpanded_relations_are_ids(self):
+        """Test that relations missing from ?expand= are rendered from the foreign keys"""
+        data, queries = self.get({'expand': ''}, pk=self.subscription.id)
+
+        self.assertEqual(str(data['plan']), str(self.plans[0].id))
+        self.assertEqual(str(data['tenant']), str(self.test_tenant.id))
+        self.assertEqual(data['status'], SubscriptionsStatus.ACTIVE)
+        self.assertNotFetched(queries, 'plans', 'tenants', 'limit_policies')
+
+    def test_unexpanded_list_query_count_does_not_grow(self):
+        """Test that a list without expansions costs the same for one or many rows"""
+        _, one = self.get({'fields': 'id,status,plan,tenant'})
+        for plan in self.plans[1:]:
+            self.subscribe(plan)
+        data, many = self.get({'fields': 'id,status,plan,tenant'})
+
+        self.assertEqual(len(data), len(self.plans))
+        self.assertEqual(len(one), len(many))
+
+    def test_expand_plan_without_policies(self):
+        """Test that ?expand=plan embeds the plan with policy ids but not the policies"""
+        data, queries = self.get({'expand': 'plan'}, pk=self.subscription.id)
+
+        self.assertEqual(data['plan']['name'], "Plan 0")
+        self.assertEqual(data['plan']['associated_policy_ids'], [str(self.limit_policy.id)])
+        self.assertNotIn('associated_policies', data['plan'])
+        self.assertEqual(str(data['tenant']), str(self.test_tenant.id))
+        self.assertNotFetched(queries, 'tenants', 'limit_policies')
+
+    def test_expand_nested_relation_expands_parent(self):
+        """Test that ?expand=plan.policies embeds the plan and its policies"""
+        data, _ = self.get({'expand': 'plan.policies,tenant', 'fields': 'id,plan,tenant'}, pk=self.subscription.id)
+
+        self.assertEqual(set(data), {'id', 'plan', 'tenant'})
+        self.assertEqual(data['plan']['associated_policies'][0]['limit'], 10)
+        self.assertEqual(data['tenant']['name'], self.test_tenant.name)
+
+    def test_unknown_names_are_rejected(self):
+        """Test that unknown fields or relations answer 400"""
+        for params in ({'fields': 'id,password'}, {'fields': 'plan_id'}, {'expand': 'plan.tenant'}):
+            for url in (reverse('subscription_view'), reverse('subscription_detail', kwargs={'pk': self.subscription.id})):
+                with self.subTest(url=url, params=params):
+                    response = self.client.get(url, params)
+
+                    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                    self.assertIn('error', response.data)
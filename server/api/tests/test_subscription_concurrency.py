@@ -0,0 +1,158 @@
+"""
+Tests for optimistic concurrency control on subscription writes.
+"""
+
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from api.enums.subscriptions_status import SubscriptionsStatus
+from api.models import Plans, Subscriptions
+from api.tests.base import AuthAPITests
+from api.utils.subscription_expiry import SubscriptionExpirySweeper
+
+
+class SubscriptionVersionTests(AuthAPITests):
+    """Test cases for compare-and-swap updates and cancellations of subscriptions"""
+
+    def setUp(self):
+        super().setUp()
+        self.basic_plan, self.premium_plan = [
+            Plans.objects.create(
+                name=name,
+                billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+                billing_duration=1,
+                price=price,
+                created_by=self.test_admin
+            )
+            for name, price in (("Basic Plan", 9.99), ("Premium Plan", 29.99))
+        ]
+        self.subscription = Subscriptions.objects.create(
+            plan=self.basic_plan,
+            tenant=self.test_tenant,
+            created_by_user=self.test_tenant_admin,
+            status=SubscriptionsStatus.ACTIVE
+        )
+        self.url = reverse('subscription_detail', kwargs={'pk': self.subscription.id})
+        refresh = RefreshToken.for_user(self.test_tenant_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def reload(self):
+        return Subscriptions.objects.get(pk=self.subscription.pk)
+
+    def test_new_subscription_is_version_1(self):
+        """Test that reads expose the version, starting at 1"""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data['version'], 1)
+
+    def test_update_with_current_version(self):
+        """Test that an update against the current version applies and bumps it"""
+        response = self.client.put(self.url, {'plan_id': str(self.premium_plan.id), 'version': 1}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['version'], 2)
+        self.assertEqual(response.data['plan']['id'], str(self.premium_plan.id))
+        self.assertGreater(self.reload().updated_at, self.subscription.updated_at)
+
+    def test_update_with_stale_version_conflicts(self):
+        """Test that the second of two updates made against one version gets 409"""
+        self.client.put(self.url, {'auto_renew': True, 'version': 1}, format='json')
+
+        response = self.client.put(self.url, {'plan_id': str(self.premium_plan.id), 'version': 1}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        subscription = self.reload()
+        self.assertEqual((subscription.plan_id, subscription.auto_renew, subscription.version), (self.basic_plan.id, True, 2))
+
+    def test_update_writes_only_the_sent_fields(self):
+        """Test that an update without a version leaves the fields it did not send alone"""
+        Subscriptions.objects.filter(pk=self.subscription.pk).update(status=SubscriptionsStatus.SUSPENDED)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.put(self.url, {'auto_renew': True}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        subscription = self.reload()
+        self.assertEqual(subscription.status, SubscriptionsStatus.SUSPENDED)
+        self.assertTrue(subscription.auto_renew)
+        self.assertEqual(subscription.version, 2)
+        update, = [query['sql'] for query in captured.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertNotIn('"status"', update)
+        self.assertNotIn('FOR UPDATE', ' '.join(query['sql'] for query in captured.captured_queries))
+
+    def test_update_does_not_read_the_row_first(self):
+        """Test that an update writes before it reads, and reads the subscription once"""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.put(self.url, {'auto_renew': True, 'version': 1}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        queries = [query['sql'] for query in captured.captured_queries if 'subscriptions' in query['sql']]
+        self.assertTrue(queries[0].startswith('UPDATE'), queries)
+        self.assertEqual(len([sql for sql in queries if sql.startswith('SELECT')]), 1)
+
+    def test_update_without_changes_checks_the_version(self):
+        """Test that an update sending only a stale version conflicts"""
+        response = self.client.put(self.url, {'version': 2}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.reload().version, 1)
+
+    def test_update_response_honours_fields_and_expand(self):
+        """Test that ?fields= and ?expand= shape the response to an update"""
+        response = self.client.put(f'{self.url}?fields=id,plan,version&expand=plan', {'auto_renew': True}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'id', 'plan', 'version'})
+        self.assertEqual(response.data['plan']['id'], str(self.basic_plan.id))
+        self.assertNotIn('policies', response.data['plan'])
+
+    def test_update_of_missing_subscription(self):
+        """Test that updating a subscription that does not exist answers 404"""
+        self.subscription.delete()
+
+        response = self.client.put(self.url, {'auto_renew': True, 'version': 1}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_rejects_invalid_version(self):
+        """Test that the version must be a positive integer"""
+        response = self.client.put(self.url, {'auto_renew': True, 'version': 0}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('version', response.data)
+
+    def test_cancel_with_version(self):
+        """Test that a cancellation checks ?version= against the current version"""
+        response = self.client.delete(f'{self.url}?version=2')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.reload().status, SubscriptionsStatus.ACTIVE)
+
+        response = self.client.delete(self.url, {'version': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        subscription = self.reload()
+        self.assertEqual((subscription.status, subscription.version), (SubscriptionsStatus.CANCELLED, 2))
+
+    def test_cancel_of_missing_subscription(self):
+        """Test that cancelling a subscription that does not exist answers 404, not 409"""
+        self.subscription.delete()
+
+        response = self.client.delete(f'{self.url}?version=1')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cancel_after_expiry_conflicts(self):
+        """Test that background state changes bump the version too"""
+        Subscriptions.objects.filter(pk=self.subscription.pk).update(ended_at=timezone.now() - timedelta(days=1))
+        SubscriptionExpirySweeper().sweep()
+
+        response = self.client.delete(f'{self.url}?version=1')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.reload().status, SubscriptionsStatus.EXPIRED)
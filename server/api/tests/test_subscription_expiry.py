@@ -0,0 +1,165 @@
+"""
+Tests for the subscription expiry sweeper, its command and its scheduler.
+"""
+
+import io
+import threading
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+
+from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from api.enums.subscriptions_status import SubscriptionsStatus
+from api.models import Plans, Subscriptions, Tenants
+from api.tests.base import AuthAPITests
+from api.utils.subscription_expiry import (
+    EXPIRE_CHUNK_SQL,
+    SubscriptionExpiryScheduler,
+    SubscriptionExpirySweeper,
+    expired_counter,
+    lag_gauge,
+)
+
+
+class SubscriptionExpirySweeperTests(AuthAPITests):
+    """Test cases for expiring subscriptions past their end date"""
+
+    def setUp(self):
+        super().setUp()
+        self.plan = Plans.objects.create(
+            name="Basic Plan",
+            billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+            billing_duration=1,
+            price=9.99,
+            created_by=self.test_admin
+        )
+        self.now = timezone.now()
+
+    def subscribe(self, *ended_at, status=SubscriptionsStatus.ACTIVE):
+        tenants = Tenants.objects.bulk_create([
+            Tenants(name=f"Tenant {Tenants.objects.count() + i}") for i in range(len(ended_at))
+        ])
+        return Subscriptions.objects.bulk_create([
+            Subscriptions(
+                plan=self.plan,
+                tenant=tenant,
+                created_by_user=self.test_tenant_admin,
+                status=status,
+                ended_at=end
+            )
+            for tenant, end in zip(tenants, ended_at)
+        ])
+
+    def statuses(self, subscriptions):
+        return [Subscriptions.objects.get(pk=subscription.pk).status for subscription in subscriptions]
+
+    def test_expires_only_active_subscriptions_past_their_end(self):
+        """Test that future, open-ended and inactive subscriptions are left alone"""
+        due = self.subscribe(self.now - timedelta(days=3), self.now - timedelta(minutes=1))
+        kept = self.subscribe(self.now + timedelta(days=1), None)
+        cancelled = self.subscribe(self.now - timedelta(days=1), status=SubscriptionsStatus.CANCELLED)
+
+        stats = SubscriptionExpirySweeper().sweep()
+
+        self.assertEqual(stats['expired'], 2)
+        self.assertEqual(stats['chunks'], 1)
+        self.assertGreaterEqual(stats['lag_seconds'], timedelta(days=3).total_seconds())
+        self.assertEqual(self.statuses(due), [SubscriptionsStatus.EXPIRED] * 2)
+        self.assertEqual(self.statuses(kept), [SubscriptionsStatus.ACTIVE] * 2)
+        self.assertEqual(self.statuses(cancelled), [SubscriptionsStatus.CANCELLED])
+        self.assertGreater(Subscriptions.objects.get(pk=due[0].pk).updated_at, due[0].updated_at)
+
+    def test_sweeps_in_chunks(self):
+        """Test that due subscriptions are expired chunk_size at a time until none is left"""
+        self.subscribe(*[self.now - timedelta(hours=i + 1) for i in range(5)])
+
+        stats = SubscriptionExpirySweeper(chunk_size=2).sweep()
+
+        self.assertEqual((stats['expired'], stats['chunks']), (5, 3))
+        self.assertFalse(Subscriptions.objects.filter(status=SubscriptionsStatus.ACTIVE).exists())
+
+    def test_max_chunks_stops_early(self):
+        """Test that the most overdue subscriptions go first and max_chunks bounds a sweep"""
+        oldest, *newer = self.subscribe(*[self.now - timedelta(hours=5 - i) for i in range(5)])
+
+        stats = SubscriptionExpirySweeper(chunk_size=1).sweep(max_chunks=1)
+
+        self.assertEqual(stats['expired'], 1)
+        self.assertEqual(self.statuses([oldest]), [SubscriptionsStatus.EXPIRED])
+        self.assertEqual(Subscriptions.objects.filter(status=SubscriptionsStatus.ACTIVE).count(), 4)
+
+    def test_records_metrics(self):
+        """Test that the sweep counts expired subscriptions and reports the lag"""
+        before = expired_counter.get() or 0
+        self.subscribe(self.now - timedelta(hours=1), self.now - timedelta(hours=2))
+
+        SubscriptionExpirySweeper().sweep()
+
+        self.assertEqual(expired_counter.get(), before + 2)
+        self.assertGreaterEqual(lag_gauge.get(), timedelta(hours=2).total_seconds())
+
+    def test_due_subscriptions_are_found_through_the_partial_index(self):
+        """Test that the chunk query can use sub_expirable_ended_at_index"""
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + EXPIRE_CHUNK_SQL, {
+                'active': SubscriptionsStatus.ACTIVE.value,
+                'expired': SubscriptionsStatus.EXPIRED.value,
+                'now': self.now,
+                'limit': 10,
+            })
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('sub_expirable_ended_at_index', plan)
+
+    def test_command(self):
+        """Test that expire_subscriptions runs a sweep and reports it"""
+        self.subscribe(*[self.now - timedelta(hours=i + 1) for i in range(3)])
+        stdout = io.StringIO()
+
+        call_command('expire_subscriptions', chunk_size=2, stdout=stdout)
+
+        self.assertIn('Expired 3 subscriptions in 2 chunks', stdout.getvalue())
+        self.assertEqual(Subscriptions.objects.filter(status=SubscriptionsStatus.EXPIRED).count(), 3)
+
+
+class SubscriptionExpirySchedulerTests(AuthAPITests):
+    """Test cases for the in-process expiry scheduler"""
+
+    class RecordingSweeper:
+        def __init__(self, fail=False):
+            self.calls = 0
+            self.fail = fail
+            self.swept = threading.Event()
+
+        def sweep(self):
+            self.calls += 1
+            self.swept.set()
+            if self.fail:
+                raise RuntimeError("database unavailable")
+            return {'expired': 0, 'chunks': 1, 'lag_seconds': 0.0}
+
+    def test_sweeps_until_stopped(self):
+        """Test that the scheduler sweeps in a thread and stops on request"""
+        sweeper = self.RecordingSweeper()
+        scheduler = SubscriptionExpiryScheduler(interval=60, sweeper=sweeper)
+
+        scheduler.start()
+        self.assertTrue(sweeper.swept.wait(5))
+        scheduler.stop(timeout=5)
+
+        self.assertFalse(scheduler._thread.is_alive())
+        self.assertEqual(sweeper.calls, 1)
+
+    def test_failed_sweep_keeps_the_scheduler_running(self):
+        """Test that an error is logged instead of ending the thread"""
+        sweeper = self.RecordingSweeper(fail=True)
+        scheduler = SubscriptionExpiryScheduler(interval=60, sweeper=sweeper)
+
+        with self.assertLogs('api.utils.subscription_expiry', level='ERROR'):
+            scheduler.start()
+            self.assertTrue(sweeper.swept.wait(5))
+            self.assertTrue(scheduler._thread.is_alive())
+            scheduler.stop(timeout=5)
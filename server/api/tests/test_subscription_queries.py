@@ -0,0 +1,106 @@
+"""
+Query budget tests for subscription reads.
+"""
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.enums.limit_policies_metrics import LimitPoliciesMetrics
+from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from api.enums.subscriptions_status import SubscriptionsStatus
+from api.models import LimitPolicies, Plans, PlansLimitPolicies, Subscriptions, Tenants
+from api.tests.base import AuthAPITests
+
+
+class SubscriptionQueryBudgetTests(AuthAPITests):
+    """Test cases for reading subscriptions with a fixed number of queries"""
+
+    # RLS context, authentication, ETag watermark, catalog version, the page
+    # with its plans and tenants, and the plans' policy links
+    QUERY_BUDGET = 6
+
+    def setUp(self):
+        super().setUp()
+        self.policies = LimitPolicies.objects.bulk_create([
+            LimitPolicies(metric=LimitPoliciesMetrics.MAX_USERS, limit=limit, created_by=self.test_admin)
+            for limit in (10, 50)
+        ])
+        self.plans = Plans.objects.bulk_create([
+            Plans(
+                name=f"Plan {i}",
+                billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+                billing_duration=1,
+                price=9.99,
+                created_by=self.test_admin
+            )
+            for i in range(20)
+        ])
+        PlansLimitPolicies.objects.bulk_create([
+            PlansLimitPolicies(plan=plan, limit_policy=policy)
+            for plan in self.plans
+            for policy in self.policies
+        ])
+        refresh = RefreshToken.for_user(self.test_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def subscribe(self, count):
+        tenants = Tenants.objects.bulk_create([Tenants(name=f"Tenant {i}") for i in range(count)])
+        Subscriptions.objects.bulk_create([
+            Subscriptions(
+                plan=self.plans[i % len(self.plans)],
+                tenant=tenant,
+                created_by_user=self.test_tenant_admin,
+                status=SubscriptionsStatus.ACTIVE
+            )
+            for i, tenant in enumerate(tenants)
+        ])
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, len(captured.captured_queries)
+
+    def assertListBudget(self, rows, params=None):
+        self.subscribe(rows)
+        data, queries = self.get(reverse('subscription_view'), params)
+
+        self.assertEqual(len(data), rows)
+        self.assertEqual(queries, self.QUERY_BUDGET)
+        return data, queries
+
+    def test_list_10_rows(self):
+        """Test that listing 10 fully embedded subscriptions stays within the budget"""
+        data, _ = self.assertListBudget(10)
+
+        self.assertEqual(len(data[0]['plan']['associated_policies']), 2)
+        self.assertEqual(data[0]['tenant']['name'][:7], "Tenant ")
+
+    def test_list_10000_rows(self):
+        """Test that listing 10,000 subscriptions costs as many queries as 10"""
+        data, queries = self.assertListBudget(10000)
+
+        self.assertEqual({len(row['plan']['associated_policies']) for row in data}, {2})
+        self.assertEqual(len({row['tenant']['id'] for row in data}), 10000)
+
+    def test_expand_plan_without_policies(self):
+        """Test that ?expand=plan loads the policy ids without the policies"""
+        self.subscribe(50)
+        data, queries = self.get(reverse('subscription_view'), {'expand': 'plan'})
+
+        self.assertEqual(len(data[0]['plan']['associated_policy_ids']), 2)
+        self.assertNotIn('associated_policies', data[0]['plan'])
+        self.assertEqual(queries, self.QUERY_BUDGET)
+
+    def test_detail(self):
+        """Test that reading one subscription stays within the same budget"""
+        self.subscribe(1)
+        subscription = Subscriptions.objects.get()
+
+        data, queries = self.get(reverse('subscription_detail', kwargs={'pk': subscription.id}))
+
+        self.assertEqual(len(data['plan']['associated_policies']), 2)
+        self.assertEqual(queries, self.QUERY_BUDGET)
@@ -0,0 +1,199 @@
+"""
+Tests for the subscription renewal engine and its command.
+"""
+
+import io
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.enums.role import Role
+from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from api.enums.subscriptions_status import SubscriptionsStatus
+from api.models import Plans, Subscriptions, Tenants, Users
+from api.tests.base import AuthAPITests
+from api.utils.subscription_expiry import SubscriptionExpirySweeper
+from api.utils.subscription_renewal import SubscriptionRenewalEngine, billing_period_sql, renewed_counter
+
+
+class RenewalFixtures:
+    def create_plans(self, created_by):
+        self.monthly = Plans.objects.create(
+            name="Monthly Plan",
+            billing_cycle=SubscriptionsBillingCycle.MONTHLY,
+            billing_duration=1,
+            price=9.99,
+            created_by=created_by
+        )
+        self.biennial = Plans.objects.create(
+            name="Biennial Plan",
+            billing_cycle=SubscriptionsBillingCycle.ANNUALLY,
+            billing_duration=2,
+            price=199.99,
+            created_by=created_by
+        )
+
+    def subscribe(self, plan, created_by, *ended_at, status=SubscriptionsStatus.ACTIVE, auto_renew=True):
+        tenants = Tenants.objects.bulk_create([
+            Tenants(name=f"Tenant {Tenants.objects.count() + i}") for i in range(len(ended_at))
+        ])
+        return Subscriptions.objects.bulk_create([
+            Subscriptions(
+                plan=plan,
+                tenant=tenant,
+                created_by_user=created_by,
+                status=status,
+                ended_at=end,
+                auto_renew=auto_renew
+            )
+            for tenant, end in zip(tenants, ended_at)
+        ])
+
+    def reload(self, subscription):
+        return Subscriptions.objects.get(pk=subscription.pk)
+
+
+class SubscriptionRenewalEngineTests(RenewalFixtures, AuthAPITests):
+    """Test cases for renewing subscriptions due at a cutoff"""
+
+    def setUp(self):
+        super().setUp()
+        self.create_plans(self.test_admin)
+        self.cutoff = timezone.now()
+
+    def subscribe(self, plan, *ended_at, **kwargs):
+        return super().subscribe(plan, self.test_tenant_admin, *ended_at, **kwargs)
+
+    def test_billing_period_sql(self):
+        """Test the period lengths shared by subscription creation and renewal"""
+        Plans.objects.filter(pk=self.monthly.pk).update(billing_duration=3)
+        unknown = Plans.objects.create(name="Weekly Plan", billing_cycle='weekly', billing_duration=1, price=1, created_by=self.test_admin)
+        period = billing_period_sql('plans.billing_cycle', 'plans.billing_duration')
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT id, {period} FROM plans WHERE id IN (%s, %s, %s)", [self.monthly.pk, self.biennial.pk, unknown.pk])
+            periods = dict(cursor.fetchall())
+
+        self.assertEqual(periods[self.monthly.pk], timedelta(weeks=12))
+        self.assertEqual(periods[self.biennial.pk], timedelta(days=730))
+        self.assertIsNone(periods[unknown.pk])
+
+    def test_renews_into_the_next_period(self):
+        """Test that a due subscription starts a new period where the last one ended"""
+        ended_at = self.cutoff - timedelta(days=1)
+        monthly, = self.subscribe(self.monthly, ended_at)
+        biennial, = self.subscribe(self.biennial, ended_at)
+
+        stats = SubscriptionRenewalEngine(cutoff=self.cutoff).run()
+
+        self.assertEqual(stats['renewed'], 2)
+        self.assertGreater(stats['renewals_per_second'], 0)
+        monthly, biennial = self.reload(monthly), self.reload(biennial)
+        self.assertEqual((monthly.started_at, monthly.ended_at), (ended_at, ended_at + timedelta(weeks=4)))
+        self.assertEqual(biennial.ended_at, ended_at + timedelta(days=730))
+        self.assertEqual(monthly.status, SubscriptionsStatus.ACTIVE)
+
+    def test_missed_periods_are_caught_up(self):
+        """Test that a subscription several periods behind gets the period containing the cutoff"""
+        ended_at = self.cutoff - timedelta(days=70)
+        subscription, = self.subscribe(self.monthly, ended_at)
+
+        SubscriptionRenewalEngine(cutoff=self.cutoff).run()
+
+        subscription = self.reload(subscription)
+        self.assertEqual(subscription.started_at, ended_at + timedelta(days=56))
+        self.assertEqual(subscription.ended_at, ended_at + timedelta(days=84))
+
+    def test_only_due_auto_renewing_active_subscriptions_renew(self):
+        """Test that future, opted-out and inactive subscriptions are left alone"""
+        past = self.cutoff - timedelta(hours=1)
+        kept = [
+            *self.subscribe(self.monthly, self.cutoff + timedelta(hours=1), None),
+            *self.subscribe(self.monthly, past, auto_renew=False),
+            *self.subscribe(self.monthly, past, status=SubscriptionsStatus.CANCELLED),
+        ]
+
+        stats = SubscriptionRenewalEngine(cutoff=self.cutoff).run()
+
+        self.assertEqual(stats['renewed'], 0)
+        self.assertEqual([self.reload(s).ended_at for s in kept], [s.ended_at for s in kept])
+
+    def test_run_is_idempotent_and_resumable(self):
+        """Test that an interrupted run is finished by running it again, renewing each once"""
+        subscriptions = self.subscribe(self.monthly, *[self.cutoff - timedelta(hours=i + 1) for i in range(5)])
+        engine = SubscriptionRenewalEngine(cutoff=self.cutoff, chunk_size=2)
+        before = renewed_counter.get() or 0
+
+        self.assertEqual(engine.run(max_chunks=1)['renewed'], 2)
+        self.assertEqual(engine.run()['renewed'], 3)
+        self.assertEqual(engine.run()['renewed'], 0)
+
+        self.assertEqual(renewed_counter.get(), before + 5)
+        for subscription in subscriptions:
+            self.assertEqual(self.reload(subscription).ended_at, subscription.ended_at + timedelta(weeks=4))
+
+    def test_expiry_leaves_auto_renewing_subscriptions(self):
+        """Test that the expiry sweeper only expires subscriptions that do not renew"""
+        past = self.cutoff - timedelta(hours=1)
+        renewing, = self.subscribe(self.monthly, past)
+        lapsing, = self.subscribe(self.monthly, past, auto_renew=False)
+
+        SubscriptionExpirySweeper().sweep()
+
+        self.assertEqual(self.reload(renewing).status, SubscriptionsStatus.ACTIVE)
+        self.assertEqual(self.reload(lapsing).status, SubscriptionsStatus.EXPIRED)
+
+    def test_command(self):
+        """Test that renew_subscriptions renews up to --cutoff and reports the throughput"""
+        self.subscribe(self.monthly, self.cutoff - timedelta(days=2), self.cutoff - timedelta(hours=1))
+        stdout = io.StringIO()
+
+        call_command('renew_subscriptions', cutoff=(self.cutoff - timedelta(days=1)).isoformat(), stdout=stdout)
+
+        self.assertIn('Renewed 1 subscriptions', stdout.getvalue())
+        self.assertIn('renewals_per_second', stdout.getvalue())
+
+    def test_subscribe_with_auto_renew(self):
+        """Test that a tenant admin can opt a new subscription into renewal"""
+        refresh = RefreshToken.for_user(self.test_tenant_admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+        response = self.client.post(
+            reverse('subscription_view'),
+            {'plan_id': str(self.monthly.id), 'auto_renew': True},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        subscription = Subscriptions.objects.get(pk=response.data['id'])
+        self.assertTrue(subscription.auto_renew)
+        self.assertEqual(subscription.ended_at - subscription.started_at, timedelta(weeks=4))
+
+
+class SubscriptionRenewalPoolTests(RenewalFixtures, TransactionTestCase):
+    """Test cases for renewing in a pool of worker processes"""
+
+    def test_workers_share_the_due_subscriptions(self):
+        """Test that forked workers renew every due subscription exactly once"""
+        admin = Users.objects.create(
+            email="admin@example.com",
+            name="Test Admin",
+            password=make_password("adminpass123"),
+            role=Role.PLATFORM_ADMIN
+        )
+        self.create_plans(admin)
+        cutoff = timezone.now()
+        subscriptions = self.subscribe(self.monthly, admin, *[cutoff - timedelta(minutes=i + 1) for i in range(40)])
+
+        stats = SubscriptionRenewalEngine(cutoff=cutoff, chunk_size=5, workers=3).run()
+
+        self.assertEqual(stats['renewed'], 40)
+        for subscription in subscriptions:
+            self.assertEqual(self.reload(subscription).ended_at, subscription.ended_at + timedelta(weeks=4))
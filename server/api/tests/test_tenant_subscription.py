@@ -1,6 +1,9 @@
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
+from api.serializers import CustomTokenObtainPairSerializer
 from api.tests.base import AuthAPITests
 from api.enums.limit_policies_metrics import LimitPoliciesMetrics
 from api.enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
@@ -95,6 +98,74 @@ class SubscriptionViewTests(AuthAPITests):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_create_subscription_with_tenant_claim(self):
+        """Creating a subscription reads the tenant from the token in one insert"""
+        url = reverse('subscription_view')
+        refresh = CustomTokenObtainPairSerializer.get_token(self.test_tenant_admin)
+        
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(
+                url,
+                {'plan_id': str(self.premium_plan.id)},
+                HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}',
+                format='json'
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['tenant']['id'], str(self.test_tenant.id))
+        subscription = Subscriptions.objects.get(id=response.data['id'])
+        self.assertEqual(subscription.created_by_user_id, self.test_tenant_admin.id)
+        self.assertEqual(subscription.status, SubscriptionsStatus.ACTIVE)
+        
+        queries = [query['sql'] for query in captured.captured_queries]
+        self.assertFalse(any('"user_tenants"' in sql for sql in queries))
+        # The plan is read by the inserting statement itself
+        self.assertEqual(sum('INSERT INTO subscriptions' in sql for sql in queries), 1)
+        self.assertFalse(any('FROM "plans"' in sql for sql in queries))
+
+    def test_create_subscription_twice_conflicts(self):
+        """Subscribing a tenant to a plan it already has answers 400 without a second row"""
+        url = reverse('subscription_view')
+        data = {
+            'plan_id': str(self.premium_plan.id)
+        }
+        
+        responses = [
+            self.client.post(url, data, HTTP_AUTHORIZATION=self.get_tenant_admin_auth_header(), format='json')
+            for _ in range(2)
+        ]
+        
+        self.assertEqual(responses[0].status_code, status.HTTP_201_CREATED)
+        self.assertEqual(responses[1].status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('already exists', str(responses[1].data))
+        self.assertEqual(Subscriptions.objects.filter(plan=self.premium_plan).count(), 1)
+
+    def test_create_subscription_existing_for_tenant(self):
+        """A plan the tenant is subscribed to by another admin cannot be subscribed again"""
+        url = reverse('subscription_view')
+        self.test_subscription.created_by_user = self.test_admin
+        self.test_subscription.save()
+        
+        response = self.client.post(
+            url,
+            {'plan_id': str(self.test_plan.id)},
+            HTTP_AUTHORIZATION=self.get_tenant_admin_auth_header(),
+            format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Subscriptions.objects.filter(plan=self.test_plan).count(), 1)
+
+    def test_plan_and_tenant_are_unique(self):
+        """The database rejects a second subscription of the tenant to the plan, so concurrent subscribes cannot both insert"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Subscriptions.objects.create(
+                plan=self.test_plan,
+                tenant=self.test_tenant,
+                created_by_user=self.test_admin,
+                status=SubscriptionsStatus.ACTIVE
+            )
+
     def test_create_subscription_as_user_forbidden(self):
         """Creating a subscription as regular user should be forbidden"""
         url = reverse('subscription_view')
@@ -7,9 +7,12 @@ from .views import (
     LogoutView,
     LoginView,
     PlanView,
+    PlanImportView,
     LimitPoliciesView,
     PlanLimitPolicyView,
     SubscriptionView,
+    RLSHealthView,
+    MetricsView,
 )
 
 urlpatterns = [
@@ -21,9 +24,12 @@ urlpatterns = [
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('plans/', PlanView.as_view(), name='plans_view'),
     path('plans/<uuid:pk>/', PlanView.as_view(), name='plan_detail'),
+    path('plans/import/', PlanImportView.as_view(), name='plans_import'),
     path('limit-policies/', LimitPoliciesView.as_view(), name='limit_policies_view'),
     path('limit-policies/<uuid:pk>/', LimitPoliciesView.as_view(), name='limit_policy_detail'),
     path('plans-limit-policies/', PlanLimitPolicyView.as_view(), name='plans_limit_policies_view'),
     path('subscriptions/', SubscriptionView.as_view(), name='subscription_view'),
     path('subscriptions/<uuid:pk>/', SubscriptionView.as_view(), name='subscription_detail'),
+    path('health/rls/', RLSHealthView.as_view(), name='rls_health'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""
+Helpers shared by the benchmarking management commands.
+"""
+
+import statistics
+
+
+def summarize_latencies(samples):
+    """
+    Summarize a list of latency samples.
+
+    Args:
+        samples (list): Latencies in milliseconds
+
+    Returns:
+        dict: Count, mean, p50, p95 and p99 latencies rounded to microseconds
+    """
+    if not samples:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'p99': None}
+
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+        return round(ordered[index], 3)
+
+    return {
+        'count': len(ordered),
+        'mean': round(statistics.fmean(ordered), 3),
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+    }
@@ -0,0 +1,165 @@
+"""
+In-process cache of the serialized plan catalog.
+
+Plans and limit policies are read on every dashboard page load but change
+rarely, and they are not tenant scoped, so every worker keeps the serialized
+lists in memory. Each entry is stamped with the version of the
+``catalog_version`` row, which triggers on the catalog tables bump on every
+write. A read revalidates its entry with a single primary key lookup and only
+rebuilds it when the version moved.
+
+With ``PRERENDER`` on, entries also hold the JSON body already encoded, and
+gzip-compressed, so a cached read skips rendering as well as the ORM.
+"""
+
+import gzip
+import re
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics
+
+
+CATALOG_CACHE_DEFAULTS = {
+    'ENABLED': True,
+    'REVALIDATE_AFTER': 0,
+    'PRERENDER': False,
+    'PRECOMPRESS': True,
+}
+
+# Bodies shorter than this are not worth compressing (as GZipMiddleware)
+PRECOMPRESS_MIN_LENGTH = 200
+
+accepts_gzip = re.compile(r'\bgzip\b')
+
+catalog_cache_counter = metrics.counter(
+    'eshtarek_catalog_cache_requests_total',
+    'Plan catalog cache lookups, by entry and result',
+)
+
+
+def get_catalog_cache_setting(name):
+    """
+    Return a CATALOG_CACHE setting, falling back to its default value.
+
+    Args:
+        name (str): Setting name, e.g. 'ENABLED'
+    """
+    return getattr(settings, 'CATALOG_CACHE', {}).get(name, CATALOG_CACHE_DEFAULTS[name])
+
+
+def get_catalog_version():
+    """
+    Return the current catalog version stamp.
+
+    The stamp pairs the counter with the ``xmin`` of the row, the transaction
+    that last bumped it. A counter value reached again after a rollback
+    therefore never matches an entry built from the rolled back data.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT version, xmin::TEXT FROM catalog_version WHERE id = 1")
+        return cursor.fetchone()
+
+
+class CatalogCache:
+    """
+    Serialized catalog entries of this worker, keyed by name.
+
+    ``REVALIDATE_AFTER`` (seconds) lets an entry be served without checking
+    the version for that long after its last check; 0, the default, checks on
+    every read so a write is visible to every worker immediately.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build, version=None):
+        """
+        Return the cached value of an entry, building it if it is missing or stale.
+
+        Args:
+            key (str): Entry name, e.g. 'plans'
+            build (callable): Returns the serialized value from the database
+            version (tuple, optional): Catalog version already read by the
+                request, e.g. for its ETag; looked up when not given
+
+        Returns:
+            The cached or freshly built value
+        """
+        if not get_catalog_cache_setting('ENABLED'):
+            return build()
+
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        revalidate_after = get_catalog_cache_setting('REVALIDATE_AFTER')
+        if entry is not None and revalidate_after and now - entry['checked_at'] < revalidate_after:
+            catalog_cache_counter.inc(entry=key, result='hit')
+            return entry['value']
+
+        # Read the version before building: a write committed in between makes
+        # the entry look stale on the next read, never fresh with old data.
+        if version is None:
+            version = get_catalog_version()
+        if entry is not None and entry['version'] == version:
+            entry['checked_at'] = now
+            catalog_cache_counter.inc(entry=key, result='hit')
+            return entry['value']
+
+        value = build()
+        with self._lock:
+            self._entries[key] = {'version': version, 'value': value, 'checked_at': now}
+        catalog_cache_counter.inc(entry=key, result='miss')
+        return value
+
+    def clear(self):
+        """Drop every entry of this worker."""
+        with self._lock:
+            self._entries.clear()
+
+
+catalog_cache = CatalogCache()
+
+
+def render_page(page):
+    """
+    Encode a serialized page once, for ``prerendered_response``.
+
+    Args:
+        page (dict): Page returned by ``KeysetPaginator.serialize_page``
+
+    Returns:
+        dict: The page with ``body``, the JSON bytes DRF would have rendered,
+            and ``body_gzip``, their gzip encoding or None
+    """
+    body = JSONRenderer().render(page['results'])
+    body_gzip = None
+    if get_catalog_cache_setting('PRECOMPRESS') and len(body) >= PRECOMPRESS_MIN_LENGTH:
+        # mtime=0 keeps the bytes identical across workers and rebuilds
+        body_gzip = gzip.compress(body, compresslevel=9, mtime=0)
+    return {**page, 'body': body, 'body_gzip': body_gzip}
+
+
+def prerendered_response(request, page):
+    """
+    Serve a page returned by ``render_page`` without rendering it.
+
+    The gzip encoding is sent to clients that accept it. Its ETag is made
+    weak, as GZipMiddleware does, since both encodings share one tag.
+    """
+    if page['body_gzip'] is not None and accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(page['body_gzip'], content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+        etag = getattr(request, 'catalog_etag', None)
+        if etag is not None:
+            response['ETag'] = f'W/"{etag}"'
+    else:
+        response = HttpResponse(page['body'], content_type='application/json')
+    if page['body_gzip'] is not None:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
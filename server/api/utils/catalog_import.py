@@ -0,0 +1,304 @@
+"""
+Bulk import of the plan catalog from JSON lines or CSV.
+
+Each record describes one plan and its limits, keyed by metric::
+
+    {"name": "Gold", "billing_cycle": "monthly", "billing_duration": 1,
+     "price": "49.00", "description": "...", "limits": {"max_users": 50}}
+
+    name,description,billing_cycle,billing_duration,price,limits
+    Gold,,monthly,1,49.00,max_users=50
+
+The whole file is validated before anything is written, so a bad record
+rejects the import. Records are then written in chunks, one transaction per
+chunk, with a fixed number of statements each:
+
+- limit policies are matched on ``(metric, limit)`` and the missing ones are
+  inserted with one ``bulk_create``;
+- plans are upserted on their unique name (``INSERT ... ON CONFLICT (name) DO
+  UPDATE``), so importing a file again updates the plans in place;
+- the links of each plan that has a ``limits`` key are made exactly its
+  imported limits: stale links are deleted with one statement and new ones
+  inserted with ``ON CONFLICT DO NOTHING``. A record without ``limits`` (or
+  with an empty ``limits`` CSV cell) leaves the plan's links as they are.
+"""
+
+import codecs
+import csv
+import json
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import LimitPolicies, Plans, PlansLimitPolicies
+from ..serializers import CatalogImportRowSerializer
+
+
+CATALOG_IMPORT_DEFAULTS = {
+    'CHUNK_SIZE': 1000,
+    'MAX_ERRORS': 100,
+}
+
+FORMATS = ('jsonl', 'csv')
+
+CSV_COLUMNS = ['name', 'description', 'billing_cycle', 'billing_duration', 'price', 'limits']
+
+PLAN_UPDATE_FIELDS = ['description', 'billing_cycle', 'billing_duration', 'price', 'updated_at']
+
+
+def get_catalog_import_setting(name):
+    """
+    Return a CATALOG_IMPORT setting, falling back to its default value.
+
+    Args:
+        name (str): Setting name, e.g. 'CHUNK_SIZE'
+    """
+    return getattr(settings, 'CATALOG_IMPORT', {}).get(name, CATALOG_IMPORT_DEFAULTS[name])
+
+
+class CatalogImportError(Exception):
+    """
+    Raised when an import file does not validate; nothing has been written.
+
+    Attributes:
+        errors (list): ``{'line': ..., 'errors': ...}`` for the first invalid records
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} invalid record(s) in the import file.")
+
+
+def _parse_limits(value):
+    """Parse the ``metric=limit;metric=limit`` limits column of a CSV record."""
+    limits = {}
+    for pair in filter(None, (part.strip() for part in (value or '').split(';'))):
+        metric, separator, limit = pair.partition('=')
+        if not separator:
+            raise ValueError(f"Invalid limit '{pair}', expected metric=limit.")
+        limits[metric.strip()] = limit.strip()
+    return limits
+
+
+def read_records(lines, file_format):
+    """
+    Parse an import file lazily.
+
+    Args:
+        lines: Iterable of text lines, e.g. an open file
+        file_format (str): 'jsonl' or 'csv'
+
+    Yields:
+        tuple: The line number and either the raw record (dict) or the
+            error message of a line that could not be parsed (str)
+    """
+    if file_format == 'jsonl':
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, "Expected a JSON object."
+                continue
+            yield line_number, record
+    elif file_format == 'csv':
+        reader = csv.DictReader(lines)
+        missing = [column for column in CSV_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            yield 1, f"Missing CSV columns: {', '.join(missing)}."
+            return
+        for record in reader:
+            try:
+                record['limits'] = _parse_limits(record['limits'])
+            except ValueError as e:
+                yield reader.line_num, str(e)
+                continue
+            if not record['limits']:
+                del record['limits']
+            if not record['description']:
+                record['description'] = None
+            yield reader.line_num, record
+    else:
+        raise ValueError(f"Unknown import format: {file_format}. Must be one of {', '.join(FORMATS)}.")
+
+
+def decode_stream(stream, encoding='utf-8'):
+    """Iterate the text lines of a binary stream, such as a request body."""
+    return codecs.getreader(encoding)(stream)
+
+
+def validate_records(records):
+    """
+    Validate every record of an import file.
+
+    Args:
+        records: Iterable of ``(line_number, record)`` from ``read_records``
+
+    Returns:
+        list: The validated records
+
+    Raises:
+        CatalogImportError: If any record is invalid or repeats a plan name
+    """
+    max_errors = get_catalog_import_setting('MAX_ERRORS')
+    rows, errors, seen_names = [], [], {}
+
+    for line_number, record in records:
+        if isinstance(record, str):
+            errors.append({'line': line_number, 'errors': {'non_field_errors': [record]}})
+        else:
+            serializer = CatalogImportRowSerializer(data=record)
+            if not serializer.is_valid():
+                errors.append({'line': line_number, 'errors': serializer.errors})
+            else:
+                row = serializer.validated_data
+                if row['name'] in seen_names:
+                    errors.append({'line': line_number, 'errors': {'name': [
+                        f"Duplicate plan name, already on line {seen_names[row['name']]}."
+                    ]}})
+                else:
+                    seen_names[row['name']] = line_number
+                    rows.append(row)
+        if len(errors) >= max_errors:
+            break
+
+    if errors:
+        raise CatalogImportError(errors)
+    return rows
+
+
+class CatalogImporter:
+    """
+    Write validated import records to the catalog tables.
+
+    Usage:
+        importer = CatalogImporter(created_by=admin)
+        stats = importer.run(validate_records(read_records(lines, 'jsonl')))
+    """
+
+    def __init__(self, created_by, chunk_size=None):
+        self.created_by = created_by
+        self.chunk_size = chunk_size or get_catalog_import_setting('CHUNK_SIZE')
+        # (metric, limit) -> limit policy id, shared by every chunk
+        self.policy_ids = {}
+        self.stats = {
+            'plans_created': 0,
+            'plans_updated': 0,
+            'limit_policies_created': 0,
+            'links_created': 0,
+            'links_removed': 0,
+        }
+
+    def run(self, rows):
+        """
+        Import the rows chunk by chunk, one transaction per chunk.
+
+        Args:
+            rows (list): Records returned by ``validate_records``
+
+        Returns:
+            dict: Counts of the plans, limit policies and links written
+        """
+        for start in range(0, len(rows), self.chunk_size):
+            with transaction.atomic():
+                self._import_chunk(rows[start:start + self.chunk_size])
+        return self.stats
+
+    def _import_chunk(self, rows):
+        self._resolve_policies(rows)
+        plan_ids = self._upsert_plans(rows)
+        self._set_links(rows, plan_ids)
+
+    def _resolve_policies(self, rows):
+        """Find or create a limit policy for every (metric, limit) of the chunk."""
+        pairs = {
+            (metric, limit)
+            for row in rows
+            for metric, limit in row.get('limits', {}).items()
+        } - self.policy_ids.keys()
+        if not pairs:
+            return
+
+        # Several policies may share a (metric, limit); the oldest one is used.
+        existing = (
+            LimitPolicies.objects
+            .filter(metric__in={metric for metric, _ in pairs}, limit__in={limit for _, limit in pairs})
+            .order_by('-created_at', '-id')
+            .values_list('metric', 'limit', 'id')
+        )
+        for metric, limit, policy_id in existing:
+            if (metric, limit) in pairs:
+                self.policy_ids[(metric, limit)] = policy_id
+
+        created = LimitPolicies.objects.bulk_create([
+            LimitPolicies(metric=metric, limit=limit, created_by=self.created_by)
+            for metric, limit in sorted(pairs - self.policy_ids.keys())
+        ])
+        for policy in created:
+            self.policy_ids[(policy.metric, policy.limit)] = policy.id
+        self.stats['limit_policies_created'] += len(created)
+
+    def _upsert_plans(self, rows):
+        """Insert or update the plans of the chunk and return their ids by name."""
+        names = [row['name'] for row in rows]
+        existing = set(Plans.objects.filter(name__in=names).values_list('name', flat=True))
+
+        now = timezone.now()
+        Plans.objects.bulk_create(
+            [
+                Plans(
+                    name=row['name'],
+                    description=row.get('description'),
+                    billing_cycle=row['billing_cycle'],
+                    billing_duration=row['billing_duration'],
+                    price=row['price'],
+                    created_by=self.created_by,
+                    created_at=now,
+                    updated_at=now,
+                )
+                for row in rows
+            ],
+            update_conflicts=True,
+            unique_fields=['name'],
+            update_fields=PLAN_UPDATE_FIELDS,
+        )
+        self.stats['plans_created'] += len(names) - len(existing)
+        self.stats['plans_updated'] += len(existing)
+
+        # On conflict the row keeps its own id, which bulk_create does not
+        # report back, so read the ids of the whole chunk.
+        return dict(Plans.objects.filter(name__in=names).values_list('name', 'id'))
+
+    def _set_links(self, rows, plan_ids):
+        """Make the links of every plan of the chunk that has ``limits`` exactly those limits."""
+        rows = [row for row in rows if 'limits' in row]
+        if not rows:
+            return
+
+        wanted = {
+            (plan_ids[row['name']], self.policy_ids[(metric, limit)])
+            for row in rows
+            for metric, limit in row['limits'].items()
+        }
+        current = {
+            (plan_id, policy_id): link_id
+            for link_id, plan_id, policy_id in PlansLimitPolicies.objects
+            .filter(plan_id__in=[plan_ids[row['name']] for row in rows])
+            .values_list('id', 'plan_id', 'limit_policy_id')
+        }
+
+        removed = [link_id for pair, link_id in current.items() if pair not in wanted]
+        if removed:
+            PlansLimitPolicies.objects.filter(id__in=removed).delete()
+
+        added = wanted - current.keys()
+        PlansLimitPolicies.objects.bulk_create(
+            [PlansLimitPolicies(plan_id=plan_id, limit_policy_id=policy_id) for plan_id, policy_id in added],
+            ignore_conflicts=True,
+        )
+        self.stats['links_removed'] += len(removed)
+        self.stats['links_created'] += len(added)
@@ -0,0 +1,74 @@
+"""
+ETag functions for conditional GETs (``django.views.decorators.http.condition``).
+
+The tags are computed from cheap database summaries instead of the rendered
+body, so a ``304 Not Modified`` answer serializes nothing:
+
+- catalog reads (plans, limit policies) use the catalog version stamp, which
+  every write to the catalog tables bumps (see ``catalog_cache``);
+- subscription reads use the row count and ``updated_at`` watermarks of the
+  subscriptions visible to the requester under RLS, together with the catalog
+  stamp for the nested plans.
+"""
+
+import hashlib
+from django.db.models import Count, Max
+
+from ..models import Subscriptions
+from .catalog_cache import get_catalog_version
+
+
+def _digest(*parts):
+    """Hash the parts of an ETag into a short opaque value."""
+    text = '|'.join('' if part is None else str(part) for part in parts)
+    return hashlib.md5(text.encode(), usedforsecurity=False).hexdigest()
+
+
+def catalog_etag(request, pk=None):
+    """
+    ETag of a plan or limit policy read, list or detail.
+
+    The catalog is the same for every user, so only the stamp, the requested
+    id and the query string (page size and cursor) go into the tag. The stamp
+    and the tag are kept on the request so that the catalog cache does not
+    read the stamp a second time and pre-rendered responses can reuse the tag.
+    """
+    request.catalog_version = get_catalog_version()
+    version, xmin = request.catalog_version
+    request.catalog_etag = _digest('catalog', version, xmin, pk, request.GET.urlencode())
+    return request.catalog_etag
+
+
+def subscription_etag(request, pk=None):
+    """
+    ETag of a subscription read, list or detail.
+
+    RLS already restricts the aggregate to the requester's rows; the user id
+    is part of the tag as well, so two users never share one. Returns None for
+    a detail read of a subscription that is not visible, letting the view
+    answer 404.
+    """
+    subscriptions = Subscriptions.objects.all()
+    if pk is not None:
+        subscriptions = subscriptions.filter(pk=pk)
+
+    summary = subscriptions.aggregate(
+        count=Count('pk'),
+        watermark=Max('updated_at'),
+        tenant_watermark=Max('tenant__updated_at'),
+    )
+    if pk is not None and not summary['count']:
+        return None
+
+    version, xmin = get_catalog_version()
+    return _digest(
+        'subscriptions',
+        getattr(request.user, 'id', None),
+        pk,
+        request.GET.urlencode(),
+        summary['count'],
+        summary['watermark'] and summary['watermark'].isoformat(),
+        summary['tenant_watermark'] and summary['tenant_watermark'].isoformat(),
+        version,
+        xmin,
+    )
@@ -0,0 +1,98 @@
+"""
+Per-request database instrumentation.
+
+A ``QueryInstrumentation`` collector is installed as a connection execute
+wrapper for the duration of a request. It counts the statements, sums the
+time spent executing them, remembers the slowest one and separates the time
+spent installing the RLS context.
+"""
+
+import time
+from django.conf import settings
+
+from .rls_utils import is_rls_context_statement
+
+
+DB_INSTRUMENTATION_DEFAULTS = {
+    'SERVER_TIMING': True,
+    'LOG': True,
+    'SLOWEST_STATEMENT_LENGTH': 200,
+}
+
+
+def get_instrumentation_setting(name):
+    """
+    Return a DB_INSTRUMENTATION setting, falling back to its default value.
+
+    Args:
+        name (str): Setting name, e.g. 'SERVER_TIMING'
+    """
+    return getattr(settings, 'DB_INSTRUMENTATION', {}).get(name, DB_INSTRUMENTATION_DEFAULTS[name])
+
+
+class QueryInstrumentation:
+    """
+    Connection execute wrapper that measures the statements of one request.
+
+    Statements executed from inside another wrapped statement, such as the RLS
+    context installed by ``LazyRLSContext`` in front of the first query, are
+    counted on their own and their time is not counted twice.
+
+    Only the SQL text of the slowest statement is kept, never its parameters.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        self.rls_duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = None
+        self._nested = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            own = elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            self.record(sql, own)
+
+    def record(self, sql, duration):
+        """Record one executed statement and its duration in seconds."""
+        self.queries += 1
+        self.duration += duration
+        if is_rls_context_statement(sql):
+            self.rls_duration += duration
+        if duration >= self.slowest_duration:
+            self.slowest_duration = duration
+            self.slowest_sql = sql
+
+    def server_timing(self):
+        """
+        Render the measurements as a ``Server-Timing`` header value.
+
+        Durations are in milliseconds; ``db`` includes ``rls``.
+        """
+        return ', '.join([
+            f'db;dur={self.duration * 1000:.3f};desc="{self.queries} queries"',
+            f'rls;dur={self.rls_duration * 1000:.3f}',
+            f'db-slowest;dur={self.slowest_duration * 1000:.3f}',
+        ])
+
+    def as_dict(self):
+        """Return the measurements as a JSON serializable dict, in milliseconds."""
+        slowest_sql = self.slowest_sql
+        max_length = get_instrumentation_setting('SLOWEST_STATEMENT_LENGTH')
+        if slowest_sql is not None and len(slowest_sql) > max_length:
+            slowest_sql = slowest_sql[:max_length] + '...'
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.duration * 1000, 3),
+            'rls_ms': round(self.rls_duration * 1000, 3),
+            'slowest_ms': round(self.slowest_duration * 1000, 3),
+            'slowest_sql': slowest_sql,
+        }
@@ -0,0 +1,80 @@
+"""
+Minimal in-process metrics registry.
+
+Metrics are kept per worker process and rendered in the Prometheus text
+exposition format by the metrics endpoint, so they can be scraped without
+adding a client library dependency.
+"""
+
+import threading
+
+
+class Metric:
+    """A named counter or gauge with optional labels."""
+
+    def __init__(self, name, documentation, metric_type):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        """Set the value for the given labels."""
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = float(value)
+
+    def inc(self, amount=1, **labels):
+        """Increment the value for the given labels."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels):
+        """Return the value for the given labels, or None if never recorded."""
+        return self._values.get(tuple(sorted(labels.items())))
+
+    def render(self):
+        """Render the metric in the Prometheus text exposition format."""
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.metric_type}',
+        ]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            if labels:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f'{self.name}{{{label_text}}} {value:g}')
+            else:
+                lines.append(f'{self.name} {value:g}')
+        return '\n'.join(lines)
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(name, documentation, metric_type):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = Metric(name, documentation, metric_type)
+        return metric
+
+
+def gauge(name, documentation):
+    """Return the gauge registered under ``name``, creating it if needed."""
+    return _get_or_create(name, documentation, 'gauge')
+
+
+def counter(name, documentation):
+    """Return the counter registered under ``name``, creating it if needed."""
+    return _get_or_create(name, documentation, 'counter')
+
+
+def render_metrics():
+    """Render every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
@@ -0,0 +1,165 @@
+"""
+Keyset (cursor) pagination for the list endpoints.
+
+Rows are ordered by ``(created_at, id)`` and a page starts right after the
+last row of the previous one, so fetching any page reads ``page_size + 1``
+rows from the ``(created_at, id)`` index however deep it is, instead of
+skipping an ever growing OFFSET.
+
+Pagination is opt-in: a request that sends neither ``?page_size=`` nor
+``?cursor=`` gets the whole list, as before, unless ``PAGINATION['PAGE_SIZE']``
+sets a default. The body of a paginated response stays a plain list; the
+cursor of the next page is sent in a ``Link: <...>; rel="next"`` header, as
+GitHub does.
+"""
+
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+PAGINATION_DEFAULTS = {
+    'PAGE_SIZE': None,
+    'MAX_PAGE_SIZE': 1000,
+}
+
+CURSOR_PARAM = 'cursor'
+PAGE_SIZE_PARAM = 'page_size'
+
+
+def get_pagination_setting(name):
+    """
+    Return a PAGINATION setting, falling back to its default value.
+
+    Args:
+        name (str): Setting name, e.g. 'PAGE_SIZE'
+    """
+    return getattr(settings, 'PAGINATION', {}).get(name, PAGINATION_DEFAULTS[name])
+
+
+def encode_cursor(created_at, pk):
+    """Encode the position after a row into an opaque cursor."""
+    payload = json.dumps([created_at.isoformat(), str(pk)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by ``encode_cursor``.
+
+    Raises:
+        ValidationError: If the cursor was not produced by ``encode_cursor``
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk = json.loads(payload)
+        return datetime.fromisoformat(created_at), uuid.UUID(pk)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValidationError("Invalid cursor.")
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by ``(created_at, id)`` for one request.
+
+    ``?page_size=`` picks the page size, capped at ``PAGINATION['MAX_PAGE_SIZE']``;
+    ``?cursor=`` continues after the last row of a previous page. Without
+    either, and without a ``PAGINATION['PAGE_SIZE']`` default, ``page_size``
+    is None and the whole list is returned.
+    """
+
+    ordering = ('created_at', 'id')
+
+    def __init__(self, request):
+        self.request = request
+        self.cursor = request.GET.get(CURSOR_PARAM) or None
+        self.page_size = self._parse_page_size(request.GET.get(PAGE_SIZE_PARAM))
+        self.after = decode_cursor(self.cursor) if self.cursor else None
+        self.next_cursor = None
+
+    def _parse_page_size(self, value):
+        if value in (None, ''):
+            page_size = get_pagination_setting('PAGE_SIZE')
+            if page_size is None and self.cursor is not None:
+                return get_pagination_setting('MAX_PAGE_SIZE')
+            return page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            raise ValidationError("page_size must be a positive integer.")
+        if page_size <= 0:
+            raise ValidationError("page_size must be a positive integer.")
+        return min(page_size, get_pagination_setting('MAX_PAGE_SIZE'))
+
+    def paginate(self, queryset):
+        """
+        Return the rows of the requested page and remember the next cursor.
+
+        Args:
+            queryset: The queryset to paginate, in any order
+
+        Returns:
+            list: At most ``page_size`` model instances, or all of them when
+                the request is not paginated
+        """
+        queryset = queryset.order_by(*self.ordering)
+        if self.page_size is None:
+            return list(queryset)
+        if self.after is not None:
+            created_at, pk = self.after
+            # The created_at >= bound lets Postgres start the index scan at the
+            # cursor; the OR only breaks ties between equal timestamps.
+            queryset = queryset.filter(
+                Q(created_at__gte=created_at)
+                & (Q(created_at__gt=created_at) | Q(id__gt=pk))
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk)
+        return rows
+
+    def serialize_page(self, queryset, serializer_class, context=None):
+        """
+        Paginate and serialize a queryset.
+
+        Args:
+            queryset: The queryset to paginate
+            serializer_class: Serializer of the queryset's model
+            context (dict, optional): Serializer context
+
+        Returns:
+            dict: ``results``, the serialized rows, and ``next``, the cursor of
+                the next page or None. Plain data, so pages can be cached.
+        """
+        rows = self.paginate(queryset)
+        return {
+            'results': list(serializer_class(rows, many=True, context=context).data),
+            'next': self.next_cursor,
+        }
+
+    def get_response(self, page):
+        """
+        Build the response of a page returned by ``serialize_page``.
+
+        Returns:
+            Response: The rows, with a ``Link`` header when there is a next page
+        """
+        return self.set_link(Response(page['results']), page['next'])
+
+    def set_link(self, response, next_cursor):
+        """Point the ``Link`` header of a response to the page after ``next_cursor``, if any."""
+        if next_cursor:
+            url = self.request.build_absolute_uri()
+            url = replace_query_param(url, PAGE_SIZE_PARAM, self.page_size)
+            url = replace_query_param(url, CURSOR_PARAM, next_cursor)
+            response['Link'] = f'<{url}>; rel="next"'
+        return response
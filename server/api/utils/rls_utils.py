@@ -6,12 +6,211 @@ including functions to check RLS status, validate policies, and test RLS behavio
 """
 
 import logging
-from django.db import connection
+import sys
+import time
+import uuid
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.transaction import TransactionManagementError
 from django.contrib.auth import get_user_model
 
+from ..enums.role import Role
+from . import metrics
+
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+RLS_DEFAULTS = {
+    'SINGLE_STATEMENT': True,
+    'LAZY': False,
+    'SCOPE': 'session',
+    'PUBLISH_TENANT_IDS': True,
+}
+
+RLS_SCOPE_SESSION = 'session'
+RLS_SCOPE_TRANSACTION = 'transaction'
+
+
+def get_rls_setting(name):
+    """
+    Read an RLS setting from ``settings.RLS``, falling back to the defaults.
+    
+    Args:
+        name (str): Setting name, e.g. 'SINGLE_STATEMENT'
+        
+    Returns:
+        The configured value for the setting
+    """
+    return getattr(settings, 'RLS', {}).get(name, RLS_DEFAULTS[name])
+
+
+def is_transaction_scoped():
+    """
+    Whether the RLS context is scoped to the current transaction.
+    
+    In transaction scope the variables are set with ``set_config(..., true)``,
+    the equivalent of ``SET LOCAL``, and disappear at COMMIT or ROLLBACK. This
+    keeps a server connection free of any identity between transactions, which
+    is required behind a transaction-mode pooler such as PgBouncer.
+    
+    Returns:
+        bool: True when ``RLS['SCOPE']`` is 'transaction'
+    """
+    return get_rls_setting('SCOPE') == RLS_SCOPE_TRANSACTION
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+    except ValueError:
+        return False
+    return True
+
+
+def build_rls_context_assignments(user_id=None, user_role=None, is_local=None):
+    """
+    Build the ``set_config`` expression for every RLS context variable.
+    
+    Variables that are not provided are reset to an empty string instead of
+    keeping the value left behind by a previous request on the same connection.
+    When only the user ID is known, the role is resolved in the database with
+    the ``get_user_role`` function used by the RLS policies.
+    
+    With ``RLS['PUBLISH_TENANT_IDS']`` enabled, the user's tenant IDs are
+    resolved once by ``get_user_tenant_ids`` and published as the
+    ``app.current_tenant_ids`` UUID array literal, which the policies compare
+    against instead of calling the function for every row. Otherwise the
+    variable is reset and the policies fall back to the function.
+    
+    Args:
+        user_id (str, optional): User ID to set
+        user_role (str, optional): User role to set
+        is_local (bool, optional): Scope the variables to the current
+            transaction. Defaults to the configured ``RLS['SCOPE']``.
+        
+    Returns:
+        list: (SQL expression, parameters) tuples, one per context variable
+    """
+    if is_local is None:
+        is_local = is_transaction_scoped()
+    scope = 'true' if is_local else 'false'
+    user_id = str(user_id) if user_id else ''
+    
+    if user_role or not user_id:
+        role_expression, role_params = "%s", [user_role or '']
+    else:
+        role_expression, role_params = "COALESCE(get_user_role(%s::UUID), '')", [user_id]
+    
+    if user_id and get_rls_setting('PUBLISH_TENANT_IDS'):
+        if _is_uuid(user_id):
+            tenants_expression = "COALESCE(get_user_tenant_ids(%s::UUID)::TEXT, '{}')"
+            tenants_params = [user_id]
+        else:
+            tenants_expression, tenants_params = "%s", ['{}']
+    else:
+        tenants_expression, tenants_params = "%s", ['']
+    
+    return [
+        (f"set_config('app.current_user_id', %s, {scope})", [user_id]),
+        (f"set_config('app.current_user_role', {role_expression}, {scope})", role_params),
+        (f"set_config('app.current_tenant_ids', {tenants_expression}, {scope})", tenants_params),
+    ]
+
+
+def build_rls_context_statement(user_id=None, user_role=None, is_local=None):
+    """
+    Build a single statement that installs the complete RLS context.
+    
+    Args:
+        user_id (str, optional): User ID to set
+        user_role (str, optional): User role to set
+        is_local (bool, optional): Scope the variables to the current
+            transaction. Defaults to the configured ``RLS['SCOPE']``.
+        
+    Returns:
+        tuple: SQL string and its parameters
+    """
+    assignments = build_rls_context_assignments(user_id, user_role, is_local)
+    sql = "SELECT " + ", ".join(expression for expression, _ in assignments)
+    params = [param for _, expression_params in assignments for param in expression_params]
+    return sql, params
+
+
+def is_rls_context_statement(sql):
+    """
+    Tell whether a statement installs or resets the RLS context.
+    
+    Matches the statements built from ``build_rls_context_assignments``, which
+    all start with the ``set_config`` of an ``app.current_*`` variable.
+    """
+    return isinstance(sql, str) and sql.startswith("SELECT set_config('app.current_")
+
+
+RLS_TABLES = (
+    'users', 'tenants', 'user_tenants', 'plans',
+    'limit_policies', 'plans_limit_policies',
+    'subscriptions', 'usages',
+)
+
+_rls_status = {'tables': None, 'checked_at': None}
+
+rls_enabled_gauge = metrics.gauge(
+    'eshtarek_rls_enabled',
+    'Whether row level security is enabled on the table (1) or not (0)',
+)
+rls_checked_at_gauge = metrics.gauge(
+    'eshtarek_rls_check_timestamp_seconds',
+    'UNIX time of the last row level security catalog check',
+)
+
+
+def _query_rls_status(cursor):
+    """Read the RLS flag of every expected table with one catalog query and record it."""
+    cursor.execute("""
+        SELECT c.relname, c.relrowsecurity
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = ANY(%s)
+    """, [list(RLS_TABLES)])
+    
+    found = dict(cursor.fetchall())
+    result = {table: bool(found.get(table, False)) for table in RLS_TABLES}
+    _record_rls_status(result, missing=[table for table in RLS_TABLES if table not in found])
+    return result
+
+
+def _record_rls_status(tables, missing=()):
+    """Cache an RLS catalog check result and publish it as metrics."""
+    _rls_status['tables'] = dict(tables)
+    _rls_status['checked_at'] = time.time()
+    
+    for table, enabled in tables.items():
+        rls_enabled_gauge.set(1 if enabled else 0, table=table)
+    rls_checked_at_gauge.set(_rls_status['checked_at'])
+    
+    disabled = [table for table, enabled in tables.items() if not enabled and table not in missing]
+    if disabled:
+        logger.warning(f"RLS is not enabled on tables: {', '.join(disabled)}")
+    if missing:
+        logger.debug(f"RLS tables not found, database may not be migrated: {', '.join(missing)}")
+
+
+def check_rls_on_connect(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver that runs the RLS catalog check once per
+    physical PostgreSQL connection instead of once per request.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    
+    # Use the raw DB-API cursor so the check stays out of request execute
+    # wrappers such as the lazy RLS context.
+    try:
+        with connection.connection.cursor() as cursor:
+            _query_rls_status(cursor)
+    except Exception as e:
+        logger.error(f"Error checking RLS status on connect: {str(e)}")
+
 
 class RLSUtils:
     """Utility class for RLS operations."""
@@ -19,28 +218,33 @@ class RLSUtils:
     @staticmethod
     def get_current_rls_context():
         """
-        Get the current RLS context (user ID and role) from PostgreSQL session variables.
+        Get the current RLS context (user ID, role and published tenant IDs)
+        from PostgreSQL session variables.
         
         Returns:
-            dict: Dictionary containing current_user_id and current_user_role
+            dict: Dictionary containing current_user_id, current_user_role and
+            current_tenant_ids (None when the tenant IDs are not published)
         """
         try:
             with connection.cursor() as cursor:
-                cursor.execute("SELECT current_setting('app.current_user_id', true)")
-                user_id = cursor.fetchone()[0]
-                
-                cursor.execute("SELECT current_setting('app.current_user_role', true)")
-                user_role = cursor.fetchone()[0]
+                cursor.execute(
+                    "SELECT current_setting('app.current_user_id', true), "
+                    "current_setting('app.current_user_role', true), "
+                    "NULLIF(current_setting('app.current_tenant_ids', true), '')::UUID[]"
+                )
+                user_id, user_role, tenant_ids = cursor.fetchone()
                 
                 return {
                     'current_user_id': user_id if user_id else None,
-                    'current_user_role': user_role if user_role else None
+                    'current_user_role': user_role if user_role else None,
+                    'current_tenant_ids': tenant_ids
                 }
         except Exception as e:
             logger.error(f"Error getting RLS context: {str(e)}")
             return {
                 'current_user_id': None,
-                'current_user_role': None
+                'current_user_role': None,
+                'current_tenant_ids': None
             }
     
     @staticmethod
@@ -52,21 +256,37 @@ class RLSUtils:
             user_id (str, optional): User ID to set
             user_role (str, optional): User role to set
             
+        Raises:
+            TransactionManagementError: If ``RLS['SCOPE']`` is 'transaction'
+                and no transaction is open, since the context would be
+                discarded as soon as the statement commits.
+            
         Warning:
             This function should only be used for testing or special administrative
             operations. Normal request processing should rely on the middleware.
         """
+        if is_transaction_scoped() and not connection.in_atomic_block:
+            raise TransactionManagementError(
+                "The RLS context is transaction scoped; call set_rls_context() "
+                "inside transaction.atomic() or use RLSContextManager."
+            )
+        
+        scope = 'true' if is_transaction_scoped() else 'false'
+        
         try:
             with connection.cursor() as cursor:
                 if user_id:
+                    # The tenant IDs always follow the user ID, so the policies
+                    # never see the tenants of a previously set user.
+                    _, _, (tenants_expression, tenants_params) = build_rls_context_assignments(user_id, user_role)
                     cursor.execute(
-                        "SELECT set_config('app.current_user_id', %s, false)",
-                        [str(user_id)]
+                        f"SELECT set_config('app.current_user_id', %s, {scope}), {tenants_expression}",
+                        [str(user_id), *tenants_params]
                     )
                 
                 if user_role:
                     cursor.execute(
-                        "SELECT set_config('app.current_user_role', %s, false)",
+                        f"SELECT set_config('app.current_user_role', %s, {scope})",
                         [user_role]
                     )
                     
@@ -83,8 +303,7 @@ class RLSUtils:
         """
         try:
             with connection.cursor() as cursor:
-                cursor.execute("SELECT set_config('app.current_user_id', '', false)")
-                cursor.execute("SELECT set_config('app.current_user_role', '', false)")
+                cursor.execute(*build_rls_context_statement())
                 
                 logger.debug("Cleared RLS context")
                 
@@ -92,40 +311,51 @@ class RLSUtils:
             logger.error(f"Error clearing RLS context: {str(e)}")
     
     @staticmethod
-    def check_rls_enabled():
+    def check_rls_enabled(cached=False, using=None):
         """
         Check if RLS is enabled on all expected tables.
         
+        The catalog is read with a single query and the result is cached for the
+        process. The check runs once per physical connection from the
+        ``connection_created`` signal, so ``cached=True`` normally answers
+        without touching the database.
+        
+        Args:
+            cached (bool): Return the last recorded status when there is one
+            using: Database connection to check (defaults to the default connection)
+        
         Returns:
             dict: Dictionary mapping table names to their RLS status
         """
-        tables = [
-            'users', 'tenants', 'user_tenants', 'plans', 
-            'limit_policies', 'plans_limit_policies', 
-            'subscriptions', 'usages'
-        ]
+        if cached and _rls_status['tables'] is not None:
+            return dict(_rls_status['tables'])
+        
+        db = using or connection
         
         try:
-            with connection.cursor() as cursor:
-                result = {}
-                for table in tables:
-                    cursor.execute("""
-                        SELECT relrowsecurity 
-                        FROM pg_class 
-                        WHERE relname = %s AND relnamespace = (
-                            SELECT oid FROM pg_namespace WHERE nspname = 'public'
-                        )
-                    """, [table])
-                    
-                    row = cursor.fetchone()
-                    result[table] = row[0] if row else False
-                
-                return result
+            with db.cursor() as cursor:
+                return _query_rls_status(cursor)
                 
         except Exception as e:
             logger.error(f"Error checking RLS status: {str(e)}")
             return {}
     
+    @staticmethod
+    def get_rls_status():
+        """
+        Get the last recorded RLS status without querying the database.
+        
+        Returns:
+            dict: tables (table name to RLS status, or None if never checked),
+            healthy (bool) and checked_at (UNIX timestamp or None)
+        """
+        tables = _rls_status['tables']
+        return {
+            'tables': dict(tables) if tables is not None else None,
+            'healthy': bool(tables) and all(tables.values()),
+            'checked_at': _rls_status['checked_at'],
+        }
+    
     @staticmethod
     def get_user_tenant_ids(user_id):
         """
@@ -172,15 +402,15 @@ class RLSUtils:
         }
         
         try:
-            RLSUtils.set_rls_context(user1.id, user1.role)
-            with connection.cursor() as cursor:
-                cursor.execute(f"SELECT id FROM {test_table}")
-                results['user1_can_see'] = [row[0] for row in cursor.fetchall()]
+            with RLSContextManager(user1.id, user1.role):
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SELECT id FROM {test_table}")
+                    results['user1_can_see'] = [row[0] for row in cursor.fetchall()]
             
-            RLSUtils.set_rls_context(user2.id, user2.role)
-            with connection.cursor() as cursor:
-                cursor.execute(f"SELECT id FROM {test_table}")
-                results['user2_can_see'] = [row[0] for row in cursor.fetchall()]
+            with RLSContextManager(user2.id, user2.role):
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SELECT id FROM {test_table}")
+                    results['user2_can_see'] = [row[0] for row in cursor.fetchall()]
             
             # Check if isolation is working
             # For most tables, different users should see different data sets
@@ -197,9 +427,88 @@ class RLSUtils:
         except Exception as e:
             logger.error(f"Error testing RLS isolation: {str(e)}")
             return results
-        finally:
-            # Clean up
-            RLSUtils.clear_rls_context()
+
+
+class RLSContextManager:
+    """
+    Context manager that runs a block of code under a given RLS context.
+    
+    The context in place before the block, e.g. the identity of the request
+    the block runs in, is saved on entry and put back on exit. In transaction
+    scope the block runs inside ``transaction.atomic()`` and the context is
+    installed with ``set_config(..., true)``, so a block that opens the
+    transaction leaves no context behind once it ends.
+    
+    A user ID or a role is required: administrative commands pass the
+    platform admin role explicitly to get past the RLS write policies.
+    
+    Usage:
+        with RLSContextManager(user_id=user.id, user_role=user.role):
+            Tenants.objects.count()
+    
+    Raises:
+        ValueError: If neither a user ID nor a role is given
+    """
+    
+    SAVE_CONTEXT_SQL = (
+        "SELECT COALESCE(current_setting('app.current_user_id', true), ''), "
+        "COALESCE(current_setting('app.current_user_role', true), ''), "
+        "COALESCE(current_setting('app.current_tenant_ids', true), '')"
+    )
+    
+    def __init__(self, user_id=None, user_role=None):
+        if user_id is None and user_role is None:
+            raise ValueError("RLSContextManager needs a user_id or a user_role.")
+        self.user_id = user_id
+        self.user_role = user_role
+        self.atomic = None
+        self.previous = None
+    
+    def __enter__(self):
+        nested = connection.in_atomic_block
+        if is_transaction_scoped():
+            self.atomic = transaction.atomic()
+            self.atomic.__enter__()
+        
+        try:
+            with connection.cursor() as cursor:
+                # Outside a transaction, a transaction scoped context ends with
+                # the block's own transaction and needs no saving
+                if nested or not is_transaction_scoped():
+                    cursor.execute(self.SAVE_CONTEXT_SQL)
+                    self.previous = cursor.fetchone()
+                cursor.execute(*build_rls_context_statement(self.user_id, self.user_role))
+        except Exception:
+            if self.atomic is not None:
+                self.atomic.__exit__(*sys.exc_info())
+            raise
+        
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.previous is not None:
+            try:
+                self._restore()
+            except (DatabaseError, TransactionManagementError):
+                # A transaction broken by the error refuses the statement; the
+                # rollback that follows reverts the context instead
+                if exc_type is None or not connection.in_atomic_block:
+                    raise
+        
+        if self.atomic is not None:
+            return self.atomic.__exit__(exc_type, exc_value, traceback)
+        return False
+    
+    def _restore(self):
+        """Put back the context saved on entry, in the scope it was installed in."""
+        scope = 'true' if is_transaction_scoped() else 'false'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT set_config('app.current_user_id', %s, {scope}), "
+                f"set_config('app.current_user_role', %s, {scope}), "
+                f"set_config('app.current_tenant_ids', %s, {scope})",
+                list(self.previous)
+            )
 
 
 def debug_rls_policies():
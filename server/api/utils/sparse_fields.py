@@ -0,0 +1,61 @@
+"""
+Parsing of the ``?fields=`` and ``?expand=`` query parameters.
+
+``?fields=id,status`` keeps only the listed top-level fields of a response;
+``?expand=plan,plan.policies`` lists the relations to embed as objects. A
+relation that is not expanded is rendered as its primary key, which the
+serializer reads from the foreign key column without fetching the related row.
+"""
+
+from django.core.exceptions import ValidationError
+
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def _parse_list(request, param, allowed):
+    value = request.GET.get(param)
+    if value is None:
+        return None
+
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = sorted(names - set(allowed))
+    if unknown:
+        raise ValidationError(
+            f"Unknown {param}: {', '.join(unknown)}. Must be among {', '.join(allowed)}."
+        )
+    return names
+
+
+def parse_sparse_fieldset(request, fields, expandable):
+    """
+    Read the requested fields and expanded relations of a GET.
+
+    Without either parameter every relation is expanded, as responses were
+    before the parameters existed. Expanding a nested relation, e.g.
+    ``plan.policies``, expands its parents as well.
+
+    Args:
+        request: The request being served
+        fields (list): Names accepted by ``?fields=``
+        expandable (list): Relation paths accepted by ``?expand=``
+
+    Returns:
+        tuple: The set of fields to keep, or None for all of them, and the set
+            of relation paths to expand
+
+    Raises:
+        ValidationError: If a parameter names an unknown field or relation
+    """
+    selected = _parse_list(request, FIELDS_PARAM, fields)
+    expand = _parse_list(request, EXPAND_PARAM, expandable)
+
+    if selected is None and expand is None:
+        return None, set(expandable)
+
+    expand = expand or set()
+    for path in list(expand):
+        parts = path.split('.')
+        expand.update('.'.join(parts[:i]) for i in range(1, len(parts)))
+    return selected, expand
@@ -0,0 +1,217 @@
+"""
+Expiry of subscriptions whose billing period has ended.
+
+Nothing expires a subscription when its ``ended_at`` passes, and checking it
+on every read would cost each read. The sweeper does it in the background:
+due subscriptions are found through the partial index
+``sub_expirable_ended_at_index`` on
+``(ended_at) WHERE status = 'active' AND NOT auto_renew``, the same condition
+as the sweep, so rows left to the renewal engine are never read. They are
+moved to ``expired`` in bounded chunks. Each chunk is a single
+``UPDATE ... RETURNING`` statement committed on its own, so row locks are only
+held for one chunk. ``FOR UPDATE SKIP LOCKED`` lets several sweepers (one per
+worker process) run at once without waiting on each other or on a request
+that is updating the same subscription.
+
+The sweep runs from the ``expire_subscriptions`` management command (cron,
+a sidecar) or from the in-process ``SubscriptionExpiryScheduler`` enabled by
+``SUBSCRIPTION_EXPIRY['SCHEDULER']``.
+
+Subscriptions with ``auto_renew`` set are left to the renewal engine
+(api.utils.subscription_renewal).
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from ..enums.role import Role
+from ..enums.subscriptions_status import SubscriptionsStatus
+from . import metrics
+from .rls_utils import RLSContextManager
+
+logger = logging.getLogger(__name__)
+
+
+SUBSCRIPTION_EXPIRY_DEFAULTS = {
+    'CHUNK_SIZE': 1000,
+    'INTERVAL': 60,
+    'SCHEDULER': False,
+}
+
+EXPIRE_CHUNK_SQL = """
+    WITH due AS (
+        SELECT id FROM subscriptions
+        WHERE status = %(active)s AND ended_at <= %(now)s AND NOT auto_renew
+        ORDER BY ended_at
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE subscriptions
+    SET status = %(expired)s, version = subscriptions.version + 1, updated_at = %(now)s
+    FROM due
+    WHERE subscriptions.id = due.id
+    RETURNING subscriptions.ended_at
+"""
+
+expired_counter = metrics.counter(
+    'eshtarek_subscriptions_expired_total',
+    'Subscriptions moved from active to expired by the expiry sweeper',
+)
+sweeps_counter = metrics.counter(
+    'eshtarek_subscription_expiry_sweeps_total',
+    'Expiry sweeps run, by outcome',
+)
+lag_gauge = metrics.gauge(
+    'eshtarek_subscription_expiry_lag_seconds',
+    'How long past its end the most overdue subscription of the last sweep was',
+)
+duration_gauge = metrics.gauge(
+    'eshtarek_subscription_expiry_duration_seconds',
+    'Duration of the last expiry sweep',
+)
+last_sweep_gauge = metrics.gauge(
+    'eshtarek_subscription_expiry_last_sweep_timestamp_seconds',
+    'UNIX time at which the last successful expiry sweep finished',
+)
+
+
+def get_subscription_expiry_setting(name):
+    """
+    Return a SUBSCRIPTION_EXPIRY setting, falling back to its default value.
+
+    Args:
+        name (str): Setting name, e.g. 'CHUNK_SIZE'
+    """
+    return getattr(settings, 'SUBSCRIPTION_EXPIRY', {}).get(name, SUBSCRIPTION_EXPIRY_DEFAULTS[name])
+
+
+class SubscriptionExpirySweeper:
+    """
+    Expire the active subscriptions whose ``ended_at`` has passed.
+
+    Usage:
+        stats = SubscriptionExpirySweeper().sweep()
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or get_subscription_expiry_setting('CHUNK_SIZE')
+
+    def sweep(self, max_chunks=None):
+        """
+        Expire due subscriptions chunk by chunk until none is left.
+
+        Subscriptions that end while the sweep runs are left to the next one,
+        so a sweep always terminates.
+
+        Args:
+            max_chunks (int, optional): Stop after this many chunks
+
+        Returns:
+            dict: ``expired`` and ``chunks`` counts, and ``lag_seconds``, how
+                long past its end the most overdue expired subscription was
+        """
+        start = time.perf_counter()
+        now = timezone.now()
+        stats = {'expired': 0, 'chunks': 0, 'lag_seconds': 0.0}
+
+        try:
+            while max_chunks is None or stats['chunks'] < max_chunks:
+                ended_at = self._expire_chunk(now)
+                stats['chunks'] += 1
+                stats['expired'] += len(ended_at)
+                expired_counter.inc(len(ended_at))
+                if ended_at:
+                    stats['lag_seconds'] = max(stats['lag_seconds'], (now - min(ended_at)).total_seconds())
+                if len(ended_at) < self.chunk_size:
+                    break
+        except Exception:
+            sweeps_counter.inc(outcome='error')
+            raise
+
+        sweeps_counter.inc(outcome='success')
+        lag_gauge.set(stats['lag_seconds'])
+        duration_gauge.set(time.perf_counter() - start)
+        last_sweep_gauge.set(time.time())
+        return stats
+
+    def _expire_chunk(self, now):
+        """Expire one chunk in its own transaction and return the ``ended_at`` of its rows."""
+        # Run as a platform admin to get past the RLS update policy. In
+        # transaction scope the context manager also commits the chunk.
+        with RLSContextManager(user_role=Role.PLATFORM_ADMIN.value):
+            with connection.cursor() as cursor:
+                cursor.execute(EXPIRE_CHUNK_SQL, {
+                    'active': SubscriptionsStatus.ACTIVE.value,
+                    'expired': SubscriptionsStatus.EXPIRED.value,
+                    'now': now,
+                    'limit': self.chunk_size,
+                })
+                return [row[0] for row in cursor.fetchall()]
+
+
+class SubscriptionExpiryScheduler:
+    """
+    Daemon thread running an expiry sweep every ``SUBSCRIPTION_EXPIRY['INTERVAL']``
+    seconds in the current process.
+
+    Usage:
+        scheduler = SubscriptionExpiryScheduler()
+        scheduler.start()
+        ...
+        scheduler.stop()
+    """
+
+    def __init__(self, interval=None, sweeper=None):
+        self.interval = interval or get_subscription_expiry_setting('INTERVAL')
+        self.sweeper = sweeper or SubscriptionExpirySweeper()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the sweeping thread, unless it is already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='subscription-expiry', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Ask the thread to stop and wait for the current sweep to finish."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                stats = self.sweeper.sweep()
+                if stats['expired']:
+                    logger.info(f"Expired {stats['expired']} subscriptions in {stats['chunks']} chunks")
+            except Exception as e:
+                logger.error(f"Error in subscription expiry sweep: {str(e)}")
+            finally:
+                # The thread holds its own connection; drop it if it broke or
+                # reached CONN_MAX_AGE, as the request cycle would.
+                close_old_connections()
+            self._stopped.wait(self.interval)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_expiry_scheduler(sender=None, **kwargs):
+    """
+    ``request_started`` receiver that starts the process's expiry scheduler
+    on its first request, so management commands and test runs never start it.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SubscriptionExpiryScheduler()
+            _scheduler.start()
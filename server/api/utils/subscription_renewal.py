@@ -0,0 +1,213 @@
+"""
+Renewal of auto-renewing subscriptions whose billing period has ended.
+
+The billing period of a plan is ``billing_duration`` times the length of its
+``billing_cycle`` (``BILLING_CYCLE_LENGTHS``). ``billing_period_sql`` builds
+it as a SQL expression for the statements that create and renew subscriptions.
+
+``SubscriptionRenewalEngine`` renews the active subscriptions with
+``auto_renew`` set whose ``ended_at`` is at or before a cutoff. It finds them
+through the partial index ``sub_renewable_ended_at_index`` and renews them in
+chunks. Each chunk is a single set-based ``UPDATE ... RETURNING`` committed on
+its own, and each renewed subscription gets the window that contains the
+cutoff: it starts at the old ``ended_at`` moved forward by whole billing
+periods. A renewed subscription therefore ends after the cutoff and is no
+longer due, which makes a run idempotent for its cutoff and resumable after an
+interruption: running it again renews only what is left.
+
+Chunks are selected ``FOR UPDATE SKIP LOCKED``, so ``workers`` processes can
+renew at the same time without splitting the work up front.
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections
+from django.utils import timezone
+
+from ..enums.role import Role
+from ..enums.subscriptions_billing_cycle import SubscriptionsBillingCycle
+from ..enums.subscriptions_status import SubscriptionsStatus
+from . import metrics
+from .rls_utils import RLSContextManager
+
+
+SUBSCRIPTION_RENEWAL_DEFAULTS = {
+    'CHUNK_SIZE': 1000,
+    'WORKERS': 1,
+}
+
+BILLING_CYCLE_LENGTHS = {
+    SubscriptionsBillingCycle.MONTHLY.value: timedelta(weeks=4),
+    SubscriptionsBillingCycle.ANNUALLY.value: timedelta(days=365),
+}
+
+
+def billing_period_sql(billing_cycle, billing_duration):
+    """
+    SQL expression of the billing period over the columns of a plan. It is
+    NULL for an unknown billing cycle.
+
+    Args:
+        billing_cycle (str): Column holding the billing cycle, e.g. 'plans.billing_cycle'
+        billing_duration (str): Column holding the billing duration
+    """
+    cycle_lengths = ' '.join(
+        f"WHEN '{cycle}' THEN INTERVAL '{length.days} days'" for cycle, length in BILLING_CYCLE_LENGTHS.items()
+    )
+    return f"(CASE {billing_cycle} {cycle_lengths} END) * {billing_duration}"
+
+
+RENEW_CHUNK_SQL = """
+    WITH due AS (
+        SELECT
+            subscriptions.id,
+            subscriptions.ended_at,
+            {period} AS period
+        FROM subscriptions
+        JOIN plans ON plans.id = subscriptions.plan_id
+        WHERE subscriptions.status = %(active)s
+            AND subscriptions.auto_renew
+            AND subscriptions.ended_at <= %(cutoff)s
+            AND plans.billing_cycle IN %(billing_cycles)s
+        ORDER BY subscriptions.ended_at
+        LIMIT %(limit)s
+        FOR UPDATE OF subscriptions SKIP LOCKED
+    ), windows AS (
+        SELECT
+            id,
+            period,
+            ended_at + period * FLOOR(EXTRACT(EPOCH FROM %(cutoff)s - ended_at) / EXTRACT(EPOCH FROM period))
+                AS started_at
+        FROM due
+    )
+    UPDATE subscriptions
+    SET
+        started_at = windows.started_at,
+        ended_at = windows.started_at + windows.period,
+        version = subscriptions.version + 1,
+        updated_at = %(now)s
+    FROM windows
+    WHERE subscriptions.id = windows.id
+    RETURNING subscriptions.id
+""".format(period=billing_period_sql('plans.billing_cycle', 'plans.billing_duration'))
+
+renewed_counter = metrics.counter(
+    'eshtarek_subscriptions_renewed_total',
+    'Subscriptions renewed for a new billing period by the renewal engine',
+)
+throughput_gauge = metrics.gauge(
+    'eshtarek_subscription_renewal_throughput',
+    'Renewals per second of the last renewal run',
+)
+
+
+def get_subscription_renewal_setting(name):
+    """
+    Return a SUBSCRIPTION_RENEWAL setting, falling back to its default value.
+
+    Args:
+        name (str): Setting name, e.g. 'CHUNK_SIZE'
+    """
+    return getattr(settings, 'SUBSCRIPTION_RENEWAL', {}).get(name, SUBSCRIPTION_RENEWAL_DEFAULTS[name])
+
+
+class SubscriptionRenewalEngine:
+    """
+    Renew the auto-renewing subscriptions due at a cutoff.
+
+    Usage:
+        stats = SubscriptionRenewalEngine(workers=4).run()
+    """
+
+    def __init__(self, cutoff=None, chunk_size=None, workers=None):
+        self.cutoff = cutoff or timezone.now()
+        self.chunk_size = chunk_size or get_subscription_renewal_setting('CHUNK_SIZE')
+        self.workers = workers or get_subscription_renewal_setting('WORKERS')
+
+    def run(self, max_chunks=None):
+        """
+        Renew due subscriptions until none is left, in this process or in a
+        pool of ``workers`` processes.
+
+        Args:
+            max_chunks (int, optional): Stop each worker after this many chunks
+
+        Returns:
+            dict: ``renewed`` and ``chunks`` counts, the run's ``seconds`` and
+                its throughput in ``renewals_per_second``
+        """
+        start = time.perf_counter()
+        if self.workers > 1:
+            results = self._run_pool(max_chunks)
+        else:
+            results = [self.renew(max_chunks)]
+        seconds = time.perf_counter() - start
+
+        stats = {
+            'renewed': sum(result['renewed'] for result in results),
+            'chunks': sum(result['chunks'] for result in results),
+            'seconds': seconds,
+        }
+        stats['renewals_per_second'] = stats['renewed'] / seconds if seconds else 0.0
+        throughput_gauge.set(stats['renewals_per_second'])
+        return stats
+
+    def renew(self, max_chunks=None):
+        """
+        Renew due subscriptions chunk by chunk in the current process.
+
+        Args:
+            max_chunks (int, optional): Stop after this many chunks
+
+        Returns:
+            dict: ``renewed`` and ``chunks`` counts
+        """
+        stats = {'renewed': 0, 'chunks': 0}
+        while max_chunks is None or stats['chunks'] < max_chunks:
+            renewed = self._renew_chunk()
+            stats['chunks'] += 1
+            stats['renewed'] += renewed
+            renewed_counter.inc(renewed)
+            if renewed < self.chunk_size:
+                break
+        return stats
+
+    def _renew_chunk(self):
+        """Renew one chunk in its own transaction and return the number of renewals."""
+        # Run as a platform admin to get past the RLS update policy. In
+        # transaction scope the context manager also commits the chunk.
+        with RLSContextManager(user_role=Role.PLATFORM_ADMIN.value):
+            with connection.cursor() as cursor:
+                cursor.execute(RENEW_CHUNK_SQL, {
+                    'active': SubscriptionsStatus.ACTIVE.value,
+                    'billing_cycles': tuple(BILLING_CYCLE_LENGTHS),
+                    'cutoff': self.cutoff,
+                    'now': timezone.now(),
+                    'limit': self.chunk_size,
+                })
+                return cursor.rowcount
+
+    def _run_pool(self, max_chunks):
+        """Run ``renew`` in ``workers`` forked processes sharing the due subscriptions."""
+        # Forked children must open their own connections instead of sharing
+        # the parent's sockets.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            futures = [pool.submit(_renew_in_worker, self, max_chunks) for _ in range(self.workers)]
+            results = [future.result() for future in futures]
+        # Metrics recorded by the children died with them
+        renewed_counter.inc(sum(result['renewed'] for result in results))
+        return results
+
+
+def _renew_in_worker(engine, max_chunks):
+    """Entry point of a pool worker."""
+    try:
+        return engine.renew(max_chunks)
+    finally:
+        connections.close_all()
@@ -1,13 +1,24 @@
 from tokenize import TokenError
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework import status
+from rest_framework import serializers, status
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
 from .permissions import IsAdmin, IsTenantAdmin, IsAdminOrTenantAdmin
 from .serializers import *
 from .enums.subscriptions_status import SubscriptionsStatus
+from .utils.catalog_cache import catalog_cache, get_catalog_cache_setting, prerendered_response, render_page
+from .utils.catalog_import import CatalogImportError, CatalogImporter, decode_stream, read_records, validate_records
+from .utils.etags import catalog_etag, subscription_etag
+from .utils.metrics import render_metrics
+from .utils.pagination import KeysetPaginator
+from .utils.rls_utils import RLSUtils
 
 # Create your views here.
 class UserRegistrationView(APIView):    
@@ -122,6 +133,37 @@ class LoginView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
 
+def catalog_list_response(request, name, queryset, serializer_class):
+    """
+    Serve a page of a catalog list (plans or limit policies).
+    
+    First pages come from the catalog cache; with CATALOG_CACHE['PRERENDER']
+    on, and JSON negotiated, their bytes are cached and served as they are.
+    Later pages are built on each request.
+    
+    Args:
+        request: The request being served
+        name (str): Catalog cache entry prefix, e.g. 'plans'
+        queryset: Rows of the list, in any order
+        serializer_class: Serializer of the rows
+    
+    Raises:
+        ValidationError: If the page size or cursor is invalid
+    """
+    paginator = KeysetPaginator(request)
+    build = lambda: paginator.serialize_page(queryset, serializer_class)
+    if paginator.cursor is not None:
+        return paginator.get_response(build())
+    
+    version = getattr(request, 'catalog_version', None)
+    if get_catalog_cache_setting('PRERENDER') and request.accepted_renderer.format == 'json':
+        page = catalog_cache.get(f'{name}:{paginator.page_size}:rendered', lambda: render_page(build()), version=version)
+        return paginator.set_link(prerendered_response(request, page), page['next'])
+    
+    page = catalog_cache.get(f'{name}:{paginator.page_size}', build, version=version)
+    return paginator.get_response(page)
+
+
 class PlanView(APIView):
     permission_classes = [IsAuthenticated, IsAdmin]
 
@@ -130,47 +172,38 @@ class PlanView(APIView):
             serializer = PlanSerializer(data=request.data, context={'request': request})
             if serializer.is_valid():
                 plan = serializer.save()
-                plan = Plans.objects.prefetch_related(
-                    'plan_limit_policies__limit_policy'
-                ).get(pk=plan.pk)
+                plan = PlanSerializer.get_queryset().get(pk=plan.pk)
                 return Response(PlanSerializer(plan).data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
 
+    @method_decorator([cache_control(private=True, no_cache=True), condition(etag_func=catalog_etag)])
     def get(self, request, pk=None):
         try:
             if pk:
                 
-                plan = Plans.objects.prefetch_related(
-                    'plan_limit_policies__limit_policy'
-                ).get(pk=pk)
+                plan = PlanSerializer.get_queryset().get(pk=pk)
                 
                 serializer = PlanSerializer(plan)
                 return Response(serializer.data, status=status.HTTP_200_OK)
             else:
-                plans = Plans.objects.prefetch_related(
-                    'plan_limit_policies__limit_policy'
-                ).all()
-                serializer = PlanSerializer(plans, many=True)
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                return catalog_list_response(request, 'plans', PlanSerializer.get_queryset(), PlanSerializer)
         except Plans.DoesNotExist:
             return Response({"error": "Plan not found"}, status=status.HTTP_404_NOT_FOUND)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
     def put(self, request, pk):
         try:
-            plan = Plans.objects.prefetch_related(
-                'plan_limit_policies__limit_policy'
-            ).get(pk=pk)
+            plan = PlanSerializer.get_queryset().get(pk=pk)
             serializer = PlanSerializer(plan, data=request.data, partial=True)
             if serializer.is_valid():
                 updated_plan = serializer.save()
-                updated_plan = Plans.objects.prefetch_related(
-                    'plan_limit_policies__limit_policy'
-                ).get(pk=updated_plan.pk)
+                updated_plan = PlanSerializer.get_queryset().get(pk=updated_plan.pk)
                 return Response(PlanSerializer(updated_plan).data, status=status.HTTP_200_OK)
             
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -188,6 +221,50 @@ class PlanView(APIView):
         plan.delete()
         return Response({"message": "Plan deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
 
+class PlanImportView(APIView):
+    """
+    Import plans and their limits in bulk from the request body.
+
+    The body is a JSON lines (``application/x-ndjson``) or CSV (``text/csv``)
+    file, read as a stream; see api.utils.catalog_import for the record format.
+    The whole file is validated first and nothing is written if any record is
+    invalid. A write that fails answers 400 like the other views; the chunks
+    written before it stay committed.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    CONTENT_TYPES = {
+        'application/x-ndjson': 'jsonl',
+        'application/jsonl': 'jsonl',
+        'text/csv': 'csv',
+    }
+
+    def post(self, request):
+        file_format = self.CONTENT_TYPES.get(request.content_type.split(';')[0].strip())
+        if file_format is None:
+            return Response(
+                {"error": f"Content-Type must be one of {', '.join(self.CONTENT_TYPES)}."},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+
+        if request.stream is None:
+            return Response({"error": "The import file is empty."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            rows = validate_records(read_records(decode_stream(request.stream), file_format))
+        except CatalogImportError as e:
+            return Response({"error": str(e), "errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError:
+            return Response({"error": "The import file must be UTF-8 encoded."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            stats = CatalogImporter(created_by=request.user).run(rows)
+        except CatalogImportError as e:
+            return Response({"error": str(e), "errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(stats, status=status.HTTP_200_OK)
+
 class LimitPoliciesView(APIView):
     permission_classes = [IsAuthenticated, IsAdmin]
 
@@ -201,6 +278,7 @@ class LimitPoliciesView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @method_decorator([cache_control(private=True, no_cache=True), condition(etag_func=catalog_etag)])
     def get(self, request, pk=None):
         try:
             if pk:
@@ -209,11 +287,11 @@ class LimitPoliciesView(APIView):
                 serializer = LimitPoliciesSerializer(limit_policy)
                 return Response(serializer.data, status=status.HTTP_200_OK)
             else:
-                limit_policies = LimitPolicies.objects.all()
-                serializer = LimitPoliciesSerializer(limit_policies, many=True)
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                return catalog_list_response(request, 'limit_policies', LimitPolicies.objects.all(), LimitPoliciesSerializer)
         except LimitPolicies.DoesNotExist:
             return Response({"error": "Limit policy not found"}, status=status.HTTP_404_NOT_FOUND)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -240,9 +318,28 @@ class LimitPoliciesView(APIView):
         return Response({"message": "Limit policy deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
  
 class PlanLimitPolicyView(APIView):
+    """
+    Link limit policies to plans, or unlink them.
+    
+    The body is one ``{"plan_id": ..., "policy_id": ...}`` pair, or an array of
+    up to ``max_batch_size`` pairs applied in one transaction, answered with
+    the outcome of each pair.
+    """
     permission_classes = [IsAuthenticated, IsAdmin]
+    max_batch_size = 1000
+
+    def _batch(self, request):
+        return PlanLimitPolicyPairSerializer(
+            data=request.data, many=True, allow_empty=False, max_length=self.max_batch_size
+        )
 
     def delete(self, request):
+        if isinstance(request.data, list):
+            serializer = self._batch(request)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return Response(serializer.detach(), status=status.HTTP_200_OK)
+
         try:
             plan_id = request.data.get('plan_id')
             policy_id = request.data.get('policy_id')
@@ -255,6 +352,12 @@ class PlanLimitPolicyView(APIView):
     
 
     def post(self, request):
+        if isinstance(request.data, list):
+            serializer = self._batch(request)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return Response(serializer.attach(), status=status.HTTP_200_OK)
+
         try:
             serializer = PlanLimitPolicySerializer(data=request.data)
             if serializer.is_valid():
@@ -279,46 +382,101 @@ class SubscriptionView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @method_decorator([cache_control(private=True, no_cache=True), condition(etag_func=subscription_etag)])
     def get(self, request, pk=None):
         try:
             if pk:
-                subscription = Subscriptions.objects.get(pk=pk)
+                subscription = SubscriptionSerializer.get_queryset(request).get(pk=pk)
                 
-                serializer = SubscriptionSerializer(subscription)
+                serializer = SubscriptionSerializer(subscription, context={'request': request})
                 return Response(serializer.data, status=status.HTTP_200_OK)
             else:
-                subscriptions = Subscriptions.objects.all()
-                serializer = SubscriptionSerializer(subscriptions, many=True)
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                paginator = KeysetPaginator(request)
+                page = paginator.serialize_page(
+                    SubscriptionSerializer.get_queryset(request),
+                    SubscriptionSerializer,
+                    context={'request': request},
+                )
+                return paginator.get_response(page)
         except Subscriptions.DoesNotExist:
             return Response({"error": "Subscription not found"}, status=status.HTTP_404_NOT_FOUND)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
     def put(self, request, pk):
         try:
-            subscription = Subscriptions.objects.get(pk=pk)
-    
-            serializer = SubscriptionSerializer(subscription, data=request.data, partial=True)
+            serializer = SubscriptionSerializer(data=request.data, partial=True, context={'request': request})
             if serializer.is_valid():
-                updated_subscription = serializer.save()
-                return Response(SubscriptionSerializer(updated_subscription).data, status=status.HTTP_200_OK)
+                subscription = SubscriptionSerializer.apply_update(pk, serializer.validated_data, request)
+                return Response(SubscriptionSerializer(subscription, context={'request': request}).data, status=status.HTTP_200_OK)
             
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Subscriptions.DoesNotExist:
             return Response({"error": "Subscription not found"}, status=status.HTTP_404_NOT_FOUND)
+        except SubscriptionVersionConflict as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
 
     def delete(self, request, pk):
         try:
-            subscription = Subscriptions.objects.get(pk=pk)
-            new_subscription_status = SubscriptionsStatus.CANCELLED
-            subscription.status = new_subscription_status
-            subscription.save()
+            # The version may come in the body or, for clients that cannot
+            # send a DELETE body, as ?version=
+            version = request.data.get('version', request.query_params.get('version'))
+            if version is not None:
+                version = serializers.IntegerField(min_value=1).run_validation(version)
+
+            SubscriptionSerializer.compare_and_swap(pk, version, status=SubscriptionsStatus.CANCELLED)
             return Response({"message": "Subscription deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
         except Subscriptions.DoesNotExist:
             return Response({"error": "Subscription not found"}, status=status.HTTP_404_NOT_FOUND)
+        except SubscriptionVersionConflict as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except serializers.ValidationError as e:
+            return Response({"version": e.detail}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:  
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class RLSHealthView(APIView):
+    """
+    Report whether row level security is enabled on every expected table.
+    
+    The status comes from the per-connection catalog check, so the endpoint
+    answers without querying the database unless no check has run yet. It is
+    restricted to platform admins.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        if RLSUtils.get_rls_status()['tables'] is None:
+            RLSUtils.check_rls_enabled()
+        
+        rls_status = RLSUtils.get_rls_status()
+        return Response(
+            {
+                "status": "ok" if rls_status['healthy'] else "degraded",
+                "rls": rls_status['tables'] or {},
+                "checked_at": rls_status['checked_at'],
+            },
+            status=status.HTTP_200_OK if rls_status['healthy'] else status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+
+class MetricsView(APIView):
+    """
+    Expose the in-process metrics in the Prometheus text exposition format.
+    
+    The metrics include per-view database timings and subscription counters,
+    so the endpoint is restricted to platform admins; scrapers send an admin
+    access token.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+# Database connections are thread-local and every ASGI request runs its ORM
+# calls on a fresh worker thread, so a persistent connection would never be
+# reused. Close them at the end of the request; pool with PgBouncer instead.
+os.environ.setdefault('DATABASE_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -14,6 +14,7 @@ from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
 import os
+from corsheaders.defaults import default_headers
 
 load_dotenv()
 
@@ -56,6 +57,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.DatabaseInstrumentationMiddleware',
     'api.middleware.PostgreSQLRLSMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -79,6 +81,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'server.wsgi.application'
+ASGI_APPLICATION = 'server.asgi.application'
 
 
 # Database
@@ -91,6 +94,12 @@ DATABASES = {
         'PASSWORD': os.getenv('DATABASE_PASSWORD'),
         'HOST': os.getenv('DATABASE_HOST'),
         'PORT': os.getenv('DATABASE_PORT'),
+        # Keep server connections open between requests (seconds, 0 closes
+        # them after every request). The RLS middleware resets the session
+        # variables of a reused connection before its first query.
+        'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', 60)),
+        # Check that a persistent connection is still usable before reusing it.
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -138,6 +147,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+# Let the client revalidate catalog and subscription reads with If-None-Match
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match')
+CORS_EXPOSE_HEADERS = ['ETag', 'Link']
 
 
 # REST Framework settings
@@ -163,6 +175,86 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'api.Users'
 
+# Row Level Security settings
+RLS = {
+    # Install the whole RLS context with a single set_config statement per
+    # request instead of separate reset/set round trips.
+    'SINGLE_STATEMENT': True,
+    # Defer the RLS context until the request issues its first query, so
+    # requests that never touch the database skip the round trip entirely.
+    'LAZY': False,
+    # 'session' keeps the RLS context on the connection until the next request;
+    # 'transaction' runs each request in a transaction and scopes the context
+    # to it (set_config(..., true)), as required behind PgBouncer in
+    # transaction pooling mode.
+    'SCOPE': 'session',
+    # Resolve the user's tenant ids once per request and publish them in
+    # app.current_tenant_ids, so the policies compare against an array instead
+    # of calling get_user_tenant_ids() for every row.
+    'PUBLISH_TENANT_IDS': True,
+}
+
+# In-process cache of the serialized plan catalog (api.utils.catalog_cache)
+CATALOG_CACHE = {
+    # Serve /api/plans/ and /api/limit-policies/ from memory while the
+    # catalog version is unchanged.
+    'ENABLED': True,
+    # Seconds an entry is served without checking the catalog version;
+    # 0 checks it on every read.
+    'REVALIDATE_AFTER': 0,
+    # Cache the first pages as encoded JSON bytes and serve them without
+    # rendering (JSON clients only; the browsable API still renders).
+    'PRERENDER': False,
+    # With PRERENDER, also keep a gzip encoding for clients that accept it.
+    'PRECOMPRESS': True,
+}
+
+# Keyset pagination of the list endpoints (api.utils.pagination)
+PAGINATION = {
+    # Rows per page when the request has no ?page_size=. None returns the
+    # whole list unless the request sends ?page_size= or ?cursor=.
+    'PAGE_SIZE': None,
+    # Larger ?page_size= values are capped to this.
+    'MAX_PAGE_SIZE': 1000,
+}
+
+# Bulk catalog import (api.utils.catalog_import)
+CATALOG_IMPORT = {
+    # Records written per transaction.
+    'CHUNK_SIZE': 1000,
+    # Stop validating an import file after this many invalid records.
+    'MAX_ERRORS': 100,
+}
+
+# Expiry of subscriptions past their ended_at (api.utils.subscription_expiry)
+SUBSCRIPTION_EXPIRY = {
+    # Subscriptions expired per statement; each chunk commits on its own.
+    'CHUNK_SIZE': 1000,
+    # Seconds between two sweeps of the in-process scheduler.
+    'INTERVAL': 60,
+    # Sweep from a thread of every server process, started on its first
+    # request. Leave off when the expire_subscriptions command runs from cron.
+    'SCHEDULER': False,
+}
+
+# Renewal of auto-renewing subscriptions (api.utils.subscription_renewal)
+SUBSCRIPTION_RENEWAL = {
+    # Subscriptions renewed per statement; each chunk commits on its own.
+    'CHUNK_SIZE': 1000,
+    # Processes renew_subscriptions runs in parallel; 1 renews in-process.
+    'WORKERS': 1,
+}
+
+# Per-request database instrumentation (api.middleware.DatabaseInstrumentationMiddleware)
+DB_INSTRUMENTATION = {
+    # Report the query count and database time in a Server-Timing response header.
+    'SERVER_TIMING': True,
+    # Write one JSON line per request to the api.instrumentation logger.
+    'LOG': True,
+    # Truncate the slowest statement in the log line to this many characters.
+    'SLOWEST_STATEMENT_LENGTH': 200,
+}
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -196,6 +288,11 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'api.instrumentation': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'django.db': {
             'handlers': ['console'],
             'level': 'INFO',